@@ -0,0 +1,260 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import json
+import threading
+import time
+
+
+class ActionExecutor:
+    """
+    ロボット動作(ツール)を専用のワーカースレッドで実行するスケジューラ。
+    go2_tools の各動作は time.sleep を含むため、イベントループ上で直接呼ぶと
+    音声の送受信が止まってしまう。ここで実行すればループはブロックされない。
+
+    - ロボットは同時に1つの動作しかできないのでワーカーは1本。待ち行列は優先度順 (同じなら到着順)
+    - 待ち行列は max_queue 件まで。溢れたら優先度の最も低い (同じなら新しい) ものを捨てる
+    - 待ち行列に同じ動作 (名前と引数が同じ) があれば、新しく積まずにその実行結果を共有する
+    - preempt() で待ち中の動作を取り消し、実行中の動作は cancel フックで中断する
+    呼び出しごとにキュー待ち時間と実行時間を記録する。
+    """
+
+    def __init__(self, tool_dict, priorities=None, max_queue=8, cancel=None, history=200):
+        self.tool_dict = tool_dict
+        self.priorities = priorities or {}
+        self.max_queue = max_queue
+        self.cancel = cancel
+        self._cond = threading.Condition()
+        self._queue = []                 # (-priority, seq, job) のヒープ
+        self._seq = itertools.count()
+        self._current = None
+        self._closed = False
+        self._worker = threading.Thread(target=self._work, name="robot-action", daemon=True)
+        self._worker.start()
+
+        # 統計
+        self.history = collections.deque(maxlen=history)
+        self.max_depth = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    def depth(self):
+        """待ち行列の長さ (実行中を除く)。"""
+        with self._cond:
+            return len(self._queue)
+
+    async def warm_up(self, init=None):
+        """
+        ワーカースレッドで init を実行する (ロボットの初期化など)。
+        どの動作よりも先に実行され、preempt() では取り消されない。
+        起動直後のツール呼び出しは warm_up の完了を待ってから実行される。
+        """
+        job = self._new_job("(warm-up)", None, float("inf"), init or (lambda: None))
+        job["preemptible"] = False
+        with self._cond:
+            self._push(job)
+        record = await job["future"]
+        if record["error"] is not None:
+            raise record["error"]
+
+    async def run(self, tool_name, args=None, priority=None):
+        """
+        ツールをワーカーで実行し、完了まで待つ。
+        戻り値は計測結果の辞書 (name, status, queue_time, run_time, error, ...)。
+        status は completed / failed / cancelled / dropped / coalesced
+        (coalesced は同じ動作の実行結果を共有した呼び出し)。
+        """
+        if priority is None:
+            priority = self.priorities.get(tool_name, 0)
+
+        def _call():
+            # 引数は変換済みの dict か、function call の arguments (JSON 文字列)
+            kwargs = json.loads(args) if isinstance(args, str) and args else (args or {})
+            return self.tool_dict[tool_name](**kwargs)
+
+        job = self._new_job(tool_name, args, priority, _call)
+        with self._cond:
+            same = self._find_queued(tool_name, args)
+            if same is not None:
+                same["record"]["coalesced"] += 1
+                self.coalesced += 1
+                future = same["future"]
+            else:
+                self._push(job)
+                future = job["future"]
+
+        record = await asyncio.shield(future)
+        if future is not job["future"]:
+            return dict(record, status="coalesced")
+        return record
+
+    def preempt(self):
+        """
+        新しい発話が始まったら呼ぶ。待ち中の動作を取り消し、実行中の動作を中断する。
+        取り消した (中断を要求した) 動作の数を返す。
+        """
+        with self._cond:
+            queued = [job for _, _, job in self._queue if job["preemptible"]]
+            self._queue = [entry for entry in self._queue if not entry[2]["preemptible"]]
+            heapq.heapify(self._queue)
+            current = self._current
+            if current is not None and current["preemptible"] and not current["cancel_requested"]:
+                current["cancel_requested"] = True
+            else:
+                current = None
+        for job in queued:
+            self._finish(job, "cancelled")
+        if current is not None and self.cancel is not None:
+            self.cancel()
+        return len(queued) + (current is not None)
+
+    def withdraw(self, tool_name, args=None):
+        """
+        待ち行列にある同じ動作 (名前と引数が同じ) を取り消す。ほかの呼び出しと結果を共有して
+        いるもの、実行中のものは取り消さない。取り消したかどうかを返す。
+        """
+        with self._cond:
+            job = self._find_queued(tool_name, args)
+            if job is None or job["record"]["coalesced"]:
+                return False
+            self._queue = [entry for entry in self._queue if entry[2] is not job]
+            heapq.heapify(self._queue)
+        self._finish(job, "cancelled")
+        return True
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            queued = [job for _, _, job in self._queue]
+            self._queue = []
+            self._cond.notify()
+        for job in queued:
+            self._finish(job, "cancelled")
+
+    def _new_job(self, tool_name, args, priority, func):
+        loop = asyncio.get_running_loop()
+        record = {
+            "name": tool_name,
+            "args": args,
+            "priority": priority,
+            "status": None,
+            "coalesced": 0,
+            "queued_at": time.perf_counter(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result": None,      # ツールの戻り値 (あれば function_call_output に使う)
+        }
+        return {
+            "record": record,
+            "func": func,
+            "loop": loop,
+            "future": loop.create_future(),
+            "preemptible": True,
+            "cancel_requested": False,
+        }
+
+    def _find_queued(self, tool_name, args):
+        for _, _, job in self._queue:
+            record = job["record"]
+            if record["name"] == tool_name and record["args"] == args and job["preemptible"]:
+                return job
+        return None
+
+    def _push(self, job):
+        # 呼び出し側で self._cond を保持していること
+        priority = job["record"]["priority"]
+        if len(self._queue) >= self.max_queue:
+            # 最も優先度が低く新しいものと比べ、新しい方が低ければ新しい方を捨てる
+            lowest = max(self._queue)
+            if (-priority, float("inf")) >= lowest[:2]:
+                self._finish(job, "dropped")
+                return
+            self._queue.remove(lowest)
+            heapq.heapify(self._queue)
+            self._finish(lowest[2], "dropped")
+        heapq.heappush(self._queue, (-priority, next(self._seq), job))
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._cond.notify()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                self._current = job
+
+            record = job["record"]
+            record["started_at"] = time.perf_counter()
+            try:
+                record["result"] = job["func"]()
+            except Exception as e:
+                record["error"] = e
+            finally:
+                record["finished_at"] = time.perf_counter()
+                with self._cond:
+                    self._current = None
+
+            if job["cancel_requested"]:
+                self._finish(job, "cancelled")
+            else:
+                self._finish(job, "failed" if record["error"] is not None else "completed")
+
+    def _finish(self, job, status):
+        record = job["record"]
+        record["status"] = status
+        if status == "dropped":
+            self.dropped += 1
+        elif status == "cancelled":
+            self.cancelled += 1
+        end = record["finished_at"] or time.perf_counter()
+        record["queue_time"] = (record["started_at"] or end) - record["queued_at"]
+        record["run_time"] = end - (record["started_at"] or end)
+        # wait_times() はイベントループから読むのでロックを取って追加する
+        # (_cond は RLock なので _push の中から呼ばれても取れる)
+        with self._cond:
+            self.history.append(record)
+
+        def _resolve():
+            if not job["future"].done():
+                job["future"].set_result(record)
+        try:
+            job["loop"].call_soon_threadsafe(_resolve)
+        except RuntimeError:
+            # ループが閉じている (終了処理中)
+            pass
+
+    def wait_times(self):
+        """直近の動作のキュー待ち時間 (秒) の p50 と最大。"""
+        with self._cond:
+            history = list(self.history)
+        waits = sorted(r["queue_time"] for r in history if r["started_at"] is not None)
+        if not waits:
+            return None
+        return {"p50": waits[len(waits) // 2], "max": waits[-1]}
+
+
+def log_action_record(record, executor=None):
+    status = record["status"]
+    if status == "failed":
+        status = f"ERROR: {record['error']}"
+    line = (
+        f"\n[ACTION] {record['name']}: キュー待ち {record['queue_time']:.3f} 秒 / "
+        f"実行 {record['run_time']:.3f} 秒 ({status})"
+    )
+    if executor is not None:
+        line += f" 待ち行列 {executor.depth()} 件"
+        waits = executor.wait_times()
+        if waits is not None:
+            line += f" (待ち p50 {waits['p50']:.3f} / 最大 {waits['max']:.3f} 秒)"
+        if executor.coalesced or executor.dropped or executor.cancelled:
+            line += (
+                f", まとめ {executor.coalesced} / 破棄 {executor.dropped} / "
+                f"中断 {executor.cancelled}"
+            )
+    print(line)
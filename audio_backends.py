@@ -0,0 +1,248 @@
+"""
+音声の入力 (AudioSource) と出力 (AudioSink) のバックエンド。
+
+入力:
+  pyaudio        マイク (capture.MicCapture, コールバックモード)
+  wav:<path>     WAV ファイル (PCM16 モノラル)
+  raw:<path>     生の PCM16 ファイルを mmap してコピーなしで読む
+出力:
+  pyaudio        スピーカー
+  null           書き込み時刻だけを記録して捨てる
+
+ファイル入力は pacing="realtime" で実時間に合わせて、pacing="fast" でできるだけ速く返す。
+pyaudio は使うときだけ import するので、サウンドカードのない環境でも他のバックエンドは動く。
+"""
+import asyncio
+import mmap
+import time
+import wave
+
+_pa = None
+
+
+def _pyaudio():
+    """PyAudio インスタンスを (入力・出力で共有して) 返す。"""
+    global _pa
+    if _pa is None:
+        import pyaudio
+        _pa = pyaudio.PyAudio()
+    return _pa
+
+
+def terminate_pyaudio():
+    global _pa
+    if _pa is not None:
+        _pa.terminate()
+        _pa = None
+
+
+def list_pyaudio_devices():
+    p = _pyaudio()
+    print("Available audio devices:")
+    for i in range(p.get_device_count()):
+        info = p.get_device_info_by_index(i)
+        print(f"Index {i}: {info['name']} (Input Channels: {info['maxInputChannels']})")
+
+
+class AudioSource:
+    """
+    PCM16 モノラルの入力。
+    read() は次のチャンクを書き込み可能な memoryview で返し (エコー除去が上書きする)、
+    入力が尽きたら None を返す。last_captured_at はそのチャンク先頭の取得時刻 (perf_counter)。
+    """
+
+    rate = 24000
+    input_latency = 0.0
+    last_captured_at = None
+    overruns = 0
+    ring_overruns = 0
+
+    def start(self, loop=None):
+        """入力を開始する。別スレッドから呼ぶときは読み出し側のイベントループを渡す。"""
+        pass
+
+    async def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class AudioSink:
+    """PCM16 モノラルの出力。write() はブロックしてよい (再生スレッドから呼ばれる)。"""
+
+    output_latency = 0.0
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class _FileSource(AudioSource):
+    """ファイル入力の共通部分 (ペーシングと末尾の無音)。"""
+
+    def __init__(self, rate=24000, chunk=480, pacing="realtime", tail_silence_ms=2000):
+        if pacing not in ("realtime", "fast"):
+            raise ValueError(f"unknown pacing: {pacing}")
+        self.rate = rate
+        self.chunk = chunk
+        self.chunk_bytes = chunk * 2
+        self.pacing = pacing
+        # 発話の途中でファイルが終わってもコミットされるよう、末尾に無音を足す
+        self._tail_chunks = int(tail_silence_ms / 1000 * rate / chunk)
+        self._silence = bytearray(self.chunk_bytes)
+        self._zeros = bytes(self.chunk_bytes)
+        self._started_at = None
+        self._index = 0
+
+    def start(self, loop=None):
+        self._started_at = time.perf_counter()
+
+    async def read(self):
+        if self._started_at is None:
+            self.start()
+        data = self._next_chunk()
+        if data is None:
+            if self._tail_chunks <= 0:
+                return None
+            self._tail_chunks -= 1
+            self._silence[:] = self._zeros
+            data = memoryview(self._silence)
+
+        captured_at = self._started_at + self._index * self.chunk / self.rate
+        self._index += 1
+        if self.pacing == "realtime":
+            # 開始時刻からの理想時刻に合わせる (sleep の誤差を積み上げない)
+            delay = captured_at + self.chunk / self.rate - time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+            self.last_captured_at = captured_at
+        else:
+            await asyncio.sleep(0)
+            self.last_captured_at = time.perf_counter()
+        return data
+
+    def _next_chunk(self):
+        raise NotImplementedError
+
+
+class WavFileSource(_FileSource):
+    """WAV ファイル (PCM16 モノラル, rate 一致) を読む。"""
+
+    def __init__(self, path, rate=24000, chunk=480, pacing="realtime", tail_silence_ms=2000, slots=4):
+        super().__init__(rate, chunk, pacing, tail_silence_ms)
+        self._wav = wave.open(path, "rb")
+        if (self._wav.getnchannels() != 1 or self._wav.getsampwidth() != 2
+                or self._wav.getframerate() != rate):
+            self._wav.close()
+            raise ValueError(f"{path}: PCM16 モノラル {rate} Hz の WAV が必要です")
+        # 返したチャンクはしばらく使われるので数スロットを使い回す
+        self._slots = [bytearray(self.chunk_bytes) for _ in range(slots)]
+
+    def _next_chunk(self):
+        frames = self._wav.readframes(self.chunk)
+        if not frames:
+            return None
+        slot = self._slots[self._index % len(self._slots)]
+        slot[:len(frames)] = frames
+        return memoryview(slot)[:len(frames)]
+
+    def close(self):
+        self._wav.close()
+
+
+class RawPcmSource(_FileSource):
+    """
+    ヘッダなしの PCM16 モノラルファイルを mmap で読む。
+    ACCESS_COPY で開くので、返す memoryview は書き込み可能だがファイルは変更されない。
+    """
+
+    def __init__(self, path, rate=24000, chunk=480, pacing="realtime", tail_silence_ms=2000):
+        super().__init__(rate, chunk, pacing, tail_silence_ms)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._view = memoryview(self._map)
+        self._pos = 0
+
+    def _next_chunk(self):
+        if self._pos >= len(self._view):
+            return None
+        end = min(self._pos + self.chunk_bytes, len(self._view))
+        end -= (end - self._pos) % 2
+        data = self._view[self._pos:end]
+        self._pos = end
+        return data
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+class NullSink(AudioSink):
+    """
+    書き込み時刻とバイト数だけを記録する出力。
+    realtime=True のときはデバイスと同じ速さでブロックする。
+    """
+
+    def __init__(self, rate=24000, realtime=False):
+        self.rate = rate
+        self.realtime = realtime
+        self.writes = []
+        self._writing = False
+        self._last_done = time.perf_counter()
+
+    def write(self, data):
+        self._writing = True
+        self.writes.append((time.perf_counter_ns(), len(data)))
+        if self.realtime:
+            time.sleep(len(data) / 2 / self.rate)
+        self._last_done = time.perf_counter()
+        self._writing = False
+
+    def idle_for(self, seconds):
+        """書き込み中でなく、最後の書き込みから seconds 以上経っているか。"""
+        return not self._writing and time.perf_counter() - self._last_done >= seconds
+
+
+class PyAudioSink(AudioSink):
+    def __init__(self, rate=24000, frames_per_buffer=1024):
+        import pyaudio
+        self.stream = _pyaudio().open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=rate,
+            output=True,
+            frames_per_buffer=frames_per_buffer
+        )
+        self.output_latency = self.stream.get_output_latency()
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+
+
+def open_source(spec, rate=24000, chunk=480, pacing="realtime"):
+    """'pyaudio' / 'wav:<path>' / 'raw:<path>' から入力を作る。"""
+    kind, _, path = spec.partition(":")
+    if kind == "pyaudio":
+        from capture import MicCapture
+        return MicCapture(_pyaudio(), rate=rate, chunk=chunk, slots=128)
+    if kind == "wav":
+        return WavFileSource(path, rate=rate, chunk=chunk, pacing=pacing)
+    if kind == "raw":
+        return RawPcmSource(path, rate=rate, chunk=chunk, pacing=pacing)
+    raise ValueError(f"unknown audio source: {spec}")
+
+
+def open_sink(spec, rate=24000, frames_per_buffer=1024, pacing="realtime"):
+    """'pyaudio' / 'null' から出力を作る。"""
+    if spec == "pyaudio":
+        return PyAudioSink(rate=rate, frames_per_buffer=frames_per_buffer)
+    if spec == "null":
+        return NullSink(rate=rate, realtime=(pacing == "realtime"))
+    raise ValueError(f"unknown audio sink: {spec}")
@@ -0,0 +1,111 @@
+"""
+受信イベント処理のCPUコストを比較するベンチマーク。
+
+  - before: json.loads + if/elif の type 比較 (従来の receive_audio と同じ処理)
+  - after : EventDispatcher (type ごとのハンドラ + audio.delta の高速経路)
+
+どちらも base64 デコードまで含めて、1イベントあたりの時間を表示する。
+
+    python bench_dispatch.py [--events 20000] [--delta-ms 100] [--json json|orjson]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+from dispatcher import EventDispatcher, JsonBackend, AUDIO_DELTA_TYPE
+
+
+def make_messages(n_events, delta_ms, rate=24000):
+    """実際の応答に近い比率 (大半が audio.delta) のメッセージ列を作る。"""
+    pcm = os.urandom(int(rate * 2 * delta_ms / 1000))
+    audio = json.dumps({
+        "type": AUDIO_DELTA_TYPE,
+        "event_id": "event_bench",
+        "response_id": "resp_bench",
+        "item_id": "item_bench",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": base64.b64encode(pcm).decode("ascii"),
+    }, separators=(",", ":"))
+    transcript = json.dumps({
+        "type": "response.audio_transcript.delta",
+        "response_id": "resp_bench",
+        "item_id": "item_bench",
+        "delta": "まいど",
+    }, separators=(",", ":"))
+    messages = []
+    for i in range(n_events):
+        messages.append(transcript if i % 10 == 0 else audio)
+    return messages
+
+
+def run_before(messages):
+    sink = []
+    start = time.perf_counter_ns()
+    for raw in messages:
+        response_data = json.loads(raw)
+        if response_data.get("type") == "response.function_call_arguments.done":
+            pass
+        elif response_data.get("type") == "response.created":
+            pass
+        elif response_data.get("type") == "response.audio_transcript.delta":
+            sink.append(response_data["delta"])
+        elif response_data.get("type") == "response.done":
+            pass
+        elif response_data.get("type") == "error":
+            pass
+        if response_data.get("type") == "response.audio.delta":
+            sink.append(base64.b64decode(response_data["delta"]))
+    return time.perf_counter_ns() - start
+
+
+def run_after(messages, json_backend):
+    dispatcher = EventDispatcher(json_backend=json_backend)
+    sink = []
+
+    @dispatcher.on("response.audio_transcript.delta")
+    def on_transcript(event):
+        sink.append(event["delta"])
+
+    @dispatcher.on(AUDIO_DELTA_TYPE)
+    def on_audio(event):
+        sink.append(base64.b64decode(event["delta"]))
+
+    async def _run():
+        start = time.perf_counter_ns()
+        for raw in messages:
+            await dispatcher.dispatch(raw)
+        return time.perf_counter_ns() - start
+
+    elapsed = asyncio.run(_run())
+    return elapsed, dispatcher.fast_path_hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--delta-ms", type=int, default=100, help="1つの audio.delta に含まれる音声の長さ")
+    parser.add_argument("--json", default=None, help="json または orjson (省略時は自動選択)")
+    args = parser.parse_args()
+
+    messages = make_messages(args.events, args.delta_ms)
+    backend = JsonBackend(args.json)
+
+    # ウォームアップ
+    run_before(messages[:500])
+    run_after(messages[:500], backend)
+
+    before_ns = run_before(messages)
+    after_ns, hits = run_after(messages, backend)
+
+    print(f"events: {args.events} (audio.delta {args.delta_ms} ms, json backend: {backend.name})")
+    print(f"  before: {before_ns / args.events / 1000:.2f} us/event")
+    print(f"  after : {after_ns / args.events / 1000:.2f} us/event (fast path {hits} 回)")
+    print(f"  speedup: {before_ns / after_ns:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+ローカルの検証用サーバ (fake_realtime_server.py) に対してクライアントを動かし、
+クライアント側のレイテンシとスループットを計測するベンチマーク。
+サウンドカードもネットワークも使わないので CI でも動く。
+
+  - commit→送信: クライアントが commit を決めてからサーバが受け取るまで
+  - delta→再生: サーバが最初の audio.delta を送ってから再生スレッドが書き込むまで
+  - コミット→再生開始: ターン全体 (サーバの合成応答を含む)
+  - メッセージ/秒: 送受信それぞれ
+
+    python bench_realtime.py [--turns 20] [--realtime] [--script script.json] [--drop-every N]
+
+--drop-every N を付けると N ターンごとにサーバ側から接続を切り、再接続にかかる時間も計測する。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import random
+import struct
+import time
+
+import realtime8
+from audio_backends import AudioSource, NullSink
+from connection import ConnectionSupervisor
+from fake_realtime_server import FakeRealtimeServer
+
+
+class GeneratedCapture(AudioSource):
+    """
+    合成音声を返す入力。
+    1ターン = 発話 speech_ms + 無音 silence_ms。発話後は応答が終わるまで read() が待つ。
+    realtime=True のときは実時間でチャンクを出す。
+    """
+
+    def __init__(self, turns, next_turn, speech_ms=1200, silence_ms=2000,
+                 rate=24000, chunk=480, realtime=False):
+        self.turns = turns
+        self.next_turn = next_turn        # 次の発話を始めてよいときにセットされる Event
+        self.rate = rate
+        self.chunk = chunk
+        self.realtime = realtime
+        rng = random.Random(0)
+        self._speech = [self._voice(i, rng) for i in range(int(speech_ms / 1000 * rate / chunk))]
+        self._silence = [self._noise(rng) for _ in range(int(silence_ms / 1000 * rate / chunk))]
+        self._frames = self._generate()
+
+    def _voice(self, index, rng):
+        t0 = index * self.chunk
+        return bytearray(struct.pack(f"<{self.chunk}h", *(
+            int(4000 * math.sin(2 * math.pi * 180 * (t0 + i) / self.rate)
+                + 1500 * math.sin(2 * math.pi * 720 * (t0 + i) / self.rate)
+                + rng.gauss(0, 50))
+            for i in range(self.chunk)
+        )))
+
+    def _noise(self, rng):
+        return bytearray(struct.pack(f"<{self.chunk}h", *(int(rng.gauss(0, 50)) for _ in range(self.chunk))))
+
+    async def _generate_async(self):
+        for _ in range(self.turns):
+            self.next_turn.clear()
+            for frame in self._speech + self._silence:
+                yield frame
+            await self.next_turn.wait()
+
+    def _generate(self):
+        return self._generate_async().__aiter__()
+
+    async def read(self):
+        try:
+            frame = await self._frames.__anext__()
+        except StopAsyncIteration:
+            await asyncio.Future()  # 全ターン終了後は止まる
+        if self.realtime:
+            await asyncio.sleep(self.chunk / self.rate)
+        else:
+            await asyncio.sleep(0)
+        self.last_captured_at = time.perf_counter()
+        # 呼び出し側 (AEC) が上書きするのでコピーを渡す
+        return memoryview(bytearray(frame))
+
+
+def summarize(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q / 100))]
+    return f"p50 {pick(50) * 1000:.1f} ms / p95 {pick(95) * 1000:.1f} ms / max {values[-1] * 1000:.1f} ms"
+
+
+async def run_bench(args):
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+    else:
+        # 既定では関数呼び出しなし (ツールの待ち時間を計測に含めない)
+        script = {"turns": [{"transcript": "まいど！", "audio_ms": 1000}]}
+    server = await FakeRealtimeServer(script, port=0).start()
+
+    next_turn = asyncio.Event()
+    capture = GeneratedCapture(args.turns, next_turn, rate=realtime8.RATE,
+                               chunk=realtime8.CHUNK, realtime=args.realtime)
+    output = NullSink(rate=realtime8.RATE, realtime=args.realtime)
+    recorder = realtime8.turn_traces
+
+    log = io.StringIO()
+    started = time.perf_counter()
+    # クライアントのログは --verbose のときだけ表示する
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+    with quiet:
+        link = ConnectionSupervisor(server.url, on_connect=realtime8.initialize_session,
+                                    backoff_initial=0.05)
+        supervisor_task = asyncio.create_task(link.run())
+        await link.wait_connected()
+        session = asyncio.create_task(realtime8.run_session(link, capture, output))
+        done = 0
+        deadline = time.monotonic() + args.timeout
+        while done < args.turns and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            if len(recorder.completed) > done and output.idle_for(0.2):
+                # 応答の再生が終わってから次の発話を始める (バージインにしない)
+                done = len(recorder.completed)
+                if args.drop_every and done % args.drop_every == 0 and done < args.turns:
+                    await server.drop_connections()
+                    await link.wait_connected()
+                next_turn.set()
+        session.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await session
+        await link.stop()
+        supervisor_task.cancel()
+    elapsed = time.perf_counter() - started
+    await server.stop()
+    realtime8.action_executor.shutdown()
+
+    traces = list(recorder.completed)
+    # フォローアップの応答 (関数呼び出しの後) はコミットを伴わないので、コミットのあるターンだけを並べる
+    committed = [trace for trace in traces if "commit" in trace.stamps]
+    commit_to_send = [
+        (received_ns - trace.stamps["commit"]) / 1e9
+        for trace, received_ns in zip(committed, server.commit_times)
+    ]
+    delta_to_playback = []
+    for trace in traces:
+        sent_ns = server.first_delta_times.get(trace.response_id)
+        if sent_ns is not None and "first_audible" in trace.stamps:
+            delta_to_playback.append((trace.stamps["first_audible"] - sent_ns) / 1e9)
+    turn = [t.intervals()["commit_to_audible"] for t in traces if "commit_to_audible" in t.intervals()]
+
+    client_messages = sum(server.received.values())
+    print(f"turns: {len(traces)}/{args.turns} ({'realtime' if args.realtime else 'as fast as possible'}), {elapsed:.2f} 秒")
+    print(f"  commit→送信        : {summarize(commit_to_send)}")
+    print(f"  delta→再生         : {summarize(delta_to_playback)}")
+    print(f"  コミット→再生開始  : {summarize(turn)}")
+    print(f"  送信 {client_messages} msg ({client_messages / elapsed:.1f} msg/s), "
+          f"音声 {server.appended_bytes / 1024:.0f} KB")
+    print(f"  受信 {server.sent} msg ({server.sent / elapsed:.1f} msg/s), "
+          f"再生書き込み {len(output.writes)} 回")
+    if link.outages:
+        print(f"  再接続            : {link.outages} 回, {summarize(list(link.reconnect_times))}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--realtime", action="store_true", help="入力と再生を実時間で動かす")
+    parser.add_argument("--script", default=None, help="サーバの応答スクリプト (JSON)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--drop-every", type=int, default=0, help="N ターンごとに接続を切る")
+    parser.add_argument("--verbose", action="store_true", help="クライアントのログを表示する")
+    args = parser.parse_args()
+    asyncio.run(run_bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pyaudio
+
+from audio_backends import AudioSource
+
+
+class MicCapture(AudioSource):
+    """
+    PyAudio のコールバックモードでマイク音声を取得する (audio_backends の pyaudio 入力)。
+
+    コールバックは受け取ったフレームを事前確保したリングバッファのスロットへ
+    コピーし、そのスロットの memoryview を asyncio.Queue 経由でループへ渡す。
+    stream.read のためにエグゼキュータへ毎回ホップする必要がなく、
+    チャンクごとの新しい bytes も作らない。
+
+    read() が返す memoryview は、リングが一周するまで (slots - 1 チャンク分) 有効。
+    使い終わる前に次の read() を slots 回以上呼ばないこと。
+    直近に read() したチャンクの先頭サンプルの取得時刻 (perf_counter) は last_captured_at に入る。
+    """
+
+    def __init__(self, pa, rate=24000, chunk=2048, channels=1,
+                 format=pyaudio.paInt16, slots=64, input_device_index=None):
+        self.pa = pa
+        self.rate = rate
+        self.chunk = chunk
+        self.channels = channels
+        self.format = format
+        self.input_device_index = input_device_index
+        self.chunk_bytes = chunk * channels * pa.get_sample_size(format)
+        self.slots = slots
+
+        self._ring = bytearray(self.chunk_bytes * slots)
+        self._view = memoryview(self._ring)
+        self._written = 0   # コールバックが書いたチャンク数
+        self._consumed = 0  # read() で取り出したチャンク数
+        self._queue = None
+        self._loop = None
+        self.stream = None
+        self.last_captured_at = None
+
+        # 統計
+        self.overruns = 0        # デバイス側のオーバーフロー (paInputOverflow)
+        self.ring_overruns = 0   # 消費が追いつかずリングが満杯で捨てたチャンク
+
+    def start(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self.stream = self.pa.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            input_device_index=self.input_device_index,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback,
+        )
+        self.stream.start_stream()
+        self.input_latency = self.stream.get_input_latency()
+
+    def close(self):
+        if self.stream is None:
+            return
+        if self.stream.is_active():
+            self.stream.stop_stream()
+        self.stream.close()
+        self.stream = None
+
+    async def read(self):
+        """次のチャンクを memoryview で返す。"""
+        data, captured_at = await self._queue.get()
+        self._consumed += 1
+        self.last_captured_at = captured_at
+        return data
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        captured_at = time.perf_counter() - frame_count / self.rate
+        if status & pyaudio.paInputOverflow:
+            self.overruns += 1
+
+        if self._written - self._consumed >= self.slots - 1:
+            # まだ読まれていないスロットを上書きしてしまうので捨てる
+            self.ring_overruns += 1
+            return (None, pyaudio.paContinue)
+
+        offset = (self._written % self.slots) * self.chunk_bytes
+        size = len(in_data)
+        self._view[offset:offset + size] = in_data
+        self._written += 1
+        self._loop.call_soon_threadsafe(
+            self._queue.put_nowait, (self._view[offset:offset + size], captured_at)
+        )
+        return (None, pyaudio.paContinue)
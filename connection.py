@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import random
+import time
+
+import websockets
+
+
+class ConnectionSupervisor:
+    """
+    websocket 接続を張り続ける。切断されたらジッター付きバックオフで再接続し、
+    on_connect(websocket) でセッションを初期化し直す (session.update の再送など)。
+
+    send() / recv() は接続の張り替えをまたいで使える。
+      - send() は切断中なら送らずに False を返す (例外は投げない)
+      - recv() は再接続されるまで待ってから受信を続ける
+    URL の誤りや 4xx の応答 (API キーの誤りなど) は再接続しても直らないので諦める。
+    run() が例外で終わったら、wait_connected() / recv() で待っている側にその例外を送出する。
+    """
+
+    def __init__(self, url, headers=None, on_connect=None, on_disconnect=None,
+                 backoff_initial=0.5, backoff_max=15.0, connect=websockets.connect):
+        self.url = url
+        self.headers = headers
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._connect = connect
+        self._websocket = None
+        self._connected = asyncio.Event()
+        self._failed = asyncio.Event()
+        self.error = None                  # run() を終わらせた例外
+        self._stopping = False
+        self._outage_started = None
+
+        # 統計
+        self.connects = 0
+        self.outages = 0
+        self.connect_failures = 0
+        self.dropped_messages = 0                          # 切断中に送れなかったメッセージ
+        self.reconnect_times = collections.deque(maxlen=100)  # 切断検出→セッション再初期化 (秒)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def _backoff(self, attempt):
+        # フルジッター: [0, min(上限, 初期値 * 2^attempt)] から一様に選ぶ
+        return random.uniform(0, min(self.backoff_max, self.backoff_initial * 2 ** attempt))
+
+    @staticmethod
+    def _fatal(error):
+        """再接続しても直らない接続エラーか。"""
+        if isinstance(error, websockets.InvalidURI):
+            return True
+        if isinstance(error, websockets.InvalidStatus):
+            status = error.response.status_code
+            # 408 (タイムアウト) と 429 (レート制限) は待てば通る
+            return 400 <= status < 500 and status not in (408, 429)
+        return False
+
+    async def run(self):
+        """stop() されるまで接続・再接続を繰り返す。"""
+        try:
+            await self._run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] サーバに接続できません: {type(e).__name__}: {e}")
+            self.error = e
+            self._failed.set()
+            raise
+
+    async def _run(self):
+        attempt = 0
+        while not self._stopping:
+            try:
+                websocket = await self._connect(self.url, additional_headers=self.headers)
+            except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+                if self._fatal(e):
+                    raise
+                self.connect_failures += 1
+                delay = self._backoff(attempt)
+                attempt += 1
+                print(f"[WARN] 接続に失敗しました ({e})。{delay:.1f} 秒後に再接続します。")
+                await asyncio.sleep(delay)
+                continue
+
+            try:
+                if self.on_connect is not None:
+                    await self.on_connect(websocket)
+            except websockets.ConnectionClosed:
+                # 初期化中に切れた。張り直す
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            attempt = 0
+            self.connects += 1
+            if self._outage_started is not None:
+                elapsed = time.perf_counter() - self._outage_started
+                self.reconnect_times.append(elapsed)
+                self._outage_started = None
+                print(f"[INFO] 再接続しました ({elapsed:.2f} 秒, 切断 {self.outages} 回目)。")
+            self._websocket = websocket
+            self._connected.set()
+
+            await websocket.wait_closed()
+            self._lost(websocket)
+            if not self._stopping:
+                await asyncio.sleep(self._backoff(attempt))
+
+    def _lost(self, websocket):
+        # send/recv と run のどちらが先に切断に気付いても1回だけ数える
+        if self._websocket is not websocket:
+            return
+        self._websocket = None
+        self._connected.clear()
+        if self._stopping:
+            return
+        self.outages += 1
+        self._outage_started = time.perf_counter()
+        print("\n[WARN] サーバとの接続が切れました。再接続します...")
+        if self.on_disconnect is not None:
+            self.on_disconnect()
+
+    async def wait_connected(self):
+        """接続されるまで待つ。run() が例外で終わっていればその例外を送出する。"""
+        while not self._connected.is_set() and self.error is None:
+            waiters = [asyncio.ensure_future(self._connected.wait()),
+                       asyncio.ensure_future(self._failed.wait())]
+            try:
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+        if self.error is not None:
+            raise ConnectionError(f"connection supervisor stopped: {self.error}") from self.error
+        return self._websocket
+
+    async def send(self, message):
+        websocket = self._websocket
+        if websocket is None:
+            self.dropped_messages += 1
+            return False
+        try:
+            await websocket.send(message)
+            return True
+        except websockets.ConnectionClosed:
+            self._lost(websocket)
+            self.dropped_messages += 1
+            return False
+
+    async def recv(self):
+        while True:
+            websocket = await self.wait_connected()
+            try:
+                return await websocket.recv()
+            except websockets.ConnectionClosed:
+                self._lost(websocket)
+
+    async def stop(self):
+        self._stopping = True
+        websocket = self._websocket
+        self._websocket = None
+        self._connected.clear()
+        if websocket is not None:
+            await websocket.close()
+
+
+def log_connection_stats(supervisor):
+    line = f"[CONN] 接続 {supervisor.connects} 回 / 切断 {supervisor.outages} 回"
+    if supervisor.connect_failures:
+        line += f" / 接続失敗 {supervisor.connect_failures} 回"
+    if supervisor.reconnect_times:
+        times = sorted(supervisor.reconnect_times)
+        line += f", 再接続 平均 {sum(times) / len(times):.2f} 秒 / 最大 {times[-1]:.2f} 秒"
+    if supervisor.dropped_messages:
+        line += f", 未送信 {supervisor.dropped_messages} 件"
+    print(line)
@@ -0,0 +1,103 @@
+import inspect
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonBackend:
+    """json.loads / json.dumps の差し替え口。orjson があればそちらを使う。"""
+
+    def __init__(self, name=None):
+        if name is None:
+            name = "orjson" if orjson is not None else "json"
+        if name == "orjson":
+            if orjson is None:
+                raise ImportError("orjson がインストールされていません。")
+            self.loads = orjson.loads
+            # websocket にはテキストフレームで送るので str にする
+            self.dumps = lambda obj: orjson.dumps(obj).decode("utf-8")
+        elif name == "json":
+            self.loads = json.loads
+            self.dumps = lambda obj: json.dumps(obj, ensure_ascii=False)
+        else:
+            raise ValueError(f"unknown json backend: {name}")
+        self.name = name
+
+
+AUDIO_DELTA_TYPE = "response.audio.delta"
+_AUDIO_DELTA_PREFIX = '{"type":"' + AUDIO_DELTA_TYPE + '"'
+_DELTA_KEY = ',"delta":"'
+
+
+class EventDispatcher:
+    """
+    サーバイベントを type ごとに登録したハンドラへ振り分ける。
+
+    response.audio.delta は最も多く、しかも大きい (base64の音声) ので、
+    "delta" が末尾にある典型的な形であれば本体を JSON パースせずに取り出す。
+    ヘッダ部分 (type, response_id, item_id など) だけを小さな JSON としてパースし、
+    delta は元の文字列からスライスしてイベント辞書に入れる。
+    形が想定と違うときは通常のパースにフォールバックする。
+    """
+
+    def __init__(self, json_backend=None, fast_audio=True):
+        self.json = json_backend or JsonBackend()
+        self.fast_audio = fast_audio
+        self._handlers = {}
+        self._default = None
+
+        # 統計
+        self.counts = {}
+        self.fast_path_hits = 0
+
+    def on(self, event_type):
+        """ハンドラ登録用デコレータ。ハンドラは同期関数でもコルーチン関数でもよい。"""
+        def decorator(func):
+            self._handlers[event_type] = (func, inspect.iscoroutinefunction(func))
+            return func
+        return decorator
+
+    def on_unhandled(self, func):
+        """未登録の type を受け取るハンドラ。"""
+        self._default = (func, inspect.iscoroutinefunction(func))
+        return func
+
+    def parse(self, raw):
+        if self.fast_audio and isinstance(raw, str) and raw.startswith(_AUDIO_DELTA_PREFIX):
+            event = self._parse_audio_delta(raw)
+            if event is not None:
+                self.fast_path_hits += 1
+                return event
+        return self.json.loads(raw)
+
+    async def dispatch(self, raw):
+        event = self.parse(raw)
+        event_type = event.get("type")
+        self.counts[event_type] = self.counts.get(event_type, 0) + 1
+
+        entry = self._handlers.get(event_type, self._default)
+        if entry is None:
+            return event
+        func, is_coroutine = entry
+        if is_coroutine:
+            await func(event)
+        else:
+            func(event)
+        return event
+
+    def _parse_audio_delta(self, raw):
+        # {"type":"response.audio.delta", ... ,"delta":"<base64>"}
+        key_pos = raw.rfind(_DELTA_KEY)
+        if key_pos < 0 or not raw.endswith('"}'):
+            return None
+        start = key_pos + len(_DELTA_KEY)
+        delta = raw[start:-2]
+        # base64 に引用符やエスケープは含まれないはず。あればフォールバック
+        if '"' in delta or "\\" in delta:
+            return None
+        event = self.json.loads(raw[:key_pos] + "}")
+        event["delta"] = delta
+        return event
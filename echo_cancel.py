@@ -0,0 +1,162 @@
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class EchoReference:
+    """
+    スピーカーへ書き込んだ音声 (遠端信号) を時刻つきで保持するリングバッファ。
+    AudioPlayer が書き込みのたびに push() し、エコーキャンセラが
+    マイクのフレームと同じ時刻の区間を window() で取り出す。
+
+    時刻は perf_counter を rate でサンプル番号に換算したタイムラインで管理する。
+    書き込みが連続していれば隙間なく並べ、再生が止まっていた区間は0になる。
+    """
+
+    def __init__(self, rate=24000, seconds=4.0):
+        self.rate = rate
+        self._size = int(rate * seconds)
+        self._ring = np.zeros(self._size, dtype=np.float32)
+        self._origin = time.perf_counter()
+        self._next = None      # 次に書くサンプル番号
+        self._lock = threading.Lock()
+
+    def sample_index(self, t):
+        return int(round((t - self._origin) * self.rate))
+
+    def push(self, pcm, t=None):
+        """int16 PCM を時刻 t (perf_counter) から再生されたものとして記録する。"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if len(samples) == 0:
+            return
+        if t is None:
+            t = time.perf_counter()
+        start = self.sample_index(t)
+        with self._lock:
+            if self._next is not None and start < self._next:
+                # 前回の書き込みの続き (ブロッキング書き込みで連続再生している)
+                start = self._next
+            elif self._next is not None:
+                # 再生が途切れていた区間は無音
+                self._write(self._next, np.zeros(min(start - self._next, self._size), dtype=np.float32))
+            self._write(start, samples.astype(np.float32))
+            self._next = start + len(samples)
+
+    def window(self, start, length):
+        """サンプル番号 start から length 個を返す。未記録の区間は0。"""
+        out = np.zeros(length, dtype=np.float32)
+        with self._lock:
+            if self._next is None:
+                return out
+            end = min(start + length, self._next)
+            lo = max(start, self._next - self._size)
+            if end <= lo:
+                return out
+            idx = np.arange(lo, end) % self._size
+            out[lo - start:end - start] = self._ring[idx]
+        return out
+
+    def _write(self, start, samples):
+        if len(samples) == 0:
+            return
+        if len(samples) > self._size:
+            start += len(samples) - self._size
+            samples = samples[-self._size:]
+        pos = start % self._size
+        first = min(len(samples), self._size - pos)
+        self._ring[pos:pos + first] = samples[:first]
+        self._ring[:len(samples) - first] = samples[first:]
+
+
+class EchoCanceller:
+    """
+    ブロック NLMS による適応エコーキャンセラ。
+    マイクの各フレームについて、同じ時刻に再生していた参照信号 (delay_ms 分ずらす) から
+    エコーを推定して差し引く。フレームを block サンプルずつに分け、
+    各ブロックのフィルタ出力と係数更新を行列演算でまとめて行う。
+
+    - 参照信号がほぼ無音のフレームは処理しない (再生していない間はコストゼロ)
+    - マイクのピークが参照のピークの double_talk_ratio 倍を超えるブロック (ダブルトーク) では
+      係数を更新しない (Geigel 法)。話し終わった後も hangover_blocks ブロックは更新を止めたままにする
+    - フレームあたりの処理時間を記録する
+    """
+
+    def __init__(self, reference, taps=512, block=32, mu=0.8, delay_ms=60.0,
+                 silence_rms=30.0, double_talk_ratio=0.5, hangover_blocks=8):
+        self.reference = reference
+        self.taps = taps
+        self.block = block
+        self.mu = mu
+        self.silence_rms = silence_rms
+        self.double_talk_ratio = double_talk_ratio
+        self.hangover_blocks = hangover_blocks
+        self._hold = 0          # 係数の更新を止めておく残りブロック数
+        # 推定遅延の誤差を吸収するため、フィルタ長の1/4だけ先の参照まで見る
+        self._delay = int(reference.rate * delay_ms / 1000) - taps // 4
+        self.weights = np.zeros(taps, dtype=np.float32)
+
+        # 統計
+        self.frames = 0
+        self.processed_frames = 0
+        self.double_talk_blocks = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def process(self, frame, captured_at):
+        """
+        frame (書き込み可能な PCM16 バッファ) からエコーを除去して上書きする。
+        captured_at はフレーム先頭サンプルの取得時刻 (perf_counter)。
+        """
+        start_ns = time.perf_counter_ns()
+        mic = np.frombuffer(frame, dtype=np.int16)
+        n = len(mic)
+        start = self.reference.sample_index(captured_at) - self._delay
+        ref = self.reference.window(start - self.taps + 1, n + self.taps - 1)
+
+        self.frames += 1
+        if float(np.mean(ref * ref)) >= self.silence_rms ** 2:
+            # X[i] = ref[i : i + taps] を新しい順に並べたもの (コピーなしのビュー)
+            x_all = sliding_window_view(ref, self.taps)[:, ::-1]
+            d_all = mic.astype(np.float32)
+            out = np.empty(n, dtype=np.float32)
+
+            for b in range(0, n, self.block):
+                x = x_all[b:b + self.block]
+                d = d_all[b:b + self.block]
+                e = d - x @ self.weights
+                out[b:b + self.block] = e
+
+                ref_block = ref[b:b + self.block + self.taps - 1]
+                power = float(np.mean(ref_block * ref_block))
+                far = float(np.max(np.abs(ref_block)))
+                near = float(np.max(np.abs(d)))
+                if near > far * self.double_talk_ratio:
+                    # エコー経路の減衰より大きい音はユーザーの声。学習すると係数が発散する
+                    self._hold = self.hangover_blocks
+                    self.double_talk_blocks += 1
+                elif self._hold > 0:
+                    self._hold -= 1
+                elif power > 1e-3:
+                    # ブロック内の各サンプルの NLMS 更新を平均したもの
+                    norm = len(d) * self.taps * power
+                    self.weights += (self.mu / norm) * (x.T @ e)
+
+            mic[:] = np.clip(out, -32768, 32767).astype(np.int16)
+            self.processed_frames += 1
+
+        elapsed = time.perf_counter_ns() - start_ns
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+
+
+def log_echo_stats(aec):
+    if aec.frames == 0:
+        return
+    print(
+        f"[AEC] {aec.processed_frames}/{aec.frames} フレーム処理, "
+        f"平均 {aec.total_ns / aec.frames / 1000:.0f} us/フレーム, 最大 {aec.max_ns / 1000:.0f} us, "
+        f"ダブルトーク {aec.double_talk_blocks} ブロック"
+    )
@@ -0,0 +1,316 @@
+"""
+Realtime API のうちクライアントが使う部分だけを話すローカル検証用サーバ。
+ネットワークや API キーなしで realtime8.py の動作確認・計測ができる。
+
+対応イベント:
+  session.update, input_audio_buffer.append / commit / clear,
+  response.create / cancel, conversation.item.create / truncate
+
+応答はスクリプト (JSON) で設定した合成音声・テキスト・関数呼び出しを返す。
+
+    python fake_realtime_server.py --port 8765 [--script script.json]
+    REALTIME_WS_URL=ws://localhost:8765 python realtime8.py
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import math
+import struct
+import time
+
+import websockets
+
+# スクリプトの既定値。turns を順番に (最後まで行ったら先頭から) 返す。
+DEFAULT_SCRIPT = {
+    "turns": [
+        {"transcript": "まいど！なんか用か？", "audio_ms": 1500},
+        {"transcript": "ほな踊るで！", "audio_ms": 800,
+         "function_call": {"name": "Dance", "arguments": "{}"}},
+    ],
+    # 関数呼び出しの結果を受けた後の response.create に返す応答
+    "follow_up": {"transcript": "踊ったで！", "audio_ms": 600},
+    "delta_ms": 100,              # 1つの audio.delta に入れる音声の長さ
+    "first_delta_delay_ms": 0,    # response.created から最初の音声までの待ち (推論時間の代わり)
+    "arguments_ms": 0,            # 関数呼び出しの item から引数の確定までの時間 (引数の生成時間の代わり)
+    "transcription_ms": 0,        # commit から入力音声の文字起こしまでの時間 (turn の input_transcript を返す)
+    "pace": 0.0,                  # 0: できるだけ速く送る, 1: 実時間で送る
+    "rate": 24000,
+}
+
+
+def synth_pcm16(ms, rate=24000, freq=220.0, amplitude=3000):
+    n = int(rate * ms / 1000)
+    return struct.pack(
+        f"<{n}h", *(int(amplitude * math.sin(2 * math.pi * freq * i / rate)) for i in range(n))
+    )
+
+
+class FakeRealtimeServer:
+    def __init__(self, script=None, host="localhost", port=8765):
+        self.script = dict(DEFAULT_SCRIPT, **(script or {}))
+        self.host = host
+        self.port = port
+        self._ids = itertools.count(1)
+        self._server = None
+        self._delta_cache = {}
+        self._connections = set()
+
+        # 計測用 (時刻は perf_counter_ns)
+        self.received = {}             # type ごとの受信数
+        self.sent = 0                  # 送信メッセージ数
+        self.appended_bytes = 0
+        self.commit_times = []         # commit を受け取った時刻
+        self.first_delta_times = {}    # response_id -> 最初の audio.delta を送った時刻
+        self.connections = 0           # 受け付けた接続数
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        # port=0 のときは割り当てられたポートを使う
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def drop_connections(self):
+        """接続中のクライアントを全部切る (再接続の検証用)。"""
+        for websocket in list(self._connections):
+            await websocket.close(code=1011, reason="dropped by fake server")
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def _id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    async def _send(self, websocket, event):
+        event.setdefault("event_id", self._id("event"))
+        await websocket.send(json.dumps(event, ensure_ascii=False, separators=(",", ":")))
+        self.sent += 1
+
+    async def _handle(self, websocket):
+        state = {
+            "turns": itertools.cycle(self.script["turns"]),
+            "committed": False,
+            "turn": None,
+            "transcription": False,
+            "response_task": None,
+        }
+        self.connections += 1
+        self._connections.add(websocket)
+        await self._send(websocket, {"type": "session.created", "session": {"id": self._id("sess")}})
+        try:
+            async for raw in websocket:
+                event = json.loads(raw)
+                event_type = event.get("type")
+                self.received[event_type] = self.received.get(event_type, 0) + 1
+                await self._on_event(websocket, state, event_type, event)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._connections.discard(websocket)
+            task = state["response_task"]
+            if task is not None:
+                task.cancel()
+
+    async def _on_event(self, websocket, state, event_type, event):
+        if event_type == "session.update":
+            session = event.get("session", {})
+            state["transcription"] = bool(session.get("input_audio_transcription"))
+            await self._send(websocket, {"type": "session.updated", "session": session})
+        elif event_type == "input_audio_buffer.append":
+            self.appended_bytes += len(event.get("audio", "")) * 3 // 4
+        elif event_type == "input_audio_buffer.commit":
+            self.commit_times.append(time.perf_counter_ns())
+            state["committed"] = True
+            state["turn"] = next(state["turns"])
+            item_id = self._id("item")
+            await self._send(websocket, {"type": "input_audio_buffer.committed", "item_id": item_id})
+            if state["transcription"] and "input_transcript" in state["turn"]:
+                asyncio.create_task(self._transcribe(websocket, item_id, state["turn"]["input_transcript"]))
+        elif event_type == "input_audio_buffer.clear":
+            await self._send(websocket, {"type": "input_audio_buffer.cleared"})
+        elif event_type == "conversation.item.create":
+            await self._send(websocket, {"type": "conversation.item.created", "item": event.get("item", {})})
+        elif event_type == "conversation.item.truncate":
+            await self._send(websocket, {
+                "type": "conversation.item.truncated",
+                "item_id": event.get("item_id"),
+                "content_index": event.get("content_index", 0),
+                "audio_end_ms": event.get("audio_end_ms", 0),
+            })
+        elif event_type == "response.create":
+            if state["committed"]:
+                turn = state["turn"]
+                state["committed"] = False
+            else:
+                turn = self.script["follow_up"]
+            state["response_task"] = asyncio.create_task(self._respond(websocket, turn))
+        elif event_type == "response.cancel":
+            task = state["response_task"]
+            if task is not None and not task.done():
+                task.cancel()
+            else:
+                await self._send(websocket, {
+                    "type": "error",
+                    "error": {"type": "invalid_request_error", "message": "no active response"},
+                })
+
+    def _delta_payload(self, ms):
+        if ms not in self._delta_cache:
+            self._delta_cache[ms] = base64.b64encode(
+                synth_pcm16(ms, self.script["rate"])
+            ).decode("ascii")
+        return self._delta_cache[ms]
+
+    async def _transcribe(self, websocket, item_id, transcript):
+        if self.script["transcription_ms"]:
+            await asyncio.sleep(self.script["transcription_ms"] / 1000)
+        try:
+            await self._send(websocket, {
+                "type": "conversation.item.input_audio_transcription.completed",
+                "item_id": item_id,
+                "content_index": 0,
+                "transcript": transcript,
+            })
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _respond(self, websocket, turn):
+        response_id = self._id("resp")
+        item_id = self._id("item")
+        output = []
+        status = "completed"
+        await self._send(websocket, {
+            "type": "response.created",
+            "response": {"id": response_id, "status": "in_progress"},
+        })
+        try:
+            await self._send(websocket, {
+                "type": "response.output_item.added",
+                "response_id": response_id,
+                "output_index": 0,
+                "item": {"id": item_id, "type": "message", "role": "assistant"},
+            })
+            delay = self.script["first_delta_delay_ms"]
+            if delay:
+                await asyncio.sleep(delay / 1000)
+
+            delta_ms = self.script["delta_ms"]
+            n_deltas = max(1, math.ceil(turn.get("audio_ms", 0) / delta_ms))
+            text = turn.get("transcript", "")
+            step = max(1, math.ceil(len(text) / n_deltas))
+            for i in range(n_deltas):
+                if text[i * step:(i + 1) * step]:
+                    await self._send(websocket, {
+                        "type": "response.audio_transcript.delta",
+                        "response_id": response_id,
+                        "item_id": item_id,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": text[i * step:(i + 1) * step],
+                    })
+                if i == 0:
+                    self.first_delta_times[response_id] = time.perf_counter_ns()
+                # delta を最後のキーにする (実サーバと同じ並び)
+                await self._send(websocket, {
+                    "type": "response.audio.delta",
+                    "event_id": self._id("event"),
+                    "response_id": response_id,
+                    "item_id": item_id,
+                    "output_index": 0,
+                    "content_index": 0,
+                    "delta": self._delta_payload(delta_ms),
+                })
+                if self.script["pace"]:
+                    await asyncio.sleep(delta_ms / 1000 / self.script["pace"])
+                else:
+                    await asyncio.sleep(0)
+            await self._send(websocket, {"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+            await self._send(websocket, {
+                "type": "response.audio_transcript.done",
+                "response_id": response_id,
+                "item_id": item_id,
+                "transcript": text,
+            })
+            output.append({"id": item_id, "type": "message", "role": "assistant"})
+
+            # function_calls で1つの応答に複数の呼び出しを入れられる
+            calls = turn.get("function_calls") or ([turn["function_call"]] if turn.get("function_call") else [])
+            for index, call in enumerate(calls, start=1):
+                call_item = {
+                    "id": self._id("item"),
+                    "type": "function_call",
+                    "call_id": self._id("call"),
+                    "name": call["name"],
+                    "arguments": "",
+                }
+                await self._send(websocket, {
+                    "type": "response.output_item.added",
+                    "response_id": response_id,
+                    "output_index": index,
+                    "item": call_item,
+                })
+                if self.script["arguments_ms"]:
+                    await asyncio.sleep(self.script["arguments_ms"] / 1000)
+                await self._send(websocket, {
+                    "type": "response.function_call_arguments.delta",
+                    "response_id": response_id,
+                    "item_id": call_item["id"],
+                    "output_index": index,
+                    "call_id": call_item["call_id"],
+                    "delta": call.get("arguments", "{}"),
+                })
+                await self._send(websocket, {
+                    "type": "response.function_call_arguments.done",
+                    "response_id": response_id,
+                    "item_id": call_item["id"],
+                    "output_index": index,
+                    "call_id": call_item["call_id"],
+                    "name": call["name"],
+                    "arguments": call.get("arguments", "{}"),
+                })
+                output.append(dict(call_item, arguments=call.get("arguments", "{}")))
+        except asyncio.CancelledError:
+            status = "cancelled"
+        finally:
+            try:
+                await self._send(websocket, {
+                    "type": "response.done",
+                    "response": {"id": response_id, "status": status, "output": output},
+                })
+            except websockets.ConnectionClosed:
+                pass
+
+
+async def _serve(args):
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+    server = await FakeRealtimeServer(script, args.host, args.port).start()
+    print(f"[INFO] Fake realtime server listening on {server.url}")
+    try:
+        await asyncio.Future()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", default=None, help="応答スクリプト (JSON)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
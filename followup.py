@@ -0,0 +1,149 @@
+"""
+ツール呼び出しの後に response.create (フォローアップの生成) を送るかどうかを決める。
+
+function_call_output を返した後の response.create は、音声つきの生成をもう1回行わせる。
+ロボットが動くだけでよいときには不要で、1つの応答に複数の呼び出しがあると呼び出しの数だけ生成が走る。
+
+  always      呼び出しごとに response.create を送る (従来の動作)
+  aggregate   1つの応答の呼び出しがすべて終わってから1回だけ送る
+  on_failure  失敗した (実行できなかった) 呼び出しがあるときだけ、まとめて1回送る
+  never       送らない (動作させるだけ)
+
+function_call_output はどの方針でも返す (会話の履歴に結果を残す)。
+"""
+import collections
+import time
+
+ALWAYS = "always"
+AGGREGATE = "aggregate"
+ON_FAILURE = "on_failure"
+NEVER = "never"
+POLICIES = (ALWAYS, AGGREGATE, ON_FAILURE, NEVER)
+
+# 従来の動作で response.create を送っていた結果 (invalid は引数の誤り)
+FOLLOW_UP_STATUSES = ("completed", "failed", "dropped", "invalid")
+FAILURE_STATUSES = ("failed", "dropped", "invalid")
+
+
+class FollowUpPolicy:
+    """
+    応答ごとにツール呼び出しの結果を集め、response.create を送るべきときに True を返す。
+
+        add_call(response_id, call_id)              引数が確定したとき (response.done より前)
+        call_finished(response_id, call_id, status) 結果を返したとき
+        response_done(response_id)                  response.done を受けたとき
+
+    aggregate / on_failure では、response.done を受けて応答の呼び出しが出揃い、
+    そのすべてが終わった時点で1回だけ判定する。
+    """
+
+    def __init__(self, policy=AGGREGATE, history=100):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown follow-up policy: {policy}")
+        self.policy = policy
+        self._responses = {}      # response_id -> {"calls": {call_id: status}, "done": bool}
+        self._requested_at = None
+        self._follow_ups = {}     # フォローアップの response_id -> response.create の送信時刻
+
+        # 統計
+        self.calls = 0
+        self.legacy = 0           # 従来の動作なら送っていた response.create の数
+        self.sent = 0
+        self.merged = 0           # 2つ以上の呼び出しを1回にまとめた応答の数
+        self.durations = collections.deque(maxlen=history)  # response.create → response.done (秒)
+
+    def add_call(self, response_id, call_id):
+        if self.policy == ALWAYS:
+            return
+        entry = self._responses.setdefault(response_id, {"calls": {}, "done": False})
+        entry["calls"][call_id] = None
+
+    def call_finished(self, response_id, call_id, status):
+        """呼び出しの結果 (ActionExecutor の status か invalid / accepted)。今送るなら True。"""
+        self.calls += 1
+        if status in FOLLOW_UP_STATUSES:
+            self.legacy += 1
+        if self.policy == ALWAYS:
+            return status in FOLLOW_UP_STATUSES
+        entry = self._responses.get(response_id)
+        if entry is None or call_id not in entry["calls"]:
+            # 切断で捨てた応答の呼び出し
+            return False
+        entry["calls"][call_id] = status
+        return self._decide(response_id)
+
+    def response_done(self, response_id):
+        """応答の呼び出しが出揃った。今送るなら True。"""
+        entry = self._responses.get(response_id)
+        if entry is None:
+            return False
+        entry["done"] = True
+        return self._decide(response_id)
+
+    def _decide(self, response_id):
+        entry = self._responses[response_id]
+        statuses = list(entry["calls"].values())
+        if not entry["done"] or None in statuses:
+            return False
+        del self._responses[response_id]
+        if self.policy == NEVER:
+            return False
+        wanted = FAILURE_STATUSES if self.policy == ON_FAILURE else FOLLOW_UP_STATUSES
+        follow_up = any(status in wanted for status in statuses)
+        if follow_up and sum(status in FOLLOW_UP_STATUSES for status in statuses) > 1:
+            self.merged += 1
+        return follow_up
+
+    def requested(self):
+        """フォローアップの response.create を送った。"""
+        self.sent += 1
+        self._requested_at = time.perf_counter()
+
+    def response_created(self, response_id):
+        if self._requested_at is not None:
+            self._follow_ups[response_id] = self._requested_at
+            self._requested_at = None
+
+    def response_finished(self, response_id):
+        """フォローアップの生成にかかった時間を記録する (response.done で呼ぶ)。"""
+        requested_at = self._follow_ups.pop(response_id, None)
+        if requested_at is not None:
+            self.durations.append(time.perf_counter() - requested_at)
+
+    def reset(self):
+        """切断したら呼ぶ。結果待ちの呼び出しは新しいセッションでは応答を作らない。"""
+        self._responses.clear()
+        self._follow_ups.clear()
+        self._requested_at = None
+
+    def stats(self):
+        saved = self.legacy - self.sent
+        mean = sum(self.durations) / len(self.durations) if self.durations else None
+        return {
+            "policy": self.policy,
+            "calls": self.calls,
+            "sent": self.sent,
+            "saved": saved,
+            "merged": self.merged,
+            "mean_duration": mean,
+            # 省いた生成の時間は、実際に行ったフォローアップの平均から見積もる
+            "saved_seconds": saved * mean if mean is not None else None,
+        }
+
+
+def log_follow_up_stats(policy):
+    s = policy.stats()
+    if not s["calls"]:
+        return
+    line = (
+        f"[FOLLOW-UP] {s['policy']}: ツール呼び出し {s['calls']} 回, "
+        f"response.create {s['sent']} 回 (省いた生成 {s['saved']} 回"
+    )
+    if s["merged"]:
+        line += f", まとめた応答 {s['merged']} 回"
+    line += ")"
+    if s["mean_duration"] is not None:
+        line += f", フォローアップ平均 {s['mean_duration']:.2f} 秒"
+        if s["saved"]:
+            line += f" (約 {s['saved_seconds']:.1f} 秒の生成を省略)"
+    print(line)
@@ -1,88 +1,358 @@
+"""
+Go2 の動作ツール。
+
+SportClient は最初に使うとき (または init() を呼んだとき) に初期化するので、
+import しただけでは SDK に接続しない。設定は環境変数か configure() で変えられる。
+動作の完了はスポーツモードの状態 (robot_state) から判定する。
+
+  GO2_BACKEND    real (unitree_sdk2py) / stub (動作名を表示するだけ)   既定: real
+  GO2_INTERFACE  DDS のネットワークインターフェース                    既定: enp0s8
+  GO2_TIMEOUT    SportClient のタイムアウト (秒)                       既定: 10.0
+"""
+import functools
+import json
+import os
+import threading
 import time
-from unitree_sdk2py.core.channel import ChannelSubscriber, ChannelFactoryInitialize
-from unitree_sdk2py.go2.sport.sport_client import SportClient
-
-ChannelFactoryInitialize(0, "enp0s8")
-client = SportClient()
-client.SetTimeout(10.0)
-client.Init()
-dt = 0.01
-    
+
+from motion import MotionController, log_motion_stats
+from tool_registry import ToolRegistry, ToolArgumentError
+from robot_state import (
+    SportStateMonitor, FakeSportStatePublisher, SPORT_STATE_TOPIC, STANDING_MODES,
+    MODE_BALANCE_STAND, MODE_SIT, MODE_RECOVERY_STAND, MODE_FRONT_FLIP, MODE_FRONT_JUMP, MODE_FRONT_POUNCE,
+)
+
+config = {
+    "backend": os.environ.get("GO2_BACKEND", "real"),
+    "interface": os.environ.get("GO2_INTERFACE", "enp0s8"),
+    "timeout": float(os.environ.get("GO2_TIMEOUT", "10.0")),
+}
+
+_client = None
+_client_lock = threading.Lock()
+# 動作の完了判定に使う状態 (実機は DDS の購読、スタブはフェイクの発行スレッドから更新される)
+state_monitor = SportStateMonitor()
+_state_subscriber = None
+# Move の速度指令は制御スレッドから 100 Hz で送る
+motion = MotionController(lambda: get_client(), rate_hz=100)
+# cancel() で動作後の待ちを打ち切る
+_interrupt = threading.Event()
+# 中断されても最後まで行わせる動作 (宙に浮いている間がある芸と、姿勢の切り替え)
+UNINTERRUPTIBLE = {"FrontJump", "FrontFlip", "FrontPounce", "StandUp", "SitDown"}
+# ツールのスキーマは関数のシグネチャと docstring から作る
+registry = ToolRegistry()
+
+
+class StubSportClient:
+    """
+    ロボットなしで動かすためのクライアント。呼ばれた動作名を表示し、
+    フェイクの状態発行スレッドで動作中→完了の状態を流す。
+    """
+
+    # 動作名 -> (動作中の秒数, 完了後の mode, 動作中の mode)
+    ACTIONS = {
+        "RiseSit": (0.6, MODE_BALANCE_STAND, MODE_RECOVERY_STAND),
+        "Sit": (0.6, MODE_SIT, None),
+        "Stretch": (0.8, None, None),
+        "Dance1": (1.5, None, None),
+        "FrontJump": (0.5, None, MODE_FRONT_JUMP),
+        "Heart": (1.0, None, None),
+        "FrontFlip": (0.8, None, MODE_FRONT_FLIP),
+        "FrontPounce": (0.6, None, MODE_FRONT_POUNCE),
+        "Hello": (0.8, None, None),
+        # 実行中の動作を打ち切って立った姿勢に戻る
+        "BalanceStand": (0.0, MODE_BALANCE_STAND, None),
+    }
+
+    def __init__(self, publisher=None):
+        self.publisher = publisher
+        self.move_commands = 0
+
+    def Move(self, vx, vy, vyaw):
+        # 100 Hz で呼ばれるので表示せずに数えるだけ
+        self.move_commands += 1
+        if self.publisher is not None:
+            self.publisher.set_speed(max(abs(vx), abs(vy), abs(vyaw)))
+        return 0
+
+    def StopMove(self):
+        print("StopMove")
+        if self.publisher is not None:
+            self.publisher.set_speed(0.0)
+        return 0
+
+    def __getattr__(self, name):
+        def action(*args):
+            print(name if not args else f"{name}{args}")
+            if self.publisher is not None and name in self.ACTIONS:
+                self.publisher.start_action(*self.ACTIONS[name])
+            return 0
+        return action
+
+
+def configure(**overrides):
+    """設定を変える。クライアントの初期化後は変えられない。"""
+    unknown = set(overrides) - set(config)
+    if unknown:
+        raise ValueError(f"unknown go2_tools settings: {sorted(unknown)}")
+    with _client_lock:
+        if _client is not None:
+            raise RuntimeError("go2_tools のクライアントは初期化済みです")
+        config.update(overrides)
+
+
+def _create_client():
+    global _state_subscriber
+    if config["backend"] == "stub":
+        return StubSportClient(FakeSportStatePublisher(state_monitor).start())
+    if config["backend"] != "real":
+        raise ValueError(f"unknown GO2_BACKEND: {config['backend']}")
+
+    from unitree_sdk2py.core.channel import ChannelSubscriber, ChannelFactoryInitialize
+    from unitree_sdk2py.go2.sport.sport_client import SportClient
+    from unitree_sdk2py.idl.unitree_go.msg.dds_ import SportModeState_
+
+    ChannelFactoryInitialize(0, config["interface"])
+    # 状態は一度だけ購読し、以降の動作はすべてこれで完了を判定する
+    _state_subscriber = ChannelSubscriber(SPORT_STATE_TOPIC, SportModeState_)
+    _state_subscriber.Init(state_monitor.on_sport_state, 10)
+    client = SportClient()
+    client.SetTimeout(config["timeout"])
+    client.Init()
+    return client
+
+
+def get_client():
+    """SportClient を返す。初回だけ SDK を初期化する (スレッドセーフ)。"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def init():
+    """起動時に呼んでおくと、最初の動作で初期化を待たずに済む。"""
+    get_client()
+
+
+def health_check():
+    """
+    クライアントが使えるかを確かめる。
+    戻り値は {"ok", "backend", "detail"}。
+    """
+    result = {"ok": False, "backend": config["backend"], "detail": ""}
+    if _client is None:
+        result["detail"] = "not initialized"
+        return result
+    if config["backend"] == "stub":
+        result["ok"] = True
+        result["detail"] = "stub"
+        return result
+    try:
+        # サーバの API バージョンを問い合わせて疎通を確認する
+        code, version = _client.GetServerApiVersion()
+    except Exception as e:
+        result["detail"] = f"{type(e).__name__}: {e}"
+        return result
+    result["ok"] = code == 0
+    result["detail"] = f"api {version}" if code == 0 else f"error code {code}"
+    return result
+
+
+def cancel():
+    """
+    実行中の動作を中断する。移動は StopMove で止め、動作後の待ちは打ち切る。
+    SDK の動作 (ダンスなど) は待ちを打ち切ったワーカーが _stop_action() で止める。
+    """
+    _interrupt.set()
+    motion.cancel()
+    state_monitor.wake()
+
+
+def _action(func):
+    # 前の動作への cancel() を持ち越さない
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _interrupt.clear()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _wait_done(name, expect_modes=None, timeout=5.0):
+    """
+    動作が終わるのを状態から判定して待つ。cancel() されたら打ち切って動作を止める。
+    状態が届いていなければ従来どおり 1 秒待つ。
+    止められない動作は中断されても終わるまで待ち (次の動作を重ねない)、そのことを伝える文を返す。
+    """
+    if not state_monitor.alive():
+        _interrupt.wait(1.0)
+    else:
+        result = state_monitor.wait_done(name, expect_modes, timeout=timeout, cancelled=_interrupt.is_set)
+        if result == "timeout":
+            print(f"[WARN] {name}: {timeout:.0f} 秒以内に完了を確認できませんでした。")
+    if _interrupt.is_set():
+        return _stop_action(name, expect_modes, timeout)
+    return None
+
+
+def _stop_action(name, expect_modes, timeout):
+    # SDK の呼び出しはワーカースレッドからだけ行う (cancel() はイベントループから呼ばれる)
+    if name in UNINTERRUPTIBLE:
+        print(f"[ACTION] {name} は途中で止められないので最後まで待ちます。")
+        if state_monitor.alive():
+            state_monitor.wait_done(name, expect_modes, timeout=timeout)
+        return f"ただし {name} は途中で止められないため、最後まで行いました。"
+    client = get_client()
+    client.StopMove()
+    client.BalanceStand()
+    return None
+
+
+# priority はスケジューラでの優先度 (大きいほど先に実行する。既定は 0)。姿勢を戻す動作は芸より先に
+
+@registry.tool(priority=1)
+@_action
 def StandUp():
-    client.RiseSit()
-    time.sleep(1)
+    """立ち上がる"""
+    get_client().RiseSit()
+    return _wait_done("StandUp", STANDING_MODES)
 
+@registry.tool(priority=1)
+@_action
 def SitDown():
-    client.Sit()
-    time.sleep(1)
+    """座る"""
+    get_client().Sit()
+    return _wait_done("SitDown", (MODE_SIT,))
 
+@registry.tool()
+@_action
 def Stretch():
-    client.Stretch()
-    time.sleep(1)
+    """ストレッチする"""
+    get_client().Stretch()
+    return _wait_done("Stretch")
 
+@registry.tool()
+@_action
 def Dance():
-    client.Dance1()
-    time.sleep(1)
+    """ダンスする"""
+    get_client().Dance1()
+    return _wait_done("Dance", timeout=15.0)
 
+@registry.tool()
+@_action
 def FrontJump():
-    client.FrontJump()
-    time.sleep(1)
+    """前にジャンプする"""
+    get_client().FrontJump()
+    return _wait_done("FrontJump")
 
+@registry.tool()
+@_action
 def Heart():
-    client.Heart()
-    time.sleep(1)
+    """ハートを描く"""
+    get_client().Heart()
+    return _wait_done("Heart")
 
+@registry.tool()
+@_action
 def FrontFlip():
-    client.FrontFlip()
-    time.sleep(1)
-
-def Move(x, y, z):
-    """x(m)、y(m)、z(rad)回転する"""
-    for i in range(int(x / dt)):
-        client.Move(1, 0, 0)
-        time.sleep(dt)
-    client.StopMove()
-
-    for i in range(int(y / dt)):
-        client.Move(0, 1, 0)
-        time.sleep(dt)
-    client.StopMove()
-
-    for i in range(int(z / dt)):
-        client.Move(0, 0, 1)
-        time.sleep(dt)
-    client.StopMove()
-
-    time.sleep(1)
+    """バク転する"""
+    get_client().FrontFlip()
+    return _wait_done("FrontFlip")
 
+@registry.tool()
+@_action
 def FrontPounce():
     """威嚇する"""
-    client.FrontPounce()
-    time.sleep(1)
+    get_client().FrontPounce()
+    return _wait_done("FrontPounce")
 
+@registry.tool()
+@_action
 def Hello():
     """挨拶する"""
-    client.Hello()
-    time.sleep(1)
-
-tool_dict = {
-    "StandUp": StandUp,
-    "SitDown": SitDown,
-    "Stretch": Stretch,
-    "Dance": Dance,
-    "Heart": Heart,
-    "FrontFlip": FrontFlip,
-    "FrontPounce": FrontPounce,
-    "Hello": Hello
-}
+    get_client().Hello()
+    return _wait_done("Hello")
+
+# 1回の Move で動ける範囲 (ワーカーを長く占有しないよう、遠くへはモデルに分けて呼ばせる)
+MOVE_LIMITS = {"x": 3.0, "y": 2.0, "z": 6.28}
+
+@registry.tool(parameters={
+    axis: {"minimum": -limit, "maximum": limit} for axis, limit in MOVE_LIMITS.items()
+})
+@_action
+def Move(x: float = 0.0, y: float = 0.0, z: float = 0.0, speed: float = 1.0, yaw_speed: float = 1.0):
+    """
+    移動・回転する (前後・左右・回転を同時に行える)
+
+    x: 前後の移動量 (m)。前が正。-3〜3
+    y: 左右の移動量 (m)。左が正。-2〜2
+    z: 回転量 (rad)。左回りが正。-6.28〜6.28 (1回転まで)
+    speed: 移動速度 (m/s)
+    yaw_speed: 回転速度 (rad/s)
+    """
+    handle = motion.move_by(x, y, z, speed=speed, yaw_speed=yaw_speed)
+    handle.wait()
+    log_motion_stats(motion)
+    if handle.status == "failed":
+        raise handle.error
+    if handle.status != "completed":
+        raise RuntimeError(f"移動が中断されました ({handle.status})")
+
+@registry.tool(parameters={
+    "steps": {
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "enum": list(registry.functions())},
+                "args": {"type": "object", "description": "その動作の引数 (Move など)"}
+            },
+            "required": ["name"]
+        }
+    }
+})
+@_action
+def Sequence(steps: list):
+    """
+    複数の動作を順番に続けて行う。「立って、挨拶して、踊って」のような連続した指示は1回の呼び出しでまとめる
+
+    steps: 行う動作のリスト (順番どおりに実行する)。各要素は {"name": 動作名, "args": 引数}
+    """
+    # 先に全部の引数を確かめ、途中で失敗しないようにする
+    calls = []
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict) or step.get("name") not in registry or step.get("name") == "Sequence":
+            raise ToolArgumentError(f"Sequence: step {i + 1} is not a known action: {step!r}")
+        calls.append((step["name"], registry.convert(step["name"], step.get("args"))))
+
+    results = []
+    for name, kwargs in calls:
+        if _interrupt.is_set():
+            # 前の動作が中断された。残りは行わない
+            results.append({"name": name, "status": "skipped"})
+            continue
+        started = time.perf_counter()
+        note = None
+        try:
+            note = tool_dict[name](**kwargs)
+            status = "cancelled" if _interrupt.is_set() else "ok"
+        except Exception as e:
+            # 中断された Move は例外で終わる
+            status = "cancelled" if _interrupt.is_set() else f"error: {e}"
+        results.append({"name": name, "status": status, "seconds": round(time.perf_counter() - started, 2)})
+        if isinstance(note, str):
+            # 止められない動作は最後まで行った
+            results[-1]["note"] = note
+        # 各動作の開始で _interrupt はクリアされるので、中断の合図は動作の後に持ち越す
+        if status != "ok":
+            _interrupt.set()
+    return json.dumps({"steps": results}, ensure_ascii=False)
 
-tools = [
-    {"type": "function", "name": "StandUp", "description": "立ち上がる"},
-    {"type": "function", "name": "SitDown", "description": "座る"},
-    {"type": "function", "name": "Stretch", "description": "ストレッチする"},
-    {"type": "function", "name": "Dance", "description": "ダンスする"},
-    {"type": "function", "name": "Heart", "description": "ハートを描く"},
-    {"type": "function", "name": "FrontFlip", "description": "バク転する"},
-    {"type": "function", "name": "FrontPounce", "description": "威嚇する"},
-    {"type": "function", "name": "Hello", "description": "挨拶する"}
-]
+# 従来の名前 (realtime8.py はこれを使う)
+tool_dict = registry.functions()
+tools = registry.schemas()
+priorities = registry.priorities()
+# 引数なしで呼べるツールだけ (tool_dict[name]() と呼ぶ realtime1/6/7.py 用)
+legacy_tool_dict = {name: func for name, func in tool_dict.items() if not registry.takes_arguments(name)}
+legacy_tools = [schema for schema in tools if schema["name"] in legacy_tool_dict]
@@ -0,0 +1,120 @@
+"""
+ユーザーの発話 (入力音声の文字起こし) から、前回モデルが選んだツール呼び出しを引くキャッシュ。
+
+「座って」「お手」のようによく使う指示は、モデルの推論と function call を待たずに
+文字起こしが届いた時点で動作を始められる。
+
+- キーは正規化した文字起こし (NFKC、小文字化、句読点・空白・記号を除く)
+- 値はモデルが選んだツール呼び出しの列 [(name, kwargs), ...]
+- 同じ発話に同じ呼び出しが min_hits 回続いたら「確か」とみなして先に実行する
+  (違う呼び出しが選ばれたら数え直す。先に実行した呼び出しが外れたら忘れる)
+- 件数が capacity を超えたら最も長く使われていないものから捨てる (LRU)
+"""
+import collections
+import unicodedata
+
+
+def normalize_transcript(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    # 句読点 (P)・区切り (Z)・記号 (S)・制御文字 (C) を除く
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+
+
+class IntentCache:
+    def __init__(self, capacity=128, min_hits=2, history=100):
+        self.capacity = capacity
+        self.min_hits = min_hits
+        self._entries = collections.OrderedDict()   # key -> {"calls": [...], "count": n}
+
+        # 統計
+        self.lookups = 0
+        self.hits = 0             # キーがあった
+        self.dispatched = 0       # 確かなので先に実行した
+        self.mismatches = 0       # 先に実行したがモデルは別の呼び出しを選んだ
+        self.evictions = 0
+        self.leads = collections.deque(maxlen=history)   # 先に実行して arguments.done より早まった秒数
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, transcript):
+        """
+        確かな呼び出しがあればその列を返す (なければ None)。
+        先に実行したら dispatched() を呼ぶこと。
+        """
+        key = normalize_transcript(transcript)
+        if not key:
+            return None
+        self.lookups += 1
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        if entry["count"] < self.min_hits:
+            return None
+        return list(entry["calls"])
+
+    def learn(self, transcript, calls):
+        """モデルがこの発話に選んだ呼び出し (呼び出しがなければ空) を覚える。"""
+        key = normalize_transcript(transcript)
+        if not key:
+            return
+        if not calls:
+            # ツールを使わない発話は覚えない (前に覚えたものがあれば忘れる)
+            self._entries.pop(key, None)
+            return
+        calls = [(name, dict(kwargs)) for name, kwargs in calls]
+        entry = self._entries.get(key)
+        if entry is not None and entry["calls"] == calls:
+            entry["count"] += 1
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = {"calls": calls, "count": 1}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def forget(self, transcript):
+        self._entries.pop(normalize_transcript(transcript), None)
+
+    def mark_dispatched(self):
+        self.dispatched += 1
+
+    def mark_mismatch(self, transcript):
+        """先に実行した呼び出しをモデルが選ばなかった。次からは先に実行しない。"""
+        self.mismatches += 1
+        self.forget(transcript)
+
+    def add_lead(self, seconds):
+        self.leads.append(seconds)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "dispatched": self.dispatched,
+            "mismatches": self.mismatches,
+            "evictions": self.evictions,
+            "mean_lead": sum(self.leads) / len(self.leads) if self.leads else None,
+        }
+
+
+def log_intent_stats(cache):
+    s = cache.stats()
+    if not s["lookups"]:
+        return
+    line = (
+        f"[INTENT] 登録 {s['entries']} 件, 照会 {s['lookups']} 回, "
+        f"ヒット {s['hits']} 回 ({s['hit_rate'] * 100:.0f}%), 先行実行 {s['dispatched']} 回"
+    )
+    if s["mean_lead"] is not None:
+        line += f" (平均 {s['mean_lead'] * 1000:.0f} ms 早く開始)"
+    if s["mismatches"]:
+        line += f", 外れ {s['mismatches']} 回"
+    if s["evictions"]:
+        line += f", 追い出し {s['evictions']} 件"
+    print(line)
@@ -0,0 +1,201 @@
+import collections
+import json
+import threading
+import time
+
+# 1ターンで記録するステージ (この順に進む)
+STAGES = (
+    "speech_start",        # VAD が発話開始を検出
+    "commit",              # input_audio_buffer.commit を送信
+    "response_created",    # response.created を受信
+    "first_audio_delta",   # 最初の response.audio.delta を受信
+    "first_audible",       # 最初の音声をデバイスに書き込んだ
+    "response_done",       # response.done を受信
+)
+
+# 集計する区間 (名前, 開始ステージ, 終了ステージ)
+INTERVALS = (
+    ("capture", "speech_start", "commit"),
+    ("commit_to_created", "commit", "response_created"),
+    ("created_to_first_delta", "response_created", "first_audio_delta"),
+    ("delta_to_audible", "first_audio_delta", "first_audible"),
+    ("commit_to_audible", "commit", "first_audible"),
+    ("response", "response_created", "response_done"),
+)
+
+
+class TurnTrace:
+    """1ターン (1応答) 分のステージ時刻。時刻は perf_counter_ns。"""
+
+    def __init__(self, response_id=None):
+        self.response_id = response_id
+        self.stamps = {}
+        self.status = None
+
+    def mark(self, stage, t_ns=None):
+        # 最初に到達した時刻だけを残す
+        if stage not in self.stamps:
+            self.stamps[stage] = t_ns if t_ns is not None else time.perf_counter_ns()
+
+    def intervals(self):
+        """区間ごとの秒数 (両端が記録されている区間のみ)。"""
+        result = {}
+        for name, begin, end in INTERVALS:
+            if begin in self.stamps and end in self.stamps:
+                result[name] = (self.stamps[end] - self.stamps[begin]) / 1e9
+        return result
+
+    def to_dict(self):
+        return {
+            "response_id": self.response_id,
+            "status": self.status,
+            "stamps_ns": self.stamps,
+            "intervals": self.intervals(),
+        }
+
+
+class TraceRecorder:
+    """
+    ターンごとのトレースを response_id で管理し、区間ごとの p50/p95/p99 を集計する。
+
+    - 発話開始〜コミットは応答IDが決まる前なので pending のトレースに記録し、
+      response.created で応答IDに紐付ける (発話への応答だけ。フォローアップは新しいトレース)
+    - 音声の再生開始は再生スレッドから item_id で通知されるので、item_id → response_id を覚えておく
+    - 短い応答では response.done の後に再生が始まるので、そのトレースは再生開始まで集計を待つ
+      (聞こえる前に次の発話が始まったら、バージインで捨てられるので status を unheard にして閉じる)
+    - jsonl_path を指定すると、完了したトレースを1行ずつ追記する
+    """
+
+    def __init__(self, window=500, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._pending = None
+        self._active = {}
+        self._awaiting_audible = {}
+        self._item_to_response = {}
+        self._histograms = {name: collections.deque(maxlen=window) for name, _, _ in INTERVALS}
+        self._lock = threading.Lock()
+        self.completed = collections.deque(maxlen=window)
+
+    def begin_turn(self, t_ns=None):
+        with self._lock:
+            self._pending = TurnTrace()
+            self._pending.mark("speech_start", t_ns)
+            unheard = list(self._awaiting_audible.values())
+            self._awaiting_audible.clear()
+            for trace in unheard:
+                trace.status = "unheard"
+                self._complete(trace)
+        for trace in unheard:
+            self._write_jsonl(trace)
+
+    def mark_pending(self, stage, t_ns=None):
+        with self._lock:
+            if self._pending is None:
+                self._pending = TurnTrace()
+            self._pending.mark(stage, t_ns)
+
+    def bind(self, response_id, for_turn=True, t_ns=None):
+        """
+        response.created で応答のトレースを始める。
+        for_turn (コミットした発話への応答) なら pending のトレースを引き継ぐ。
+        """
+        with self._lock:
+            if for_turn and self._pending is not None:
+                trace, self._pending = self._pending, None
+            else:
+                trace = TurnTrace()
+            trace.response_id = response_id
+            trace.mark("response_created", t_ns)
+            self._active[response_id] = trace
+            return trace
+
+    def mark(self, response_id, stage, item_id=None, t_ns=None):
+        with self._lock:
+            if item_id is not None:
+                self._item_to_response[item_id] = response_id
+            trace = self._active.get(response_id)
+            if trace is not None:
+                trace.mark(stage, t_ns)
+
+    def mark_item(self, item_id, stage, t_ns=None):
+        """item_id からトレースを引いて記録する (再生スレッドから呼ばれる)。"""
+        with self._lock:
+            response_id = self._item_to_response.get(item_id)
+            trace = self._active.get(response_id)
+            if trace is not None:
+                trace.mark(stage, t_ns)
+                return
+            trace = self._awaiting_audible.pop(response_id, None)
+            if trace is None:
+                return
+            trace.mark(stage, t_ns)
+            self._complete(trace)
+        self._write_jsonl(trace)
+
+    def mark_item_audible(self, item_id, t_ns=None):
+        self.mark_item(item_id, "first_audible", t_ns)
+
+    def finish(self, response_id, status=None, t_ns=None):
+        """response.done でトレースを閉じ、ヒストグラムに加える。"""
+        with self._lock:
+            trace = self._active.pop(response_id, None)
+            if trace is None:
+                return None
+            trace.mark("response_done", t_ns)
+            trace.status = status
+            if ("first_audio_delta" in trace.stamps and "first_audible" not in trace.stamps
+                    and status != "cancelled"):
+                # まだ再生が始まっていない。集計は再生開始の通知を待つ
+                self._awaiting_audible[response_id] = trace
+                return trace
+            self._complete(trace)
+        self._write_jsonl(trace)
+        return trace
+
+    def _complete(self, trace):
+        # 呼び出し側で self._lock を保持していること
+        for item_id in [k for k, v in self._item_to_response.items() if v == trace.response_id]:
+            del self._item_to_response[item_id]
+        for name, seconds in trace.intervals().items():
+            self._histograms[name].append(seconds)
+        self.completed.append(trace)
+
+    def _write_jsonl(self, trace):
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+    def percentiles(self, name, qs=(50, 95, 99)):
+        with self._lock:
+            values = sorted(self._histograms[name])
+        if not values:
+            return None
+        return {q: values[min(len(values) - 1, int(len(values) * q / 100))] for q in qs}
+
+    def dump_jsonl(self, path):
+        """保持している完了済みトレースを JSONL で書き出す。"""
+        with self._lock:
+            traces = list(self.completed)
+        with open(path, "w", encoding="utf-8") as f:
+            for trace in traces:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+
+def log_turn_trace(trace, recorder):
+    labels = {
+        "capture": "発話開始→コミット",
+        "commit_to_created": "コミット→応答開始",
+        "created_to_first_delta": "応答開始→最初の音声",
+        "delta_to_audible": "最初の音声→再生開始",
+        "commit_to_audible": "コミット→再生開始",
+        "response": "応答開始→応答完了",
+    }
+    intervals = trace.intervals()
+    for name, _, _ in INTERVALS:
+        if name not in intervals:
+            continue
+        line = f"  - {labels[name]}: {intervals[name]:.3f} 秒"
+        p = recorder.percentiles(name)
+        if p is not None:
+            line += f" (p50 {p[50]:.3f} / p95 {p[95]:.3f} / p99 {p[99]:.3f})"
+        print(line)
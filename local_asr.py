@@ -0,0 +1,268 @@
+"""
+端末上の Whisper (CPU) による逐次音声認識。ネットワークなしでロボットを動かすためのバックエンド。
+
+発話中は chunk_ms ごとに、発話の先頭からの音声をまとめて認識し直す。
+認識結果 (仮説) は直近2回で一致した先頭部分だけを確定する (LocalAgreement-2)。
+確定した部分は後から変わらないので、発話の途中でもコマンドの判定に使える。
+
+  FasterWhisperRecognizer  faster-whisper (任意の依存。使うときに import する)
+  StubRecognizer           台本の文字列を音声の長さに応じて少しずつ返す (モデルなしの動作確認用)
+
+認識器は transcribe(audio, prompt) で (単語, 開始秒, 終了秒) のリストを返す。
+audio は 16 kHz の float32、prompt はバッファの前までの確定済みテキスト。
+"""
+import bisect
+import collections
+import threading
+import time
+
+import numpy as np
+
+MODEL_RATE = 16000
+
+
+class FasterWhisperRecognizer:
+    def __init__(self, model_size="small", language="ja", compute_type="int8", beam_size=1, threads=0):
+        from faster_whisper import WhisperModel
+
+        self.language = language
+        self.beam_size = beam_size
+        self.model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+    def begin(self):
+        pass
+
+    def transcribe(self, audio, prompt=""):
+        segments, _ = self.model.transcribe(
+            audio,
+            language=self.language,
+            initial_prompt=prompt or None,
+            beam_size=self.beam_size,
+            word_timestamps=True,
+            condition_on_previous_text=True,
+        )
+        words = []
+        for segment in segments:
+            if segment.no_speech_prob > 0.9:
+                continue
+            words.extend((word.word, word.start, word.end) for word in segment.words)
+        return words
+
+
+class StubRecognizer:
+    """
+    発話ごとに transcripts を順番に (最後まで行ったら先頭から) 返す。
+    音声 chars_per_second 秒あたり1文字ずつ現れ、末尾の1文字は呼び出しごとに揺れる
+    (確定しない仮説の代わり)。1回の認識に音声の長さ × rtf 秒かかる。
+    """
+
+    def __init__(self, transcripts, chars_per_second=8.0, rtf=0.1):
+        self.transcripts = list(transcripts) or [""]
+        self.chars_per_second = chars_per_second
+        self.rtf = rtf
+        self._index = -1
+        self._text = ""
+        self._calls = 0
+
+    def begin(self):
+        self._index = (self._index + 1) % len(self.transcripts)
+        self._text = self.transcripts[self._index]
+
+    def transcribe(self, audio, prompt=""):
+        duration = len(audio) / MODEL_RATE
+        time.sleep(duration * self.rtf)
+        self._calls += 1
+        step = 1.0 / self.chars_per_second
+        # prompt の文字の分だけバッファが切り詰められている
+        skipped = len(prompt)
+        n = min(len(self._text), int(duration * self.chars_per_second) + skipped)
+        words = [
+            (ch, (i - skipped) * step, (i - skipped + 1) * step)
+            for i, ch in enumerate(self._text[skipped:n], start=skipped)
+        ]
+        if n < len(self._text) and self._calls % 2:
+            words.append(("…", (n - skipped) * step, (n - skipped + 1) * step))
+        return words
+
+
+class LocalAgreement:
+    """直近2回の仮説で一致した先頭部分を確定する。時刻は発話の先頭からの秒。"""
+
+    def __init__(self):
+        self.committed = []      # [(単語, 開始, 終了)]
+        self._previous = []
+        self.last_end = 0.0
+
+    def insert(self, words):
+        """新しい仮説を入れ、新たに確定した単語を返す。"""
+        new = [w for w in words if w[1] > self.last_end - 0.1]
+        # 確定済みの末尾と同じ単語で始まっていれば除く (認識し直しで重複した分)
+        if new and self.committed and abs(new[0][1] - self.last_end) < 1.0:
+            for n in range(min(len(self.committed), len(new), 5), 0, -1):
+                if [w[0] for w in self.committed[-n:]] == [w[0] for w in new[:n]]:
+                    new = new[n:]
+                    break
+        agreed = []
+        for current, previous in zip(new, self._previous):
+            if current[0] != previous[0]:
+                break
+            agreed.append(current)
+        self._previous = new[len(agreed):]
+        self._commit(agreed)
+        return agreed
+
+    def flush(self):
+        """発話の終わり。残りの仮説もすべて確定する。"""
+        rest, self._previous = self._previous, []
+        self._commit(rest)
+        return rest
+
+    def _commit(self, words):
+        self.committed.extend(words)
+        if words:
+            self.last_end = words[-1][2]
+
+
+class StreamingTranscriber:
+    """
+    発話の音声を受け取り、chunk_ms ごとに認識して確定したテキストを伸ばしていく。
+    insert() はイベントループから、process() / finish() は認識用のスレッドから呼ぶ。
+    insert() の arrived_at には音声を受け取った時刻を渡す (確定までの遅れの計測に使う)。
+    バッファが max_buffer_s を超えたら確定済みの所までを捨てる。
+    """
+
+    def __init__(self, recognizer, input_rate=24000, chunk_ms=500, max_buffer_s=15.0, history=200):
+        self.recognizer = recognizer
+        self.input_rate = input_rate
+        self.chunk_samples = int(MODEL_RATE * chunk_ms / 1000)
+        self.max_buffer_samples = int(MODEL_RATE * max_buffer_s)
+        self._lock = threading.Lock()
+        self._reset()
+
+        # 統計
+        self.decodes = 0
+        self.decode_time = 0.0       # 認識にかかった時間の合計
+        self.audio_time = 0.0        # 受け取った音声の長さの合計
+        self.latencies = collections.deque(maxlen=history)   # 音声を受け取ってから確定するまで (秒)
+
+    def begin(self):
+        """発話の開始。"""
+        self._reset()
+        self.recognizer.begin()
+
+    def _reset(self):
+        with self._lock:
+            self._chunks = []
+            self._samples = 0            # 発話の先頭からのサンプル数
+            self._offset = 0             # バッファの先頭 (発話の先頭からのサンプル数)
+            self._processed = 0
+            self._arrivals = ([], [])    # (サンプル数, 受け取った時刻)
+            self.agreement = LocalAgreement()
+
+    def insert(self, pcm16, arrived_at=None):
+        samples = np.frombuffer(pcm16, dtype=np.int16).astype(np.float32) / 32768.0
+        if self.input_rate != MODEL_RATE:
+            n = int(round(len(samples) * MODEL_RATE / self.input_rate))
+            positions = np.arange(n) * (self.input_rate / MODEL_RATE)
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+        with self._lock:
+            self._chunks.append(samples)
+            self._samples += len(samples)
+            self._arrivals[0].append(self._samples)
+            self._arrivals[1].append(arrived_at if arrived_at is not None else time.perf_counter())
+        self.audio_time += len(samples) / MODEL_RATE
+
+    def ready(self):
+        """前回の認識から chunk_ms 以上の音声が溜まったか。"""
+        return self._samples - self._processed >= self.chunk_samples
+
+    def process(self):
+        """溜まった音声を認識し、新たに確定したテキストを返す。"""
+        with self._lock:
+            if self._samples == self._offset:
+                return ""
+            audio = np.concatenate(self._chunks)
+            self._chunks = [audio]
+            self._processed = self._samples
+            offset = self._offset / MODEL_RATE
+        # 切り詰めてバッファから外れた確定済みのテキストは prompt として渡す
+        prompt = "".join(w for w, _, end in self.agreement.committed if end <= offset)
+
+        started = time.perf_counter()
+        words = self.recognizer.transcribe(audio, prompt)
+        finished = time.perf_counter()
+        self.decodes += 1
+        self.decode_time += finished - started
+
+        agreed = self.agreement.insert([(w, offset + s, offset + e) for w, s, e in words])
+        self._record_latency(agreed, finished)
+        self._trim()
+        return "".join(w for w, _, _ in agreed)
+
+    def finish(self):
+        """発話の終わり。残りの音声を認識し、確定していない仮説もすべて確定して返す。"""
+        added = self.process() if self._samples > self._processed else ""
+        rest = self.agreement.flush()
+        self._record_latency(rest, time.perf_counter())
+        return added + "".join(w for w, _, _ in rest)
+
+    def text(self):
+        return "".join(w for w, _, _ in self.agreement.committed)
+
+    def _record_latency(self, words, committed_at):
+        # 単語の終わりの音声を受け取った時刻から、確定した時刻まで
+        samples, arrived = self._arrivals
+        for _, _, end in words:
+            i = bisect.bisect_left(samples, int(end * MODEL_RATE))
+            if i < len(arrived):
+                self.latencies.append(committed_at - arrived[i])
+
+    def _trim(self):
+        with self._lock:
+            if self._samples - self._offset <= self.max_buffer_samples:
+                return
+            cut = min(int(self.agreement.last_end * MODEL_RATE), self._samples) - self._offset
+            if cut <= 0:
+                return
+            audio = np.concatenate(self._chunks)
+            self._chunks = [audio[cut:]]
+            self._offset += cut
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "decodes": self.decodes,
+            "audio_time": self.audio_time,
+            # 認識にかかった時間 / 音声の長さ (1 未満なら実時間に追いつける)
+            "rtf": self.decode_time / self.audio_time if self.audio_time else None,
+            "mean_decode": self.decode_time / self.decodes if self.decodes else None,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+def open_recognizer(spec):
+    """
+    LOCAL_ASR の指定から認識器を作る (モデルの読み込みに時間がかかるのでスレッドで呼ぶ)。
+      whisper[:<モデル>]   faster-whisper (既定のモデルは small)
+      stub:<文>|<文>...    StubRecognizer
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == "whisper":
+        return FasterWhisperRecognizer(arg or "small")
+    if kind == "stub":
+        return StubRecognizer(arg.split("|"))
+    raise ValueError(f"unknown LOCAL_ASR: {spec}")
+
+
+def log_asr_stats(transcriber):
+    s = transcriber.stats()
+    if not s["decodes"]:
+        return
+    line = (
+        f"[ASR] 認識 {s['decodes']} 回 (平均 {s['mean_decode'] * 1000:.0f} ms), "
+        f"音声 {s['audio_time']:.1f} 秒, RTF {s['rtf']:.2f}"
+    )
+    if s["latency_p50"] is not None:
+        line += f", 確定までの遅れ p50 {s['latency_p50'] * 1000:.0f} ms / 最大 {s['latency_max'] * 1000:.0f} ms"
+    print(line)
@@ -0,0 +1,223 @@
+"""
+クラウドの Realtime セッションの代わりに、端末上の音声認識 (local_asr) でロボットを動かす。
+
+送信側 (send_audio) はマイク入力を VAD で区切り、認識 (recognize) は別のタスクで行う。
+受信側 (receive_results) は認識結果からコマンドを判定して tool_dict の動作を実行する。
+確定した部分にコマンドが現れたら、発話の終わりを待たずに実行を始める。
+音声の応答はない (結果は表示するだけ)。
+
+    REALTIME_BACKEND=local LOCAL_ASR=whisper:small python realtime8.py
+    REALTIME_BACKEND=local LOCAL_ASR="stub:立って|お手" AUDIO_SOURCE=wav:test.wav python realtime8.py
+"""
+import asyncio
+import os
+import time
+
+import go2_tools
+from go2_tools import tool_dict
+from action_executor import log_action_record
+from vad import EnergyVAD, SPEECH_START, SPEECH_END
+from upload import UploadGate
+from intent_cache import normalize_transcript
+from local_asr import StreamingTranscriber, open_recognizer, log_asr_stats
+from audio_backends import open_source, terminate_pyaudio
+from startup import StartupOrchestrator, log_startup_report
+from robot_state import log_state_stats
+
+# 発話に含まれる言葉 -> ツール呼び出し (正規化した文字起こしに対して照合する)
+COMMANDS = [
+    (("立って", "立ち上が", "たって"), "StandUp", {}),
+    (("座って", "すわって", "おすわり", "お座り"), "SitDown", {}),
+    (("お手", "挨拶", "こんにちは"), "Hello", {}),
+    (("踊", "ダンス"), "Dance", {}),
+    (("ストレッチ", "伸びをして"), "Stretch", {}),
+    (("ハート",), "Heart", {}),
+    (("ジャンプ", "跳んで"), "FrontJump", {}),
+    (("バク転", "宙返り"), "FrontFlip", {}),
+    (("威嚇",), "FrontPounce", {}),
+    (("前に進", "前進"), "Move", {"x": 0.5}),
+    (("下がって", "後ろに", "バック"), "Move", {"x": -0.5}),
+    (("右を向", "右に回"), "Move", {"z": -1.57}),
+    (("左を向", "左に回"), "Move", {"z": 1.57}),
+    (("回って",), "Move", {"z": 3.14}),
+]
+
+
+def match_commands(text):
+    """文字起こしからツール呼び出しの列 [(name, kwargs)] を作る (発話の中の順番どおり)。"""
+    key = normalize_transcript(text)
+    found = []
+    for keywords, name, kwargs in COMMANDS:
+        if name not in tool_dict:
+            continue
+        for keyword in keywords:
+            keyword = normalize_transcript(keyword)
+            # 同じ指示を繰り返したら (「前に進んで、また前に進んで」) その回数だけ行う
+            start = key.find(keyword)
+            while start >= 0:
+                found.append((start, start + len(keyword), name, kwargs))
+                start = key.find(keyword, start + len(keyword))
+    # 重なった言葉 (「右に回って」の「回って」など) は先に始まる方だけ使う
+    calls = []
+    end = -1
+    for start, stop, name, kwargs in sorted(found, key=lambda f: (f[0], -f[1])):
+        if start < end:
+            continue
+        calls.append((name, dict(kwargs)))
+        end = stop
+    return calls
+
+
+async def send_audio(capture, input_rate, audio_queue):
+    """
+    マイク入力を VAD で区切り、発話の音声を audio_queue に積む。
+    認識は recognize() が別に行うので、このループは認識を待たない (キャプチャを止めない)。
+    """
+    vad = EnergyVAD(rate=input_rate)
+    # 発話の頭が欠けないよう、プリロールごと渡す
+    gate = UploadGate(bytes_per_ms=input_rate * 2 / 1000)
+
+    while True:
+        audio_data = await capture.read()
+        if audio_data is None:
+            print("\n[INFO] Audio source exhausted. Stopping send loop.")
+            break
+
+        vad_event = vad.process(audio_data)
+        if vad_event == SPEECH_START:
+            audio_queue.put_nowait(("start", None, None))
+        chunks, _ = gate.push(audio_data, vad_event, vad.silence_ms)
+        arrived_at = time.perf_counter()
+        for chunk in chunks:
+            # リングバッファのスロットは上書きされるのでコピーして渡す
+            audio_queue.put_nowait(("audio", bytes(chunk), arrived_at))
+        if vad_event == SPEECH_END:
+            audio_queue.put_nowait(("end", None, None))
+
+        await asyncio.sleep(0)
+    audio_queue.put_nowait(None)
+
+
+async def recognize(transcriber, audio_queue, results):
+    """
+    audio_queue の音声を認識器に渡し、確定したテキストを results に積む。
+    認識はスレッドで行う。認識中に届いた音声はまとめて取り出してから次の認識をする
+    (認識が追いつかなくても積み上げない)。
+    """
+    in_speech = False
+    finished = False
+    while not finished:
+        items = [await audio_queue.get()]
+        while not audio_queue.empty():
+            items.append(audio_queue.get_nowait())
+        for item in items:
+            if item is None:
+                finished = True
+                break
+            kind, chunk, arrived_at = item
+            if kind == "start":
+                transcriber.begin()
+                in_speech = True
+                await results.put(("start", ""))
+            elif kind == "audio":
+                transcriber.insert(chunk, arrived_at)
+            elif in_speech:
+                in_speech = False
+                await asyncio.to_thread(transcriber.finish)
+                await results.put(("final", transcriber.text()))
+        if in_speech and transcriber.ready():
+            if await asyncio.to_thread(transcriber.process):
+                await results.put(("partial", transcriber.text()))
+    await results.put(None)
+
+
+async def receive_results(results, executor):
+    """認識結果からコマンドを判定し、まだ実行していない動作を実行する。"""
+    dispatched = 0
+    tasks = set()
+    partial = ""
+
+    async def run(name, kwargs):
+        record = await executor.run(name, kwargs)
+        log_action_record(record, executor)
+
+    while True:
+        result = await results.get()
+        if result is None:
+            break
+        kind, text = result
+        if kind == "start":
+            # 「止まって」などに備え、待ち中・実行中のロボット動作を取り消す
+            if executor.preempt():
+                print("\n[ACTION] 発話を検出したのでロボット動作を中断しました。")
+            dispatched = 0
+            partial = ""
+            continue
+        if kind == "partial":
+            print(text[len(partial):] if text.startswith(partial) else text, end="", flush=True)
+            partial = text
+        else:
+            print(f"\nuser: {text}")
+        calls = match_commands(text)
+        # 確定したテキストは後から変わらないので、増えた分だけ実行する
+        for name, kwargs in calls[dispatched:]:
+            print(f"\n<Command> name: {name}, args: {kwargs}")
+            task = asyncio.create_task(run(name, kwargs))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        dispatched = max(dispatched, len(calls))
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def stream_audio_and_recognize(executor, init_robot, rate=24000, chunk=480):
+    """
+    stream_audio_and_receive_response のローカル版。
+    認識モデルの読み込み・マイクのオープン・ロボットの初期化を並行して進める。
+    """
+    #   LOCAL_ASR        whisper[:<モデル>] / stub:<文>|<文>...
+    #   LOCAL_ASR_CHUNK_MS  認識し直す間隔
+    asr_spec = os.environ.get("LOCAL_ASR", "whisper:small")
+    chunk_ms = int(os.environ.get("LOCAL_ASR_CHUNK_MS", "500"))
+    source_spec = os.environ.get("AUDIO_SOURCE", "pyaudio")
+    pacing = os.environ.get("AUDIO_PACING", "realtime")
+
+    def open_audio(loop):
+        source = open_source(source_spec, rate=rate, chunk=chunk, pacing=pacing)
+        source.start(loop)
+        return source
+
+    startup = StartupOrchestrator()
+    startup.stage("model", open_recognizer, asr_spec)
+    startup.stage("audio", open_audio, asyncio.get_running_loop())
+    startup.stage("robot", executor.warm_up, init_robot)
+
+    source = None
+    transcriber = None
+    try:
+        recognizer, source = await startup.wait("model", "audio")
+        startup.ready()
+        transcriber = StreamingTranscriber(recognizer, input_rate=rate, chunk_ms=chunk_ms)
+        print(f"\n[INFO] ローカル認識 ({asr_spec}) で待ち受けを始めます。\n")
+        log_startup_report(startup)
+
+        audio_queue = asyncio.Queue()
+        results = asyncio.Queue()
+        try:
+            await asyncio.gather(
+                send_audio(source, rate, audio_queue),
+                recognize(transcriber, audio_queue, results),
+                receive_results(results, executor),
+            )
+        except KeyboardInterrupt:
+            print("[INFO] KeyboardInterrupt caught. Exiting now...")
+    finally:
+        startup.cancel()
+        executor.shutdown()
+        go2_tools.motion.stop()
+        log_state_stats(go2_tools.state_monitor)
+        if transcriber is not None:
+            log_asr_stats(transcriber)
+        if source is not None:
+            source.close()
+        terminate_pyaudio()
@@ -0,0 +1,217 @@
+import collections
+import math
+import threading
+import time
+
+
+class Motion:
+    """
+    MotionController に渡した1つの移動。wait() で完了を待ち、cancel() で途中で止められる。
+    status は running / completed / cancelled / preempted / failed。
+    """
+
+    def __init__(self, velocity, durations):
+        self.velocity = velocity        # (vx, vy, vyaw)
+        self.durations = durations      # 軸ごとの指令時間 (秒)
+        self.status = "running"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+        self._cancel_requested = False
+        self._controller = None
+
+    def wait(self, timeout=None):
+        """完了したら True。"""
+        return self._done.wait(timeout)
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        if self._controller is not None:
+            self._controller.cancel(self)
+
+    def _finish(self, status, error=None):
+        if self._done.is_set():
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.perf_counter()
+        self._done.set()
+
+
+class MotionController:
+    """
+    速度指令 (client.Move) を専用の制御スレッドから一定周期で送る。
+
+    - 周期は開始時刻からの理想時刻に合わせるので sleep の誤差が積み上がらない
+      (1周期以上遅れたら、その分は飛ばして次の理想時刻に合わせる)
+    - x, y, yaw を同時に動かせる。軸ごとに必要な時間だけ指令し、終わった軸から 0 にする
+    - move() はすぐに戻る。新しい move() は実行中の移動を置き換える (preempted)
+    - cancel() / stop() で途中で止めると StopMove を送る
+    - 実際の指令レートと周期のジッターを記録する
+    """
+
+    def __init__(self, client_factory, rate_hz=100, max_speed=1.0, max_yaw_speed=2.0,
+                 history=1000):
+        self._client_factory = client_factory
+        self.period = 1.0 / rate_hz
+        self.max_speed = max_speed
+        self.max_yaw_speed = max_yaw_speed
+        self._cond = threading.Condition()
+        self._current = None
+        self._pending = None
+        self._stopping = False
+        self._thread = None
+
+        # 統計
+        self.commands = 0
+        self.late_ticks = 0                                 # 1周期以上遅れて飛ばした回数
+        self._intervals = collections.deque(maxlen=history)  # 実際の指令間隔 (秒)
+        self._active_time = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="motion-control", daemon=True)
+            self._thread.start()
+        return self
+
+    def move(self, vx=0.0, vy=0.0, vyaw=0.0, duration=1.0):
+        """全軸を同じ時間だけ一定速度で動かす。"""
+        return self._submit(Motion(self._clip(vx, vy, vyaw), (duration, duration, duration)))
+
+    def move_by(self, x=0.0, y=0.0, yaw=0.0, speed=None, yaw_speed=None):
+        """x(m), y(m), yaw(rad) だけ同時に動かす。各軸は speed / yaw_speed で進む。"""
+        speed = min(abs(speed or self.max_speed), self.max_speed)
+        yaw_speed = min(abs(yaw_speed or self.max_yaw_speed), self.max_yaw_speed)
+        velocity = (math.copysign(speed, x), math.copysign(speed, y), math.copysign(yaw_speed, yaw))
+        durations = (abs(x) / speed, abs(y) / speed, abs(yaw) / yaw_speed)
+        return self._submit(Motion(velocity, durations))
+
+    def cancel(self, motion=None):
+        """
+        実行中 (または motion を指定したらその) 移動を止める。
+        実行中の移動は制御スレッドが StopMove を送ってから完了になる。
+        """
+        with self._cond:
+            pending = self._pending
+            if pending is not None and (motion is None or pending is motion):
+                self._pending = None
+                pending._finish("cancelled")
+            current = self._current
+            if current is not None and (motion is None or current is motion):
+                current._cancel_requested = True
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _clip(self, vx, vy, vyaw):
+        clip = lambda v, limit: max(-limit, min(limit, v))
+        return (clip(vx, self.max_speed), clip(vy, self.max_speed), clip(vyaw, self.max_yaw_speed))
+
+    def _submit(self, motion):
+        motion._controller = self
+        with self._cond:
+            if self._pending is not None:
+                self._pending._finish("preempted")
+            self._pending = motion
+            self._cond.notify()
+        self.start()
+        return motion
+
+    def _run(self):
+        client = None
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    if self._pending is not None:
+                        self._pending._finish("cancelled")
+                    return
+                motion, self._pending = self._pending, None
+                if motion.done():
+                    continue
+                self._current = motion
+            try:
+                if client is None:
+                    client = self._client_factory()
+                self._drive(client, motion)
+            except Exception as e:
+                motion._finish("failed", e)
+            finally:
+                with self._cond:
+                    self._current = None
+
+    def _drive(self, client, motion):
+        motion.started_at = start = time.perf_counter()
+        ends = [start + d for d in motion.durations]
+        last_sent = None
+        tick = 0
+        status = None
+        try:
+            while not motion._cancel_requested and self._pending is None and not self._stopping:
+                now = time.perf_counter()
+                velocity = tuple(v if now < end else 0.0 for v, end in zip(motion.velocity, ends))
+                if not any(velocity):
+                    status = "completed"
+                    break
+                client.Move(*velocity)
+                sent = time.perf_counter()
+                if last_sent is not None:
+                    self._intervals.append(sent - last_sent)
+                last_sent = sent
+                self.commands += 1
+
+                # 次の理想時刻まで待つ (遅れていたら飛ばす)
+                tick += 1
+                deadline = start + tick * self.period
+                now = time.perf_counter()
+                if now - deadline > self.period:
+                    skipped = int((now - deadline) / self.period)
+                    self.late_ticks += skipped
+                    tick += skipped
+                    deadline = start + tick * self.period
+                with self._cond:
+                    if not motion._cancel_requested and self._pending is None and not self._stopping:
+                        self._cond.wait(max(0.0, deadline - time.perf_counter()))
+        finally:
+            client.StopMove()
+            self._active_time += time.perf_counter() - start
+        # 統計を更新してから完了を知らせる
+        if status is None:
+            status = "preempted" if self._pending is not None else "cancelled"
+        motion._finish(status)
+
+    def stats(self):
+        intervals = sorted(self._intervals)
+        result = {
+            "commands": self.commands,
+            "rate_hz": self.commands / self._active_time if self._active_time > 0 else 0.0,
+            "target_hz": 1.0 / self.period,
+            "late_ticks": self.late_ticks,
+            "jitter_p50": None,
+            "jitter_max": None,
+        }
+        if intervals:
+            errors = sorted(abs(i - self.period) for i in intervals)
+            result["jitter_p50"] = errors[len(errors) // 2]
+            result["jitter_max"] = errors[-1]
+        return result
+
+
+def log_motion_stats(controller):
+    s = controller.stats()
+    line = f"[MOTION] 指令 {s['commands']} 回, {s['rate_hz']:.1f} Hz (目標 {s['target_hz']:.0f} Hz)"
+    if s["jitter_p50"] is not None:
+        line += f", ジッター p50 {s['jitter_p50'] * 1000:.2f} ms / 最大 {s['jitter_max'] * 1000:.2f} ms"
+    if s["late_ticks"]:
+        line += f", 遅延で飛ばした周期 {s['late_ticks']}"
+    print(line)
@@ -0,0 +1,269 @@
+import binascii
+import collections
+import threading
+import time
+
+
+class AudioPlayer:
+    """
+    TTS音声の再生ステージ。
+    受信ループは feed() でPCMをジッタバッファに積むだけで、デバイスへの書き込みは
+    専用の再生スレッドが行う。サウンドカードが遅くても受信ループはブロックされない。
+
+    - 再生開始前に prebuffer_ms 分だけ溜めてから書き込みを始める (ジッタ吸収)
+    - 再生中にバッファが空になったらアンダーランとして数え、再度プリバッファする
+    - バッファ上限 (max_buffer_ms) に入りきらない分は破棄する
+
+    ジッタバッファは事前確保したリングバッファで、再生スレッドはリングの
+    memoryview をそのまま output_stream.write に渡す (結合やスライスのコピーをしない)。
+
+    バージイン用に、どのアイテム (item_id) を何ms再生したかを追跡し、
+    flush() で未再生の音声を捨てられる。
+    reference (EchoReference) を渡すと、デバイスに書き込んだ音声をエコーキャンセラの参照として記録する。
+    on_item_start(item_id, t_ns) は各アイテムの最初の音声をデバイスに渡す直前に再生スレッドから呼ばれる。
+    """
+
+    def __init__(self, output_stream, rate=24000, sample_width=2,
+                 prebuffer_ms=120, max_buffer_ms=60000, period_frames=1024, reference=None,
+                 on_item_start=None):
+        self.output_stream = output_stream
+        self.reference = reference
+        self.on_item_start = on_item_start
+        self.bytes_per_ms = rate * sample_width / 1000
+        self._prebuffer_bytes = int(prebuffer_ms * self.bytes_per_ms)
+        self._period_bytes = period_frames * sample_width
+
+        capacity = int(max_buffer_ms * self.bytes_per_ms)
+        capacity -= capacity % sample_width
+        self._capacity = capacity
+        self._ring = bytearray(capacity)
+        self._view = memoryview(self._ring)
+        # デバイスに渡すのは読み取り専用ビュー
+        self._read_view = self._view.toreadonly()
+        self._read_pos = 0
+        self._buffered = 0     # 未再生 (書き込み中を含む) のバイト数
+        self._in_flight = 0    # 再生スレッドがデバイスに書き込み中のバイト数
+        self._segments = collections.deque()  # [item_id, バイト数] (リング内の並び順)
+        self._playing_item = None
+        self._played_item_bytes = 0
+        self._started_item = None
+        self._discarded_items = collections.deque(maxlen=16)
+        self._flush_started = None
+
+        self._cond = threading.Condition()
+        self._playing = False
+        self._eos = False
+        self._stopped = False
+        self._thread = None
+
+        # 統計
+        self.underruns = 0
+        self.dropped_bytes = 0
+        self.max_depth_bytes = 0
+        self.decode_allocs = 0   # base64 デコードで生成した bytes の数
+        self.copy_bytes = 0      # リングへコピーしたバイト数
+        self.playback_views = 0  # 再生側の確保: 周期ごとに作るスライスの memoryview (PCM はコピーしない)
+        self.flush_latencies = []  # flush() から実際に書き込みが止まるまでの秒数
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tts-playback", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def feed(self, pcm, item_id=None):
+        """PCMをリングバッファにコピーする。ブロックしない。"""
+        if not pcm:
+            return
+        with self._cond:
+            if item_id is not None and item_id in self._discarded_items:
+                return
+            free = self._capacity - self._buffered
+            size = len(pcm)
+            if size > free:
+                # 書き込み中の領域を上書きできないので、入りきらない分は捨てる
+                self.dropped_bytes += size - free
+                size = free
+            if size:
+                src = memoryview(pcm)
+                write_pos = (self._read_pos + self._buffered) % self._capacity
+                first = min(size, self._capacity - write_pos)
+                self._view[write_pos:write_pos + first] = src[:first]
+                if first < size:
+                    self._view[:size - first] = src[first:size]
+                self._buffered += size
+                self.copy_bytes += size
+                if self._segments and self._segments[-1][0] == item_id:
+                    self._segments[-1][1] += size
+                else:
+                    self._segments.append([item_id, size])
+            if self._buffered > self.max_depth_bytes:
+                self.max_depth_bytes = self._buffered
+            self._cond.notify()
+
+    def feed_base64(self, base64_audio, item_id=None):
+        """
+        base64 の音声をデコードしてリングに積む。
+        binascii.a2b_base64 は str をそのまま受け取れるので、base64.b64decode のような
+        ASCII エンコードの中間コピーが発生しない。デコード結果はリングへの1回のコピーのみ。
+        """
+        pcm = binascii.a2b_base64(base64_audio)
+        with self._cond:
+            self.decode_allocs += 1
+        self.feed(pcm, item_id)
+
+    def flush(self, discard_item=None, requested_at=None):
+        """
+        未再生の音声を捨てる (書き込み中の1周期分だけは鳴り終わる)。
+        discard_item を指定すると、そのアイテムの音声が後から届いても捨てる。
+        requested_at (perf_counter) から書き込みが止まるまでを flush_latencies に記録する。
+        戻り値は再生中だったアイテムIDと、そのアイテムの再生済み時間 (ms)。
+        """
+        if requested_at is None:
+            requested_at = time.perf_counter()
+        with self._cond:
+            if discard_item is not None:
+                self._discarded_items.append(discard_item)
+
+            # 書き込み中の分だけ残す
+            keep = self._in_flight
+            segments = collections.deque()
+            for seg in self._segments:
+                if keep <= 0:
+                    break
+                size = min(seg[1], keep)
+                segments.append([seg[0], size])
+                keep -= size
+            self._segments = segments
+            self._buffered = self._in_flight
+            # 意図的に空にしたのでアンダーランとは数えない
+            self._eos = True
+
+            item_id = self._playing_item
+            played = self._played_item_bytes
+            if segments:
+                if segments[0][0] != item_id:
+                    item_id = segments[0][0]
+                    played = 0
+                played += segments[0][1]
+
+            if self._in_flight:
+                self._flush_started = requested_at
+            else:
+                self.flush_latencies.append(time.perf_counter() - requested_at)
+            self._cond.notify()
+            return item_id, played / self.bytes_per_ms
+
+    def end_of_stream(self):
+        """応答の音声が全て届いたことを通知する (残りをプリバッファ無しで再生する)。"""
+        with self._cond:
+            self._eos = True
+            self._cond.notify()
+
+    def depth_ms(self):
+        with self._cond:
+            return self._buffered / self.bytes_per_ms
+
+    def is_playing(self):
+        with self._cond:
+            return self._playing or self._buffered > 0
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth_ms": self._buffered / self.bytes_per_ms,
+                "max_depth_ms": self.max_depth_bytes / self.bytes_per_ms,
+                "underruns": self.underruns,
+                "dropped_bytes": self.dropped_bytes,
+                "decode_allocs": self.decode_allocs,
+                "copy_bytes": self.copy_bytes,
+                "playback_views": self.playback_views,
+            }
+
+    def reset_stats(self):
+        with self._cond:
+            self.underruns = 0
+            self.dropped_bytes = 0
+            self.max_depth_bytes = self._buffered
+            self.decode_allocs = 0
+            self.copy_bytes = 0
+            self.playback_views = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    if self._buffered >= self._prebuffer_bytes:
+                        break
+                    if self._buffered > 0 and (self._playing or self._eos):
+                        break
+                    if self._buffered == 0:
+                        if self._playing and not self._eos:
+                            self.underruns += 1
+                        elif self._eos:
+                            # 応答の再生完了
+                            self._eos = False
+                        self._playing = False
+                    self._cond.wait()
+                self._playing = True
+                # 連続した領域だけを渡す (折り返しは次の周回で書く)
+                pos = self._read_pos
+                size = min(self._period_bytes, self._buffered, self._capacity - pos)
+                self._in_flight = size
+                data = self._read_view[pos:pos + size]
+                self.playback_views += 1
+                new_item = None
+                if self._segments and self._segments[0][0] != self._started_item:
+                    new_item = self._started_item = self._segments[0][0]
+
+            if new_item is not None and self.on_item_start is not None:
+                self.on_item_start(new_item, time.perf_counter_ns())
+
+            if self.reference is not None:
+                self.reference.push(data, time.perf_counter())
+            self.output_stream.write(data)
+
+            with self._cond:
+                self._read_pos = (pos + size) % self._capacity
+                self._buffered -= size
+                self._in_flight = 0
+                self._account_played(size)
+                if self._flush_started is not None:
+                    self.flush_latencies.append(time.perf_counter() - self._flush_started)
+                    self._flush_started = None
+
+    def _account_played(self, size):
+        # 呼び出し側で self._cond を保持していること
+        while size > 0 and self._segments:
+            seg = self._segments[0]
+            n = min(seg[1], size)
+            if seg[0] != self._playing_item:
+                self._playing_item = seg[0]
+                self._played_item_bytes = 0
+            self._played_item_bytes += n
+            seg[1] -= n
+            size -= n
+            if seg[1] == 0:
+                self._segments.popleft()
+
+
+def log_playback_stats(player):
+    s = player.stats()
+    print(
+        f"  - 再生バッファ: 現在 {s['depth_ms']:.0f} ms / 最大 {s['max_depth_ms']:.0f} ms, "
+        f"アンダーラン {s['underruns']} 回, 破棄 {s['dropped_bytes']} バイト"
+    )
+    print(
+        f"  - 音声デコード: 確保 {s['decode_allocs']} 回, "
+        f"リングへのコピー {s['copy_bytes'] / 1024:.0f} KB"
+    )
+    print(f"  - 再生側の確保: memoryview {s['playback_views']} 個 (デバイスへの書き込みごとに1個)")
+    if player.flush_latencies:
+        print(f"  - バージイン (発話検出→無音): {player.flush_latencies[-1] * 1000:.0f} ms")
@@ -10,7 +10,8 @@ import os
 import sys
 import time
 from pynput import keyboard
-from go2_tools import tools, tool_dict
+# 引数を渡さずに呼ぶので、引数なしのツールだけを使う
+from go2_tools import legacy_tools as tools, legacy_tool_dict as tool_dict
 
 shift_pressed = False
 
@@ -7,7 +7,8 @@ import os
 import sys
 import time
 import audioop  # 無音検出用
-from go2_tools import tools, tool_dict
+# 引数を渡さずに呼ぶので、引数なしのツールだけを使う
+from go2_tools import legacy_tools as tools, legacy_tool_dict as tool_dict
 
 # タイミング計測用の辞書
 timing_info = {
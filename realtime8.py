@@ -1,340 +1,747 @@
 import asyncio
-import websockets
-import pyaudio
+import collections
 import base64
 import json
 import os
 import sys
 import time
-import audioop  # 無音検出用
-from go2_tools_test import tools, tool_dict
-
-# タイミング計測用の辞書
-timing_info = {
-    "audio_capture_start": None,
-    "audio_capture_end": None,
-    "commit_time": None,
-    "response_created_time": None,
-    "response_done_time": None,
-    "function_call_start_time": None,
-    "function_call_end_time": None,
-
-    # 追加: TTS関係のタイミング
-    "tts_generation_start_time": None,
-    "tts_generation_end_time": None,
-    "tts_playback_start_time": None,
-    "tts_playback_end_time": None,
+import go2_tools
+from go2_tools import tools, tool_dict, priorities, registry
+from tool_registry import ToolArgumentError
+from action_executor import ActionExecutor, log_action_record
+from playback import AudioPlayer, log_playback_stats
+from vad import EnergyVAD, SPEECH_START, SPEECH_END
+from upload import UploadGate, AppendBatcher, UtteranceBuffer, log_upload_stats
+from dispatcher import EventDispatcher, AUDIO_DELTA_TYPE
+from echo_cancel import EchoReference, EchoCanceller, log_echo_stats
+from latency_trace import TraceRecorder, log_turn_trace
+from audio_backends import open_source, open_sink, list_pyaudio_devices, terminate_pyaudio
+from connection import ConnectionSupervisor, log_connection_stats
+from startup import StartupOrchestrator, log_startup_report
+from robot_state import log_state_stats
+from followup import FollowUpPolicy, log_follow_up_stats
+from intent_cache import IntentCache, log_intent_stats
+
+DEFAULT_WS_URL = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+
+# 音声フォーマット (PCM16 モノラル)
+RATE = 24000
+CHANNELS = 1
+# キャプチャ単位 (VADの粒度) とアップロード単位は独立に設定できる
+CHUNK = 480                 # 20 ms
+PLAYBACK_CHUNK = 1024
+UPLOAD_INTERVAL_MS = 100    # append をまとめる間隔
+UPLOAD_MAX_BYTES = 32768    # 1メッセージの上限
+OUTAGE_BUFFER_MS = 15000    # 切断中に保持する発話音声の上限
+
+# 引数なしのツールは response.output_item.added の時点で実行を始める (REALTIME_EARLY_DISPATCH=0 で無効)
+EARLY_DISPATCH = os.environ.get("REALTIME_EARLY_DISPATCH", "1") != "0"
+# 完了を待たずに「開始しました」を function_call_output として返す (REALTIME_EARLY_ACCEPT=1 で有効)
+EARLY_ACCEPT = os.environ.get("REALTIME_EARLY_ACCEPT", "0") == "1"
+# ツール呼び出しの後の response.create の方針 (always / aggregate / on_failure / never。followup を参照)
+FOLLOW_UP = os.environ.get("REALTIME_FOLLOW_UP", "aggregate")
+# 入力音声を文字起こしし、前回モデルが選んだ動作を先に実行する (REALTIME_INTENT_CACHE=0 で無効)
+INTENT_CACHE = os.environ.get("REALTIME_INTENT_CACHE", "1") != "0"
+TRANSCRIBE_MODEL = os.environ.get("REALTIME_TRANSCRIBE_MODEL", "whisper-1")
+INTENT_MIN_HITS = int(os.environ.get("REALTIME_INTENT_MIN_HITS", "2"))
+
+# ロボットのバックエンド (GO2_BACKEND=real で実機。インターフェース等は go2_tools を参照)
+go2_tools.configure(backend=os.environ.get("GO2_BACKEND", "stub"))
+
+# ターンごとのレイテンシトレース (REALTIME_TRACE_FILE を指定すると JSONL に追記)
+turn_traces = TraceRecorder(jsonl_path=os.environ.get("REALTIME_TRACE_FILE"))
+
+# 応答の状態 (send_audio のバージイン判定で参照する)
+response_state = {
+    "response_id": None,     # 生成中の応答
+    "requested": False,      # response.create を送って response.created を待っている
+    "audio_item_id": None,   # 最後に音声を受け取ったアイテム
+    "cancel_pending": False, # response.created 前にバージインした。作られたらすぐ取り消す
+    "discard_response": None,  # 取り消した応答 (遅れて届く音声は再生しない)
+    # 送った response.create の順に、発話への応答なら True、フォローアップなら False
+    # (response.created は送った順に届くので、どちらの応答かをここから決める)
+    "creates": collections.deque(),
 }
 
-def tool_handler(tool_name, args=None):
-    """
-    ロボット動作を実行する関数。
-    ログの表示は行わず、function_callの開始・終了時刻のみ記録する。
-    """
-    timing_info["function_call_start_time"] = time.time()
-    tool_dict[tool_name]()  # ここで実際のツール(ロボット行動等)を実行
-    timing_info["function_call_end_time"] = time.time()
-    # log_timing_info() は呼ばない
-
-def base64_to_pcm16(base64_audio):
-    audio_data = base64.b64decode(base64_audio)
-    return audio_data
+# 発話中の音声 (再接続したら先頭から送り直す)
+utterance_buffer = UtteranceBuffer(max_ms=OUTAGE_BUFFER_MS, bytes_per_ms=RATE * 2 / 1000)
+
+# ロボット動作は専用ワーカーで実行し、イベントループを止めない
+# (優先度つきの待ち行列。新しい発話で待ち中・実行中の動作を取り消す)
+action_executor = ActionExecutor(tool_dict, priorities=priorities, cancel=go2_tools.cancel)
+# 実行中のツール呼び出しタスク (GCで消えないよう参照を保持)
+pending_tool_tasks = set()
+# 引数を待たずに実行できるツール (スキーマに引数がない)
+argument_free_tools = {name for name in tool_dict if not registry.takes_arguments(name)}
+# 早期実行した呼び出し (call_id -> 受信時刻と実行タスク)。引数の確定 (arguments.done) で引き取る
+early_calls = {}
+# 早期実行で動作開始が arguments.done より何秒早まったか
+early_dispatch_leads = collections.deque(maxlen=100)
+# 応答ごとに呼び出しの結果を集め、フォローアップの生成を送るか決める
+follow_up = FollowUpPolicy(FOLLOW_UP)
+# 発話の文字起こし -> モデルが選んだツール呼び出し
+intent_cache = IntentCache(capacity=128, min_hits=INTENT_MIN_HITS)
+# 直近にコミットした発話と、それに応えた応答の呼び出し
+intent_turn = {
+    "item_id": None,         # コミットした入力のアイテム
+    "transcript": None,      # その文字起こし
+    "response_id": None,     # コミット後の最初の応答
+    "calls": [],             # 応答の呼び出し [(name, kwargs)] (応答が中断されたら None)
+    "done": False,           # 応答の response.done を受けた
+    "dispatched": [],        # キャッシュから先に実行した呼び出し (モデルの呼び出しが引き取る)
+}
 
-def log_timing_info():
-    print("\n----- 処理時間計測ログ -----")
+def log_early_dispatch(record, added_at, args_done_at):
+    if record["started_at"] is None:
+        return
+    lead = args_done_at - record["started_at"]
+    early_dispatch_leads.append(lead)
+    mean = sum(early_dispatch_leads) / len(early_dispatch_leads)
+    print(
+        f"[EARLY] {record['name']}: 引数確定より {lead * 1000:.0f} ms 早く動作開始 "
+        f"(item 受信→開始 {(record['started_at'] - added_at) * 1000:.0f} ms, "
+        f"平均 {mean * 1000:.0f} ms / {len(early_dispatch_leads)} 回)"
+    )
+
+def new_intent_turn(item_id):
+    intent_turn.update(
+        item_id=item_id, transcript=None, response_id=None, calls=[], done=False, dispatched=[]
+    )
+
+def dispatch_from_intent_cache(transcript):
+    """確かな呼び出しがキャッシュにあれば、モデルの function call を待たずに実行を始める。"""
+    calls = intent_cache.lookup(transcript)
+    if calls is None:
+        return
+    for name, kwargs in calls:
+        task = asyncio.create_task(action_executor.run(name, kwargs))
+        pending_tool_tasks.add(task)
+        task.add_done_callback(pending_tool_tasks.discard)
+        intent_turn["dispatched"].append(
+            {"name": name, "kwargs": kwargs, "task": task, "added_at": time.perf_counter()}
+        )
+    intent_cache.mark_dispatched()
+    print(f"\n[INTENT] 「{transcript}」→ {', '.join(name for name, _ in calls)} を先に実行します。")
+
+def claim_intent_dispatch(name, kwargs):
+    """モデルの呼び出しと同じものをキャッシュから実行していれば、それを引き取る。"""
+    for entry in intent_turn["dispatched"]:
+        if entry["name"] == name and entry["kwargs"] == kwargs:
+            intent_turn["dispatched"].remove(entry)
+            return {"added_at": entry["added_at"], "task": entry["task"], "log": log_intent_lead}
+    return None
+
+def log_intent_lead(record, added_at, args_done_at):
+    if record["started_at"] is None:
+        return
+    lead = args_done_at - record["started_at"]
+    intent_cache.add_lead(lead)
+    print(f"[INTENT] {record['name']}: 引数確定より {lead * 1000:.0f} ms 早く動作開始")
 
-    # 1. 音声取得時間
-    if timing_info["audio_capture_start"] and timing_info["audio_capture_end"]:
-        audio_time = timing_info["audio_capture_end"] - timing_info["audio_capture_start"]
-        print(f"  - 音声取得時間: {audio_time:.3f} 秒")
+def learn_intent():
+    """文字起こしと応答の呼び出しが揃ったらキャッシュに覚える。"""
+    if intent_turn["transcript"] is None or not intent_turn["done"]:
+        return
+    if intent_turn["calls"] is not None:
+        # 先に実行したのにモデルが選ばなかった呼び出しがあれば外れ
+        if intent_turn["dispatched"]:
+            intent_cache.mark_mismatch(intent_turn["transcript"])
+            names = ", ".join(entry["name"] for entry in intent_turn["dispatched"])
+            print(f"[INTENT] 「{intent_turn['transcript']}」: モデルは {names} を選びませんでした。")
+        intent_cache.learn(intent_turn["transcript"], intent_turn["calls"])
+    intent_turn["dispatched"] = []
+    intent_turn["transcript"] = None
+
+async def send_function_output(link, call_id, output):
+    func_event = {
+        "type": "conversation.item.create",
+        "item": {
+            "type": "function_call_output",
+            "call_id": call_id,
+            "output": output
+        }
+    }
+    return await link.send(json.dumps(func_event))
 
-    # 2. 音声コミット後～LLM応答開始
-    if timing_info["commit_time"] and timing_info["response_created_time"]:
-        text_conversion_time = timing_info["response_created_time"] - timing_info["commit_time"]
-        print(f"  - 音声→テキスト変換＆LLM初期処理時間: {text_conversion_time:.3f} 秒")
+async def request_follow_up(link):
+    """ツールの結果を受けた応答を生成させる。"""
+    if not await link.send(json.dumps({"type": "response.create"})):
+        print("[WARN] The connection was lost before response.create.")
+        return
+    follow_up.requested()
+    response_state["requested"] = True
+    response_state["creates"].append(False)
 
-    # 3. 応答生成開始～応答完了 (LLM推論)
-    if timing_info["response_created_time"] and timing_info["response_done_time"]:
-        llm_analysis_time = timing_info["response_done_time"] - timing_info["response_created_time"]
-        print(f"  - LLM解析(推論)時間: {llm_analysis_time:.3f} 秒")
+async def tool_handler(link, tool_name, args, call_id, response_id=None, early=None):
+    """
+    ロボット動作をワーカーで実行し、完了したら function_call_output を返す。
+    実行中も receive_audio は音声の受信・再生を続けられる。
+    early は output_item.added で実行を始めていた呼び出し (実行タスクを引き継ぐ)。
+    response.create を送るかどうかは follow_up の方針で決める。
+    """
+    args_done_at = time.perf_counter()
+    if early is not None:
+        run = early["task"]
+    else:
+        try:
+            kwargs = registry.convert(tool_name, args)
+        except ToolArgumentError as e:
+            # 実行せずに理由を返し、モデルに呼び直させる
+            print(f"\n[ACTION] {e}")
+            sent = await send_function_output(link, call_id, f"引数が正しくありません: {e}")
+            if follow_up.call_finished(response_id, call_id, "invalid") and sent:
+                await request_follow_up(link)
+            return
+        run = action_executor.run(tool_name, kwargs)
+
+    if EARLY_ACCEPT:
+        # 受け付けたことだけを返し、完了はログに残す (モデルの応答は待たせない)
+        if not await send_function_output(link, call_id, "動作を開始しました。"):
+            print("[WARN] The connection was lost before function_call_output.")
+        # 受け付けただけの結果では応答を作らないが、同じ応答の他の呼び出しは待たせない
+        if follow_up.call_finished(response_id, call_id, "accepted"):
+            await request_follow_up(link)
+        record = await run
+        log_action_record(record, action_executor)
+        if early is not None:
+            early.get("log", log_early_dispatch)(record, early["added_at"], args_done_at)
+        return
 
-    # 4. ツール(ロボット動作)実行時間
-    if timing_info["function_call_start_time"] and timing_info["function_call_end_time"]:
-        robot_action_time = timing_info["function_call_end_time"] - timing_info["function_call_start_time"]
-        print(f"  - ロボット行動実行時間: {robot_action_time:.3f} 秒")
+    record = await run
+    log_action_record(record, action_executor)
+    if early is not None:
+        early.get("log", log_early_dispatch)(record, early["added_at"], args_done_at)
+
+    status = record["status"]
+    if status == "completed":
+        # 戻り値のあるツール (Sequence の各手順の結果など) はそれを返す
+        output = record["result"] if isinstance(record["result"], str) else "正常に動作しました。"
+    elif status == "failed":
+        output = f"動作に失敗しました: {record['error']}"
+    elif status == "cancelled":
+        output = "ユーザーが話し始めたので動作を中断しました。"
+        if isinstance(record["result"], str):
+            # Sequence はどの手順まで行ったかを返す
+            output += record["result"]
+    elif status == "dropped":
+        output = "他の動作が詰まっていたため実行しませんでした。"
+    else:
+        output = "同じ動作と一緒に実行しました。"
+    # 切断をまたいだ呼び出しの結果は新しいセッションでは意味がないので捨てる
+    # (follow_up も切断で reset されるので応答は作らない)
+    sent = await send_function_output(link, call_id, output)
+    if not sent:
+        print("[WARN] The connection was lost before function_call_output.")
+    # 中断 (新しい発話への応答が続く) とまとめ実行 (元の呼び出しが応答を作る) では応答を作らない
+    if follow_up.call_finished(response_id, call_id, status) and sent:
+        await request_follow_up(link)
+
+def log_timing_info(trace, player=None):
+    print("\n----- 処理時間計測ログ -----")
 
-    # 追加: TTS生成時間
-    if timing_info["tts_generation_start_time"] and timing_info["tts_generation_end_time"]:
-        tts_gen_time = timing_info["tts_generation_end_time"] - timing_info["tts_generation_start_time"]
-        print(f"  - TTS生成時間: {tts_gen_time:.3f} 秒")
+    # ターン内の各区間 (括弧内は直近のターンの分布)
+    if trace is not None:
+        log_turn_trace(trace, turn_traces)
 
-    # 追加: TTS再生時間
-    if timing_info["tts_playback_start_time"] and timing_info["tts_playback_end_time"]:
-        tts_playback_time = timing_info["tts_playback_end_time"] - timing_info["tts_playback_start_time"]
-        print(f"  - TTS再生時間: {tts_playback_time:.3f} 秒")
+    # 追加: 再生バッファの状態
+    if player is not None:
+        log_playback_stats(player)
+        player.reset_stats()
 
     print("--------------------------\n")
 
-def reset_timing_info():
+async def receive_audio(link, player):
     """
-    次回計測に備えて timing_info をリセットする場合に使用。
-    必要なければ呼ばなくても良い。
+    サーバイベントを type ごとのハンドラで処理する。
+    response.audio.delta は dispatcher の高速経路で delta だけを取り出す。
     """
-    global timing_info
-    timing_info = {
-        "audio_capture_start": None,
-        "audio_capture_end": None,
-        "commit_time": None,
-        "response_created_time": None,
-        "response_done_time": None,
-        "function_call_start_time": None,
-        "function_call_end_time": None,
-
-        # TTS関連もリセット
-        "tts_generation_start_time": None,
-        "tts_generation_end_time": None,
-        "tts_playback_start_time": None,
-        "tts_playback_end_time": None,
-    }
-
-async def receive_audio(websocket, output_stream):
-    loop = asyncio.get_event_loop()
-    partial_transcript = ""
-    response_in_progress = False
+    dispatcher = EventDispatcher()
+    state = {"partial_transcript": "", "response_in_progress": False}
+
+    def discarded(response_id):
+        # バージインで取り消した応答のイベントは (ツール呼び出しも含めて) 使わない
+        return response_id is not None and response_id == response_state["discard_response"]
+
+    # --- ツール呼び出しの開始 (引数なしのツールはここで実行を始める) ---
+    @dispatcher.on("response.output_item.added")
+    def on_output_item_added(response_data):
+        item = response_data.get("item", {})
+        if not EARLY_DISPATCH or item.get("type") != "function_call":
+            return
+        if discarded(response_data.get("response_id")):
+            return
+        if item.get("name") not in argument_free_tools:
+            return
+        # 文字起こしからすでに実行を始めていればそれを使う
+        early = claim_intent_dispatch(item["name"], {})
+        if early is None:
+            task = asyncio.create_task(action_executor.run(item["name"]))
+            pending_tool_tasks.add(task)
+            task.add_done_callback(pending_tool_tasks.discard)
+            early = {"added_at": time.perf_counter(), "task": task}
+        early_calls[item["call_id"]] = dict(early, response_id=response_data.get("response_id"))
+
+    # --- ツール呼び出し ---
+    @dispatcher.on("response.function_call_arguments.done")
+    def on_function_call(response_data):
+        func_name = response_data["name"]
+        args = response_data["arguments"]
+        call_id = response_data["call_id"]
+        response_id = response_data.get("response_id")
+        if discarded(response_id):
+            return
+        early = early_calls.pop(call_id, None)
+        # response.done より前に登録しておく (応答の呼び出しが出揃ったかの判定に使う)
+        follow_up.add_call(response_id, call_id)
+        try:
+            kwargs = registry.convert(func_name, args)
+        except ToolArgumentError:
+            kwargs = None
+        if kwargs is not None:
+            if response_id == intent_turn["response_id"] and intent_turn["calls"] is not None:
+                intent_turn["calls"].append((func_name, kwargs))
+            duplicate = claim_intent_dispatch(func_name, kwargs)
+            if early is None:
+                early = duplicate
+            elif duplicate is not None and action_executor.withdraw(func_name, kwargs):
+                # output_item.added で実行を始めた動作をキャッシュからも積んでいた
+                print(f"\n[INTENT] {func_name}: 早期実行と重なったので取り下げました。")
+        # 完了を待たずに受信ループへ戻る
+        task = asyncio.create_task(tool_handler(link, func_name, args, call_id, response_id, early))
+        pending_tool_tasks.add(task)
+        task.add_done_callback(pending_tool_tasks.discard)
+        print(f"<FunctionCalling> name: {func_name}, args: {args}", end="")
+
+    # --- 応答開始 ---
+    @dispatcher.on("response.created")
+    async def on_response_created(response_data):
+        response_id = response_data.get("response", {}).get("id")
+        creates = response_state["creates"]
+        for_turn = creates.popleft() if creates else False
+        response_state["requested"] = bool(creates)
+        if response_state["cancel_pending"]:
+            # ユーザーが話し始めた後に作られた古い応答。トレースにも紐付けずに取り消す
+            response_state["cancel_pending"] = False
+            response_state["discard_response"] = response_id
+            await link.send(json.dumps({"type": "response.cancel", "response_id": response_id}))
+            print("\n[BARGE-IN] 発話の後に作られた応答を取り消しました。")
+            return
+        response_state["response_id"] = response_id
+        # 発話の区間 (発話開始・コミット) はその発話への応答にだけ引き継ぐ
+        turn_traces.bind(response_id, for_turn)
+        follow_up.response_created(response_id)
+        if for_turn and intent_turn["item_id"] is not None and intent_turn["response_id"] is None:
+            intent_turn["response_id"] = response_id
+
+        if not state["response_in_progress"]:
+            print("assistant: ", end="", flush=True)
+            state["response_in_progress"] = True
+
+    # --- 応答途中 (テキスト) ---
+    @dispatcher.on("response.audio_transcript.delta")
+    def on_transcript_delta(response_data):
+        if discarded(response_data.get("response_id")):
+            return
+        new_transcript = response_data["delta"]
+        partial_transcript = state["partial_transcript"]
+        if new_transcript.startswith(partial_transcript):
+            added_text = new_transcript[len(partial_transcript):]
+            print(added_text, end="", flush=True)
+        else:
+            print(new_transcript, end="", flush=True)
+        state["partial_transcript"] = new_transcript
+
+    # --- 応答終了 ---
+    @dispatcher.on("response.done")
+    def on_response_done(response_data):
+        response = response_data.get("response", {})
+        if discarded(response.get("id")):
+            response_state["discard_response"] = None
+            return
+        trace = turn_traces.finish(response.get("id"), response.get("status"))
+        # 引数が確定しないまま終わった (キャンセルされた) 応答の早期実行は引き取り手がいない
+        for call_id in [k for k, v in early_calls.items() if v["response_id"] == response.get("id")]:
+            del early_calls[call_id]
+        response_state["response_id"] = None
+        follow_up.response_finished(response.get("id"))
+        if response.get("id") == intent_turn["response_id"]:
+            intent_turn["done"] = True
+            if response.get("status") != "completed":
+                # 中断された応答の呼び出しは覚えない
+                intent_turn["calls"] = None
+            learn_intent()
+        # 呼び出しが出揃った。すでに全部終わっていればここでフォローアップを送る
+        if follow_up.response_done(response.get("id")):
+            task = asyncio.create_task(request_follow_up(link))
+            pending_tool_tasks.add(task)
+            task.add_done_callback(pending_tool_tasks.discard)
+
+        # 残りの音声はプリバッファを待たずに再生させる
+        player.end_of_stream()
+
+        print()  # 改行
+
+        state["partial_transcript"] = ""
+        state["response_in_progress"] = False
+
+        # ここでログを表示
+        log_timing_info(trace, player)
+
+    # --- 入力音声のコミット (ここから次のターン) ---
+    @dispatcher.on("input_audio_buffer.committed")
+    def on_committed(response_data):
+        new_intent_turn(response_data.get("item_id"))
+
+    # --- 入力音声の文字起こし ---
+    @dispatcher.on("conversation.item.input_audio_transcription.completed")
+    def on_input_transcript(response_data):
+        if response_data.get("item_id") != intent_turn["item_id"]:
+            return
+        transcript = response_data.get("transcript", "").strip()
+        print(f"\nuser: {transcript}")
+        intent_turn["transcript"] = transcript
+        # モデルがまだ何も呼んでいなければキャッシュから先に実行する
+        # (output_item.added で実行を始めた呼び出しがあれば、モデルはもう選んでいる)
+        started = any(
+            early["response_id"] == intent_turn["response_id"] for early in early_calls.values()
+        )
+        if INTENT_CACHE and not intent_turn["done"] and not intent_turn["calls"] and not started:
+            dispatch_from_intent_cache(transcript)
+        learn_intent()
+
+    # --- エラー ---
+    @dispatcher.on("error")
+    def on_error(response_data):
+        print(f"[ERROR from server] {response_data['error']}")
+
+    # --- 音声応答 (TTS) ---
+    @dispatcher.on(AUDIO_DELTA_TYPE)
+    def on_audio_delta(response_data):
+        if discarded(response_data.get("response_id")):
+            return
+        item_id = response_data.get("item_id")
+        # 最初のチャンクだけが記録される (再生開始は再生スレッドが item_id で通知する)
+        turn_traces.mark(response_data.get("response_id"), "first_audio_delta", item_id)
+        response_state["audio_item_id"] = item_id
+
+        base64_audio_response = response_data["delta"]
+        if base64_audio_response:
+            # リングバッファへ直接デコードして再生スレッドに渡す (デバイスへの書き込みは待たない)
+            player.feed_base64(base64_audio_response, item_id)
 
     while True:
-        try:
-            response = await websocket.recv()
-        except websockets.ConnectionClosed:
-            print("[WARN] The server closed the connection. Stopping receive loop.")
-            break
+        # 切断中は再接続されるまで待つ
+        response = await link.recv()
+        await dispatcher.dispatch(response)
 
-        response_data = json.loads(response)
-
-        # --- ツール呼び出し ---
-        if response_data.get("type") == "response.function_call_arguments.done":
-            func_name = response_data["name"]
-            args = response_data["arguments"]
-            call_id = response_data["call_id"]
-            tool_handler(func_name)
-            func_event = {
-                "type": "conversation.item.create",
-                "item": {
-                    "type": "function_call_output",
-                    "call_id": call_id,
-                    "output": "正常に動作しました。"
-                }
-            }
-            await websocket.send(json.dumps(func_event))
-            await websocket.send(json.dumps({"type": "response.create"}))
-            print(f"<FunctionCalling> name: {func_name}, args: {args}", end="")
-
-        # --- 応答開始 ---
-        elif response_data.get("type") == "response.created":
-            timing_info["response_created_time"] = time.time()
-
-            if not response_in_progress:
-                print("assistant: ", end="", flush=True)
-                response_in_progress = True
-
-        # --- 応答途中 (テキスト) ---
-        elif response_data.get("type") == "response.audio_transcript.delta":
-            new_transcript = response_data["delta"]
-            if new_transcript.startswith(partial_transcript):
-                added_text = new_transcript[len(partial_transcript):]
-                print(added_text, end="", flush=True)
-            else:
-                print(new_transcript, end="", flush=True)
-            partial_transcript = new_transcript
-
-        # --- 応答終了 ---
-        elif response_data.get("type") == "response.done":
-            timing_info["response_done_time"] = time.time()
-
-            # TTS再生が終わったとみなすので、ここで記録
-            if timing_info["tts_playback_start_time"] is not None:
-                timing_info["tts_playback_end_time"] = time.time()
-
-            print()  # 改行
-
-            partial_transcript = ""
-            response_in_progress = False
-
-            # ここでログを表示
-            log_timing_info()
-
-        # --- エラー ---
-        elif response_data.get("type") == "error":
-            print(f"[ERROR from server] {response_data['error']}")
-
-        # --- 音声応答 (TTS) ---
-        if response_data.get("type") == "response.audio.delta":
-            # TTS生成開始・終了時刻を計測
-            if timing_info["tts_generation_start_time"] is None:
-                # 最初のチャンクを受け取った瞬間に開始時間を記録
-                timing_info["tts_generation_start_time"] = time.time()
-                # 再生開始時間も同時に記録
-                timing_info["tts_playback_start_time"] = time.time()
-
-            # チャンク毎に終了時刻を更新（最後に受け取ったタイミング）
-            timing_info["tts_generation_end_time"] = time.time()
-
-            base64_audio_response = response_data["delta"]
-            if base64_audio_response:
-                pcm16_audio = base64_to_pcm16(base64_audio_response)
-                await loop.run_in_executor(None, output_stream.write, pcm16_audio)
-
-async def send_audio(websocket, stream, CHUNK):
+async def barge_in(link, player):
     """
-    ユーザの音声を常時取得し、無音判定で区切ってサーバに送る
+    応答の再生中にユーザが話し始めたら、再生を止めて応答をキャンセルする。
+    アシスタントのアイテムは実際に聞こえた所までで切り詰める。
     """
-    timing_info["audio_capture_start"] = time.time()
-
-    SILENCE_THRESHOLD = 1200
-    MIN_SILENCE_CHUNKS = 20
-
-    in_session = False
-    silence_count = 0
+    detected_at = time.perf_counter()
+    # まずスピーカーを止める (ネットワーク送信より先)
+    item_id, played_ms = player.flush(
+        discard_item=response_state["audio_item_id"], requested_at=detected_at
+    )
+
+    if response_state["response_id"] is not None:
+        await link.send(json.dumps({"type": "response.cancel"}))
+    elif response_state["requested"]:
+        # response.create は送ったがまだ作られていない。作られたら取り消す
+        response_state["cancel_pending"] = True
+    if item_id is not None:
+        await link.send(json.dumps({
+            "type": "conversation.item.truncate",
+            "item_id": item_id,
+            "content_index": 0,
+            "audio_end_ms": int(played_ms)
+        }))
+    print(f"\n[BARGE-IN] 応答を中断しました (再生済み {played_ms:.0f} ms)")
+
+async def send_audio(link, capture, vad, gate, batcher, player, aec):
+    """
+    ユーザの音声を常時取得し、エコー除去後にVADで発話区間を区切ってサーバに送る。
+    無音区間は gate で止め、発話区間 (とプリロール) だけを batcher でまとめて送る。
+    応答の再生中に話し始めた場合はバージインとして応答を止める。
+    切断中も発話は utterance_buffer に残し、再接続後に送り直す。
+    """
+    reported_overruns = 0
 
     while True:
-        try:
-            audio_data = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: stream.read(CHUNK, exception_on_overflow=False)
-            )
-        except Exception as e:
-            print(f"[Error reading audio] {e}")
-            audio_data = None
-
-        if not audio_data:
-            await asyncio.sleep(0.01)
-            continue
-
-        volume = audioop.rms(audio_data, 2)
-        is_silent = (volume < SILENCE_THRESHOLD)
-
-        if in_session:
-            # 発話中に無音が続けば終了
-            if is_silent:
-                silence_count += 1
-            else:
-                silence_count = 0
-
-            if silence_count >= MIN_SILENCE_CHUNKS:
-                timing_info["commit_time"] = time.time()
-                try:
-                    await websocket.send(json.dumps({"type": "input_audio_buffer.commit"}))
-                    await websocket.send(json.dumps({"type": "response.create"}))
-                except websockets.ConnectionClosed:
-                    print("[WARN] The server closed the connection before commit.")
-                    break
-                in_session = False
-                silence_count = 0
-        else:
-            # 発話開始
-            if not is_silent:
-                in_session = True
-                silence_count = 0
-
-        base64_audio = base64.b64encode(audio_data).decode("utf-8")
-        audio_event = {
-            "type": "input_audio_buffer.append",
-            "audio": base64_audio
-        }
-        try:
-            await websocket.send(json.dumps(audio_event))
-        except websockets.ConnectionClosed:
-            print("[WARN] The server closed the connection. Stopping send loop.")
+        # コールバックが書き込んだリングバッファのスロット (memoryview)
+        audio_data = await capture.read()
+        if audio_data is None:
+            # ファイル入力の終端
+            print("\n[INFO] Audio source exhausted. Stopping send loop.")
             break
 
+        # マイク入力の取りこぼしがあれば知らせる (CPU不足の目安)
+        overruns = capture.overruns + capture.ring_overruns
+        if overruns != reported_overruns:
+            print(
+                f"\n[WARN] マイク入力のオーバーラン: デバイス {capture.overruns} 回 / "
+                f"リング {capture.ring_overruns} 回"
+            )
+            reported_overruns = overruns
+
+        # スピーカーから回り込んだ応答音声を差し引く (バッファを上書き)
+        aec.process(audio_data, capture.last_captured_at)
+
+        # 発話中に無音がハングオーバー分続けば SPEECH_END
+        vad_event = vad.process(audio_data)
+        if vad_event == SPEECH_START:
+            # 新しいターンのトレースを開始 (時刻はこのチャンクの取得時刻)
+            turn_traces.begin_turn(int(capture.last_captured_at * 1e9))
+            utterance_buffer.begin()
+            # 「止まって」などに備え、待ち中・実行中のロボット動作を取り消す
+            if action_executor.preempt():
+                print("\n[ACTION] 発話を検出したのでロボット動作を中断しました。")
+        upload_chunks, clear_buffer = gate.push(audio_data, vad_event, vad.silence_ms)
+
+        if vad_event == SPEECH_START and (
+            player.is_playing() or response_state["response_id"] is not None
+            or response_state["requested"]
+        ):
+            await barge_in(link, player)
+        if clear_buffer:
+            # 前回の発話以降にサーバ側に残ったノイズを捨てる
+            await link.send(json.dumps({"type": "input_audio_buffer.clear"}))
+        payloads = []
+        for chunk in upload_chunks:
+            payloads.extend(batcher.add(chunk))
+        if vad_event == SPEECH_END:
+            # コミット前に残りを送り切る
+            payloads.extend(batcher.flush())
+        for payload in payloads:
+            utterance_buffer.add(payload)
+            await link.send(build_append_event(payload))
+
+        if vad_event == SPEECH_END:
+            turn_traces.mark_pending("commit")
+            sent = (await link.send(json.dumps({"type": "input_audio_buffer.commit"}))
+                    and await link.send(json.dumps({"type": "response.create"})))
+            utterance_buffer.commit(sent)
+            if sent:
+                response_state["requested"] = True
+                response_state["creates"].append(True)
+            if not sent:
+                print("[WARN] 切断中のためコミットは再接続後に送ります。")
+            log_upload_stats(gate, batcher)
+            log_echo_stats(aec)
+
         await asyncio.sleep(0)
 
+def build_append_event(payload):
+    return json.dumps({
+        "type": "input_audio_buffer.append",
+        "audio": base64.b64encode(payload).decode("utf-8")
+    })
+
+def build_session_update():
+    return {
+        "type": "session.update",
+        "session": {
+            "modalities": ["audio", "text"],
+            "instructions": (
+                "ユーザーからの入力に対し適切な動作を選択して呼び出してください。"
+                "例えば、「慰めて」や「なにかして」と言われたら"
+                "適切な動作を選択して呼び出してください。"
+                "また、大阪弁で軽快に喋ってください。"
+            ),
+            "voice": "alloy",
+            "turn_detection": None,
+            # 文字起こしはインテントキャッシュに使う
+            "input_audio_transcription": {"model": TRANSCRIBE_MODEL} if INTENT_CACHE else None,
+            "tools": tools,
+            "tool_choice": "auto"
+        }
+    }
+
+# session.update はツールのスキーマを含めて一度だけシリアライズし、接続・再接続のたびに使い回す
+session_update_payload = json.dumps(build_session_update(), ensure_ascii=False)
+
+async def initialize_session(websocket):
+    """
+    (再) 接続のたびに呼ばれる。session.update (tools を含む) を送り、
+    切断で途切れた発話があれば先頭から送り直す。
+    送り損ねたコミットは、次の発話の途中なら (発話を2つに割らないよう) その終わりに回す。
+    """
+    await websocket.send(session_update_payload)
+    replayed = 0
+    for payload in utterance_buffer.replay():
+        await websocket.send(build_append_event(payload))
+        replayed += len(payload)
+    if replayed:
+        print(f"[INFO] 切断中の発話 {replayed / 1024:.0f} KB を送り直しました。")
+    if utterance_buffer.commit_pending and not utterance_buffer.in_speech:
+        await websocket.send(json.dumps({"type": "input_audio_buffer.commit"}))
+        await websocket.send(json.dumps({"type": "response.create"}))
+        utterance_buffer.reset()
+        response_state["requested"] = True
+        response_state["creates"].append(True)
+
+async def run_session(link, source, sink):
+    """
+    接続 (ConnectionSupervisor) と音声入力 (AudioSource)・出力 (AudioSink) で送受信を行う。
+    """
+    # 発話区間検出 (ノイズフロア追従)
+    vad = EnergyVAD(rate=RATE)
+    # 発話区間だけを送るアップロードゲート
+    gate = UploadGate(bytes_per_ms=RATE * 2 / 1000)
+    batcher = AppendBatcher(
+        interval_ms=UPLOAD_INTERVAL_MS,
+        max_bytes=UPLOAD_MAX_BYTES,
+        bytes_per_ms=RATE * 2 / 1000
+    )
+
+    # 応答音声は再生スレッド経由でスピーカーへ。書き込んだ音声はエコー除去の参照になる
+    echo_reference = EchoReference(rate=RATE)
+    player = AudioPlayer(
+        sink, rate=RATE, period_frames=PLAYBACK_CHUNK, reference=echo_reference,
+        on_item_start=turn_traces.mark_item_audible
+    )
+    player.start()
+    # 参照とマイクの時刻差はデバイスの出力・入力レイテンシから見積もる
+    echo_delay_ms = (sink.output_latency + source.input_latency) * 1000
+    aec = EchoCanceller(echo_reference, delay_ms=echo_delay_ms)
+
+    def on_disconnect():
+        # 生成中の応答は失われる。受信済みの音声は最後まで再生する
+        if response_state["response_id"] is not None:
+            turn_traces.finish(response_state["response_id"], "disconnected")
+            response_state["response_id"] = None
+        response_state["requested"] = False
+        response_state["creates"].clear()
+        response_state["cancel_pending"] = False
+        response_state["discard_response"] = None
+        follow_up.reset()
+        new_intent_turn(None)
+        player.end_of_stream()
+    link.on_disconnect = on_disconnect
+
+    send_task = asyncio.create_task(send_audio(link, source, vad, gate, batcher, player, aec))
+    receive_task = asyncio.create_task(receive_audio(link, player))
+
+    try:
+        await asyncio.wait({send_task, receive_task}, return_when=asyncio.FIRST_COMPLETED)
+        if send_task.done() and not receive_task.done():
+            send_task.result()
+            # 入力が尽きた (ファイル入力)。応答の再生が終わるまで待ってから終える
+            while (pending_tool_tasks or response_state["requested"]
+                   or response_state["response_id"] is not None or player.is_playing()):
+                await asyncio.sleep(0.05)
+        else:
+            receive_task.result()
+    finally:
+        send_task.cancel()
+        receive_task.cancel()
+        player.stop()
+
+def init_robot():
+    """SDK の初期化と疎通確認 (アクションワーカー上で呼ぶ)。"""
+    go2_tools.init()
+    health = go2_tools.health_check()
+    status = "OK" if health["ok"] else "NG"
+    print(f"[ROBOT] {health['backend']}: {status} ({health['detail']})")
+
+def open_audio(source_spec, sink_spec, pacing, loop):
+    """入出力デバイスを開く (PyAudio の初期化を含むのでスレッドで呼ぶ)。"""
+    source = open_source(source_spec, rate=RATE, chunk=CHUNK, pacing=pacing)
+    try:
+        source.start(loop)
+        sink = open_sink(sink_spec, rate=RATE, frames_per_buffer=PLAYBACK_CHUNK, pacing=pacing)
+    except Exception:
+        source.close()
+        raise
+    return source, sink
+
 async def stream_audio_and_receive_response():
     API_KEY = os.environ.get('OPENAI_API_KEY')
     if not API_KEY or API_KEY.strip() == "":
         print("[ERROR] OPENAI_API_KEY が設定されていません。")
         return
 
-    WS_URL = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+    # REALTIME_WS_URL でローカルの検証用サーバ (fake_realtime_server.py) にも向けられる
+    WS_URL = os.environ.get("REALTIME_WS_URL", DEFAULT_WS_URL)
     HEADERS = {
         "Authorization": "Bearer " + API_KEY,
         "OpenAI-Beta": "realtime=v1"
     }
 
-    async with websockets.connect(WS_URL, additional_headers=HEADERS) as websocket:
+    # 入出力のバックエンド (既定はマイクとスピーカー)
+    #   AUDIO_SOURCE: pyaudio / wav:<path> / raw:<path>
+    #   AUDIO_SINK  : pyaudio / null
+    #   AUDIO_PACING: realtime / fast (ファイル入力と null 出力の速さ)
+    source_spec = os.environ.get("AUDIO_SOURCE", "pyaudio")
+    sink_spec = os.environ.get("AUDIO_SINK", "pyaudio")
+    pacing = os.environ.get("AUDIO_PACING", "realtime")
+
+    # 接続 (session.update まで)・デバイスのオープン・ロボットの初期化を並行して進める。
+    # 最初の発話に必要なのは接続と音声デバイスだけなので、ロボットの初期化は待たない
+    # (起動直後のツール呼び出しはワーカー上で初期化の完了を待つ)
+    startup = StartupOrchestrator()
+    # 切断されたら再接続し、initialize_session でセッションを作り直す
+    link = ConnectionSupervisor(WS_URL, headers=HEADERS, on_connect=initialize_session)
+    supervisor_task = asyncio.create_task(link.run())
+    # 諦めた理由は wait_connected() / recv() に送出される (ここでは表示済みの例外を回収するだけ)
+    supervisor_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    startup.stage("connect", link.wait_connected)
+    startup.stage("audio", open_audio, source_spec, sink_spec, pacing, asyncio.get_running_loop())
+    startup.stage("robot", action_executor.warm_up, init_robot)
+
+    source = sink = None
+    try:
+        _, (source, sink) = await startup.wait("connect", "audio")
+        startup.ready()
         print("[INFO] WebSocket connection established.")
-
-        init_request = {
-            "type": "session.update",
-            "session": {
-                "modalities": ["audio", "text"],
-                "instructions": (
-                    "ユーザーからの入力に対し適切な動作を選択して呼び出してください。"
-                    "例えば、「慰めて」や「なにかして」と言われたら"
-                    "適切な動作を選択して呼び出してください。"
-                    "また、大阪弁で軽快に喋ってください。"
-                ),
-                "voice": "alloy",
-                "turn_detection": None,
-                "tools": tools,
-                "tool_choice": "auto"
-            }
-        }
-        await websocket.send(json.dumps(init_request))
         print("[INFO] Initial request sent.\n")
-
-        CHUNK = 2048
-        FORMAT = pyaudio.paInt16
-        CHANNELS = 1
-        RATE = 24000
-
-        p = pyaudio.PyAudio()
-
-        # マイク用ストリーム
-        stream = p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            input=True,
-            input_device_index=None,
-            frames_per_buffer=CHUNK
-        )
-
-        # 応答音声再生用ストリーム
-        output_stream = p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            output=True,
-            frames_per_buffer=CHUNK
-        )
-
-        print("Available audio devices:")
-        for i in range(p.get_device_count()):
-            info = p.get_device_info_by_index(i)
-            print(f"Index {i}: {info['name']} (Input Channels: {info['maxInputChannels']})")
-
         print("\n[INFO] Microphone input activated. Starting audio playback from server...\n")
-        print("[NOTE] ハウリング防止のため、ヘッドホン推奨 or マイクとスピーカーを離すなど調整してください。\n")
+        print("[NOTE] エコーキャンセルが有効です (スピーカー出力を参照にマイク入力から除去します)。\n")
+        log_startup_report(startup)
 
-        send_task = asyncio.create_task(send_audio(websocket, stream, CHUNK))
-        receive_task = asyncio.create_task(receive_audio(websocket, output_stream))
+        # デバイス一覧の表示は待ち受けを始めてから
+        if "pyaudio" in (source_spec, sink_spec):
+            startup.stage("devices", list_pyaudio_devices)
 
         try:
-            await asyncio.gather(send_task, receive_task)
+            await run_session(link, source, sink)
         except KeyboardInterrupt:
             print("[INFO] KeyboardInterrupt caught. Exiting now...")
-        finally:
-            timing_info["audio_capture_end"] = time.time()
-
-            if stream.is_active():
-                stream.stop_stream()
-            stream.close()
-            output_stream.stop_stream()
-            output_stream.close()
-            p.terminate()
+    except ConnectionError:
+        # URL や API キーの誤りなど、再接続しても直らない (理由は表示済み)
+        print("[INFO] サーバに接続できないため終了します。")
+    finally:
+        startup.cancel()
+        if source is None and startup.result("audio") is not None:
+            # 接続に失敗したときも開いたデバイスは閉じる
+            source, sink = startup.result("audio")
+        action_executor.shutdown()
+        # 移動中なら止める (StopMove)
+        go2_tools.motion.stop()
+        log_state_stats(go2_tools.state_monitor)
+        log_follow_up_stats(follow_up)
+        log_intent_stats(intent_cache)
+
+        if source is not None:
+            source.close()
+        if sink is not None:
+            sink.close()
+        terminate_pyaudio()
+
+        await link.stop()
+        supervisor_task.cancel()
+        log_connection_stats(link)
 
 def main():
     loop = asyncio.get_event_loop()
+    if os.environ.get("REALTIME_BACKEND", "cloud") == "local":
+        # クラウドに接続せず、端末上の Whisper で認識してツールを呼ぶ (local_session を参照)
+        import local_session
+        loop.run_until_complete(
+            local_session.stream_audio_and_recognize(action_executor, init_robot, rate=RATE, chunk=CHUNK)
+        )
+        return
     loop.run_until_complete(stream_audio_and_receive_response())
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+"""
+スポーツモードの状態 (rt/sportmodestate) から動作の完了を判定する。
+
+動作を送ってから time.sleep(1) で待つ代わりに、状態が
+「動作中 (progress や mode, 速度) → 落ち着いた (目標の mode で静止)」と変わるのを待つ。
+状態が届いていない (購読できていない) ときは従来どおり固定時間だけ待つ。
+"""
+import collections
+import threading
+import time
+
+# SportModeState_.mode
+MODE_IDLE = 0
+MODE_BALANCE_STAND = 1
+MODE_POSE = 2
+MODE_LOCOMOTION = 3
+MODE_LIE_DOWN = 5
+MODE_DAMPING = 7
+MODE_RECOVERY_STAND = 8
+MODE_SIT = 10
+MODE_FRONT_FLIP = 11
+MODE_FRONT_JUMP = 12
+MODE_FRONT_POUNCE = 13
+
+STANDING_MODES = (MODE_IDLE, MODE_BALANCE_STAND)
+# この mode の間は動作中
+BUSY_MODES = (MODE_RECOVERY_STAND, MODE_FRONT_FLIP, MODE_FRONT_JUMP, MODE_FRONT_POUNCE)
+
+SPORT_STATE_TOPIC = "rt/sportmodestate"
+
+
+class SportStateMonitor:
+    """
+    最新のスポーツモード状態を保持し、動作の完了を待てるようにする。
+    update() は DDS の受信スレッド (またはフェイクの発行スレッド) から呼ばれる。
+    """
+
+    def __init__(self, still_speed=0.05, history=200):
+        self.still_speed = still_speed
+        self._cond = threading.Condition()
+        self.mode = None
+        self.progress = 0.0
+        self.speed = 0.0
+        self.seq = 0
+        self.updated_at = None
+
+        # 統計
+        self.waits = collections.deque(maxlen=history)   # (動作名, 秒, 結果)
+
+    def on_sport_state(self, msg):
+        """ChannelSubscriber のハンドラ (SportModeState_)。"""
+        vx, vy, _ = msg.velocity
+        speed = max(abs(vx), abs(vy), abs(msg.yaw_speed))
+        self.update(msg.mode, msg.progress, speed)
+
+    def update(self, mode, progress=0.0, speed=0.0):
+        with self._cond:
+            self.mode = mode
+            self.progress = progress
+            self.speed = speed
+            self.seq += 1
+            self.updated_at = time.perf_counter()
+            self._cond.notify_all()
+
+    def wake(self):
+        """待っているスレッドを起こす (中断の確認をさせる)。"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def alive(self, max_age=0.5):
+        """最近状態が届いているか。"""
+        return self.updated_at is not None and time.perf_counter() - self.updated_at < max_age
+
+    def busy(self):
+        return self.progress != 0 or self.mode in BUSY_MODES or self.speed > self.still_speed
+
+    def wait_done(self, name="", expect_modes=None, start_timeout=0.5, timeout=5.0,
+                  settle=0.1, cancelled=None):
+        """
+        動作を送った直後に呼び、動作が終わるまで待つ。戻り値は done / timeout / cancelled。
+
+        - 動作中の状態を一度見るか、start_timeout が過ぎるまでは完了としない
+          (送った直後はまだ前の静止状態が見えるため)
+        - 完了は「動作中でなく、expect_modes の mode である状態」が settle 秒続いたとき
+        """
+        started = time.perf_counter()
+        deadline = started + timeout
+        seen_busy = False
+        still_since = None
+        result = "timeout"
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                if cancelled is not None and cancelled():
+                    result = "cancelled"
+                    break
+                if now >= deadline:
+                    break
+                if self.busy():
+                    seen_busy = True
+                    still_since = None
+                elif expect_modes is None or self.mode in expect_modes:
+                    if seen_busy or now - started >= start_timeout:
+                        still_since = still_since or now
+                        if now - still_since >= settle:
+                            result = "done"
+                            break
+                else:
+                    still_since = None
+                # 状態が来なくても start_timeout / settle の経過は確認する
+                self._cond.wait(min(deadline - now, settle))
+        self.waits.append((name, time.perf_counter() - started, result))
+        return result
+
+    def stats(self):
+        done = [t for _, t, r in self.waits if r == "done"]
+        return {
+            "waits": len(self.waits),
+            "timeouts": sum(1 for _, _, r in self.waits if r == "timeout"),
+            "mean_wait": sum(done) / len(done) if done else None,
+        }
+
+
+class FakeSportStatePublisher:
+    """
+    実機なしで wait_done を動かすためのフェイク。
+    rate_hz で状態を発行し、start_action() されたら duration 秒だけ動作中にしてから final_mode に戻る。
+    """
+
+    def __init__(self, monitor, rate_hz=50):
+        self.monitor = monitor
+        self.period = 1.0 / rate_hz
+        self._lock = threading.Lock()
+        self._mode = MODE_BALANCE_STAND
+        self._busy_until = 0.0
+        self._busy_mode = None
+        self._final_mode = MODE_BALANCE_STAND
+        self._speed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fake-sport-state", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def start_action(self, duration, final_mode=None, busy_mode=None):
+        with self._lock:
+            self._busy_until = time.perf_counter() + duration
+            self._busy_mode = busy_mode
+            if final_mode is not None:
+                self._final_mode = final_mode
+
+    def set_speed(self, speed):
+        with self._lock:
+            self._speed = speed
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            with self._lock:
+                if time.perf_counter() < self._busy_until:
+                    mode = self._busy_mode if self._busy_mode is not None else self._mode
+                    progress = 1.0
+                else:
+                    mode = self._mode = self._final_mode
+                    progress = 0.0
+                speed = self._speed
+            self.monitor.update(mode, progress, speed)
+            next_tick += self.period
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+
+def log_state_stats(monitor):
+    s = monitor.stats()
+    if not s["waits"]:
+        return
+    line = f"[STATE] 完了待ち {s['waits']} 回"
+    if s["mean_wait"] is not None:
+        line += f", 平均 {s['mean_wait']:.2f} 秒"
+    if s["timeouts"]:
+        line += f", タイムアウト {s['timeouts']} 回"
+    print(line)
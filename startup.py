@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+
+class StartupOrchestrator:
+    """
+    起動処理をステージごとに並行して走らせ、ステージ別の所要時間を記録する。
+
+    - stage() はコルーチンならそのままタスクに、通常の関数ならスレッドで実行する
+      (SDK の初期化やデバイスのオープンはブロックするため)
+    - wait() で最初の発話に必要なステージだけを待ち、ready() で待ち受け開始時刻を記録する
+    - それ以外のステージ (ロボットの初期化など) は裏で走らせたままにできる
+    """
+
+    def __init__(self, started_at=None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.ready_at = None
+        self.stages = {}     # name -> {"start", "end", "error"} (perf_counter)
+        self._tasks = {}
+
+    def stage(self, name, func, *args):
+        self.stages[name] = {"start": None, "end": None, "error": None}
+        task = asyncio.create_task(self._run(name, func, *args))
+        # 待たれないステージの例外は _run で表示済み
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[name] = task
+        return task
+
+    async def _run(self, name, func, *args):
+        timing = self.stages[name]
+        timing["start"] = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args)
+            return await asyncio.to_thread(func, *args)
+        except Exception as e:
+            timing["error"] = e
+            print(f"[ERROR] 起動ステージ {name} が失敗しました: {e}")
+            raise
+        finally:
+            timing["end"] = time.perf_counter()
+
+    async def wait(self, *names):
+        """指定したステージの完了を待って結果を返す (失敗したステージの例外はそのまま送出)。"""
+        return await asyncio.gather(*(self._tasks[name] for name in names))
+
+    def result(self, name):
+        """成功して終わったステージの結果 (終わっていない・失敗したら None)。"""
+        task = self._tasks.get(name)
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    def ready(self):
+        self.ready_at = time.perf_counter()
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+
+def log_startup_report(startup):
+    print("\n----- 起動時間 -----")
+    for name, timing in startup.stages.items():
+        if timing["start"] is None:
+            continue
+        begin = timing["start"] - startup.started_at
+        if timing["end"] is None:
+            print(f"  - {name}: {begin:.3f} 秒から実行中")
+            continue
+        line = f"  - {name}: {begin:.3f} → {timing['end'] - startup.started_at:.3f} 秒 ({timing['end'] - timing['start']:.3f} 秒)"
+        if timing["error"] is not None:
+            line += f" 失敗: {timing['error']}"
+        print(line)
+    if startup.ready_at is not None:
+        print(f"  待ち受け開始まで: {startup.ready_at - startup.started_at:.3f} 秒")
+    print("--------------------\n")
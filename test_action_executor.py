@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+from action_executor import ActionExecutor
+
+
+def blocking_tools():
+    """Busy は release が set されるまで終わらない。"""
+    release = threading.Event()
+    calls = []
+
+    def busy():
+        calls.append("Busy")
+        release.wait(2.0)
+
+    def dance():
+        calls.append("Dance")
+
+    return {"Busy": busy, "Dance": dance}, release, calls
+
+
+def test_withdraw_cancels_queued_duplicate():
+    async def main():
+        tools, release, calls = blocking_tools()
+        executor = ActionExecutor(tools)
+        busy = asyncio.create_task(executor.run("Busy"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(executor.run("Dance", {}))
+        await asyncio.sleep(0.01)
+        assert executor.withdraw("Dance", {})
+        release.set()
+        assert (await queued)["status"] == "cancelled"
+        assert (await busy)["status"] == "completed"
+        executor.shutdown()
+        return calls
+
+    assert asyncio.run(main()) == ["Busy"]
+
+
+def test_withdraw_keeps_shared_job():
+    async def main():
+        tools, release, calls = blocking_tools()
+        executor = ActionExecutor(tools)
+        busy = asyncio.create_task(executor.run("Busy"))
+        await asyncio.sleep(0.05)
+        first = asyncio.create_task(executor.run("Dance", {}))
+        second = asyncio.create_task(executor.run("Dance", {}))
+        await asyncio.sleep(0.01)
+        # 2つの呼び出しが1回の実行を共有しているので取り消さない
+        assert not executor.withdraw("Dance", {})
+        assert not executor.withdraw("Busy")
+        release.set()
+        records = await asyncio.gather(busy, first, second)
+        executor.shutdown()
+        return [r["status"] for r in records], calls
+
+    statuses, calls = asyncio.run(main())
+    assert statuses == ["completed", "completed", "coalesced"]
+    assert calls == ["Busy", "Dance"]
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from echo_cancel import EchoReference, EchoCanceller
+
+RATE = 24000
+FRAME = 480
+DELAY = int(RATE * 0.06)
+
+
+def signal(n, peak, seed):
+    """音声の代わりの帯域を絞った雑音 (振幅がゆっくり揺れる)。"""
+    rng = np.random.default_rng(seed)
+    x = np.convolve(rng.standard_normal(n), np.ones(8) / 8, mode="same")
+    x *= 0.6 + 0.4 * np.sin(np.arange(n) * 2 * np.pi * 3 / RATE)
+    return x * peak / np.max(np.abs(x))
+
+
+def simulate(aec, reference, far, talker):
+    """far を再生しながら 0.3 倍のエコーと talker を録音したものとして処理する。"""
+    n = len(far)
+    started = time.perf_counter()
+    reference.push(far.astype(np.int16).tobytes(), t=started)
+    echo = np.zeros(n)
+    echo[DELAY:] = 0.3 * far[:-DELAY]
+    out = np.zeros(n)
+    norms = []
+    for s in range(0, n, FRAME):
+        mic = np.clip(echo[s:s + FRAME] + talker[s:s + FRAME], -32768, 32767)
+        frame = bytearray(mic.astype(np.int16).tobytes())
+        aec.process(frame, started + s / RATE)
+        out[s:s + FRAME] = np.frombuffer(frame, dtype=np.int16)
+        norms.append(float(np.linalg.norm(aec.weights)))
+    return echo, out, norms
+
+
+def erle(echo, residual):
+    """エコーの減衰量 (dB)。"""
+    return 10 * np.log10(np.mean(echo * echo) / np.mean(residual * residual))
+
+
+def test_cancels_echo_without_near_end_speech():
+    reference = EchoReference(rate=RATE)
+    aec = EchoCanceller(reference, delay_ms=60.0)
+    far = signal(RATE * 2, 4000, 1)
+    echo, out, _ = simulate(aec, reference, far, np.zeros(len(far)))
+    assert erle(echo[RATE:], out[RATE:]) > 10
+    assert aec.double_talk_blocks == 0
+
+
+def test_double_talk_does_not_diverge():
+    reference = EchoReference(rate=RATE)
+    aec = EchoCanceller(reference, delay_ms=60.0)
+    # 2 秒エコーだけ、1 秒ユーザーが重ねて話し、最後の 1 秒はまたエコーだけ
+    far = signal(RATE * 4, 4000, 1)
+    talker = np.zeros(len(far))
+    talker[RATE * 2:RATE * 3] = signal(RATE, 7000, 2)
+    echo, out, norms = simulate(aec, reference, far, talker)
+
+    assert aec.double_talk_blocks > 0
+    # ダブルトークの間は係数が育たない
+    converged = norms[RATE * 2 // FRAME - 1]
+    assert max(norms[RATE * 2 // FRAME:RATE * 3 // FRAME]) <= converged * 1.05
+    # ユーザーの声を除いた残りのエコーは、話している間も後も元より小さい
+    during = slice(RATE * 2, RATE * 3)
+    after = slice(RATE * 3, RATE * 4)
+    assert erle(echo[during], out[during] - talker[during]) > 0
+    assert erle(echo[after], out[after]) > 0
@@ -0,0 +1,25 @@
+from latency_trace import TraceRecorder
+
+
+def test_turn_response_takes_pending_stamps():
+    traces = TraceRecorder()
+    traces.begin_turn(t_ns=1_000)
+    traces.mark_pending("commit", t_ns=2_000)
+    trace = traces.bind("resp_1", t_ns=3_000)
+    assert trace.stamps == {"speech_start": 1_000, "commit": 2_000, "response_created": 3_000}
+
+
+def test_follow_up_does_not_steal_next_turn():
+    traces = TraceRecorder()
+    traces.begin_turn(t_ns=1_000)
+    traces.mark_pending("commit", t_ns=2_000)
+    traces.bind("resp_1", t_ns=3_000)
+    # 次の発話が始まってから、前の応答のフォローアップが作られる
+    traces.begin_turn(t_ns=10_000)
+    follow_up = traces.bind("resp_2", for_turn=False, t_ns=11_000)
+    assert follow_up.stamps == {"response_created": 11_000}
+
+    traces.mark_pending("commit", t_ns=12_000)
+    turn = traces.bind("resp_3", t_ns=13_000)
+    assert turn.stamps["speech_start"] == 10_000
+    assert turn.intervals()["commit_to_created"] == 1e-6
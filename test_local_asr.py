@@ -0,0 +1,157 @@
+import time
+
+import numpy as np
+
+from local_asr import LocalAgreement, StreamingTranscriber, StubRecognizer, MODEL_RATE
+
+
+def words(text, step=0.1, start=0):
+    return [(ch, (start + i) * step, (start + i + 1) * step) for i, ch in enumerate(text)]
+
+
+def pcm16(ms, rate=24000):
+    return (np.ones(int(rate * ms / 1000), dtype=np.int16) * 1000).tobytes()
+
+
+class RecordingRecognizer(StubRecognizer):
+    """StubRecognizer に渡された音声の長さと prompt を記録する。"""
+
+    def __init__(self, transcripts, **kwargs):
+        super().__init__(transcripts, rtf=0.0, **kwargs)
+        self.calls = []
+
+    def transcribe(self, audio, prompt=""):
+        self.calls.append((len(audio), prompt))
+        return super().transcribe(audio, prompt)
+
+
+def feed(transcriber, ms, chunk_ms=20):
+    """chunk_ms ずつ音声を入れ、溜まったら認識する。"""
+    for _ in range(int(ms / chunk_ms)):
+        transcriber.insert(pcm16(chunk_ms))
+        if transcriber.ready():
+            transcriber.process()
+
+
+# --- LocalAgreement ---
+
+def test_first_hypothesis_is_not_committed():
+    agreement = LocalAgreement()
+    assert agreement.insert(words("たっ")) == []
+    assert agreement.committed == []
+
+
+def test_commits_common_prefix_of_two_hypotheses():
+    agreement = LocalAgreement()
+    agreement.insert(words("たっ…"))
+    agreed = agreement.insert(words("たって"))
+    assert [w for w, _, _ in agreed] == ["た", "っ"]
+    assert agreement.last_end == agreed[-1][2]
+
+
+def test_committed_words_are_not_repeated():
+    agreement = LocalAgreement()
+    agreement.insert(words("たっ"))
+    agreement.insert(words("たって"))
+    # 発話の先頭から認識し直しても、確定済みの分は二重に確定しない
+    assert [w for w, _, _ in agreement.insert(words("たってお"))] == ["て"]
+    assert [w for w, _, _ in agreement.insert(words("たっておて"))] == ["お"]
+    assert "".join(w for w, _, _ in agreement.committed) == "たってお"
+
+
+def test_flush_commits_remaining_hypothesis():
+    agreement = LocalAgreement()
+    agreement.insert(words("すわ"))
+    agreement.insert(words("すわって"))
+    rest = agreement.flush()
+    assert [w for w, _, _ in rest] == ["っ", "て"]
+    assert "".join(w for w, _, _ in agreement.committed) == "すわって"
+    assert agreement.flush() == []
+
+
+# --- StreamingTranscriber ---
+
+def test_insert_resamples_to_model_rate():
+    transcriber = StreamingTranscriber(StubRecognizer(["x"]), input_rate=24000)
+    transcriber.insert(pcm16(20))
+    assert transcriber._samples == MODEL_RATE * 20 // 1000
+
+
+def test_ready_after_chunk_ms():
+    transcriber = StreamingTranscriber(StubRecognizer(["x"], rtf=0.0), chunk_ms=100)
+    transcriber.begin()
+    transcriber.insert(pcm16(80))
+    assert not transcriber.ready()
+    transcriber.insert(pcm16(20))
+    assert transcriber.ready()
+    transcriber.process()
+    assert not transcriber.ready()
+
+
+def test_partial_text_grows_and_finish_returns_the_rest():
+    transcriber = StreamingTranscriber(StubRecognizer(["立って踊って"], rtf=0.0), chunk_ms=100)
+    transcriber.begin()
+    partials = []
+    for _ in range(10):
+        feed(transcriber, 100)
+        partials.append(transcriber.text())
+    # 確定したテキストは伸びるだけで変わらない
+    for shorter, longer in zip(partials, partials[1:]):
+        assert longer.startswith(shorter)
+    assert "…" not in transcriber.text()
+    transcriber.finish()
+    assert transcriber.text() == "立って踊って"
+    stats = transcriber.stats()
+    assert stats["decodes"] > 0
+    assert stats["rtf"] is not None
+    assert stats["latency_p50"] is not None
+
+
+def test_begin_starts_next_utterance():
+    transcriber = StreamingTranscriber(StubRecognizer(["座って", "お手"], rtf=0.0), chunk_ms=100)
+    transcriber.begin()
+    feed(transcriber, 600)
+    transcriber.finish()
+    assert transcriber.text() == "座って"
+    transcriber.begin()
+    assert transcriber.text() == ""
+    feed(transcriber, 600)
+    transcriber.finish()
+    assert transcriber.text() == "お手"
+
+
+def test_trim_drops_committed_audio_and_passes_prompt():
+    recognizer = RecordingRecognizer(["右に回ってから座ってお手"], chars_per_second=8.0)
+    transcriber = StreamingTranscriber(recognizer, chunk_ms=100, max_buffer_s=0.5)
+    transcriber.begin()
+    feed(transcriber, 2000)
+    transcriber.finish()
+
+    assert transcriber.text() == "右に回ってから座ってお手"
+    # 切り詰めた後はバッファの前までの確定済みテキストが prompt になる
+    trimmed = [(length, prompt) for length, prompt in recognizer.calls if prompt]
+    assert trimmed
+    for length, prompt in trimmed:
+        assert "右に回ってから座ってお手".startswith(prompt)
+    # バッファは max_buffer_s + chunk_ms 程度で頭打ちになる
+    assert max(length for length, _ in recognizer.calls) <= MODEL_RATE * 0.7
+
+
+def test_prompt_is_empty_without_trimming():
+    recognizer = RecordingRecognizer(["座って"])
+    transcriber = StreamingTranscriber(recognizer, chunk_ms=100, max_buffer_s=15.0)
+    transcriber.begin()
+    feed(transcriber, 600)
+    assert all(prompt == "" for _, prompt in recognizer.calls)
+
+
+def test_latency_uses_arrival_time():
+    transcriber = StreamingTranscriber(StubRecognizer(["座って"], rtf=0.0), chunk_ms=100)
+    transcriber.begin()
+    for _ in range(30):
+        # 1 秒前に受け取った音声として入れる
+        transcriber.insert(pcm16(20), arrived_at=time.perf_counter() - 1.0)
+        if transcriber.ready():
+            transcriber.process()
+    transcriber.finish()
+    assert transcriber.stats()["latency_p50"] >= 1.0
@@ -0,0 +1,50 @@
+from local_session import COMMANDS, match_commands
+
+
+def names(calls):
+    return [name for name, _ in calls]
+
+
+def test_single_command():
+    assert match_commands("座って。") == [("SitDown", {})]
+
+
+def test_commands_in_spoken_order():
+    assert names(match_commands("立って、踊って")) == ["StandUp", "Dance"]
+    assert names(match_commands("踊ってから座って")) == ["Dance", "SitDown"]
+
+
+def test_overlapping_keywords_use_the_earlier_match():
+    # 「右に回って」の「回って」は別のコマンドにしない
+    assert match_commands("右に回って") == [("Move", {"z": -1.57})]
+    assert match_commands("回って") == [("Move", {"z": 3.14})]
+
+
+def test_overlap_then_next_command():
+    assert match_commands("右に回ってから座って") == [("Move", {"z": -1.57}), ("SitDown", {})]
+
+
+def test_repeated_commands_are_all_kept():
+    assert match_commands("前に進んで、それからまた前に進んで") == [("Move", {"x": 0.5})] * 2
+    assert match_commands("右を向いて左を向いて右を向いて") == [
+        ("Move", {"z": -1.57}), ("Move", {"z": 1.57}), ("Move", {"z": -1.57}),
+    ]
+    # 別の言い方で繰り返しても、言った回数だけ
+    assert names(match_commands("お座り、座って")) == ["SitDown", "SitDown"]
+
+
+def test_normalizes_transcript():
+    # 全角・空白・句読点は無視する
+    assert names(match_commands(" お 手 ！")) == ["Hello"]
+
+
+def test_no_command():
+    assert match_commands("今日はいい天気やな") == []
+    assert match_commands("") == []
+
+
+def test_returned_arguments_are_copies():
+    calls = match_commands("前に進んで")
+    calls[0][1]["x"] = 10.0
+    assert match_commands("前に進んで") == [("Move", {"x": 0.5})]
+    assert all(kwargs.get("x") != 10.0 for _, _, kwargs in COMMANDS)
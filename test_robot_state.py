@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from robot_state import (
+    SportStateMonitor, FakeSportStatePublisher, STANDING_MODES, MODE_SIT, MODE_FRONT_JUMP,
+)
+
+
+@pytest.fixture
+def monitor():
+    return SportStateMonitor()
+
+
+@pytest.fixture
+def publisher(monitor):
+    publisher = FakeSportStatePublisher(monitor, rate_hz=200).start()
+    # 最初の状態が届くまで待つ
+    deadline = time.perf_counter() + 1.0
+    while not monitor.alive() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    yield publisher
+    publisher.stop()
+
+
+def test_done_after_action_finishes(monitor, publisher):
+    publisher.start_action(0.2, MODE_SIT, MODE_FRONT_JUMP)
+    started = time.perf_counter()
+    result = monitor.wait_done("Sit", (MODE_SIT,), timeout=2.0, settle=0.05)
+    elapsed = time.perf_counter() - started
+    assert result == "done"
+    assert monitor.mode == MODE_SIT
+    # 動作中の間は完了にならない
+    assert elapsed >= 0.2
+
+
+def test_timeout_while_busy(monitor, publisher):
+    publisher.start_action(5.0)
+    started = time.perf_counter()
+    result = monitor.wait_done("Dance", timeout=0.3)
+    assert result == "timeout"
+    assert 0.3 <= time.perf_counter() - started < 1.0
+    assert monitor.stats()["timeouts"] == 1
+
+
+def test_timeout_when_mode_never_matches(monitor, publisher):
+    # 静止しているが期待した mode にならない
+    assert monitor.wait_done("Sit", (MODE_SIT,), start_timeout=0.05, timeout=0.3) == "timeout"
+
+
+def test_cancel_interrupts_wait(monitor, publisher):
+    publisher.start_action(5.0)
+    cancelled = threading.Event()
+
+    def cancel():
+        cancelled.set()
+        monitor.wake()
+    threading.Timer(0.1, cancel).start()
+
+    started = time.perf_counter()
+    result = monitor.wait_done("Dance", timeout=3.0, cancelled=cancelled.is_set)
+    assert result == "cancelled"
+    assert time.perf_counter() - started < 1.0
+
+
+def test_cancel_without_state_updates(monitor):
+    # 状態が届いていなくても settle ごとに中断を確認する
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    result = monitor.wait_done("Hello", timeout=3.0, settle=0.05, cancelled=cancelled.is_set)
+    assert result == "cancelled"
+
+
+def test_start_timeout_then_settle_without_busy_state(monitor, publisher):
+    # 動作中の状態が一度も見えなければ、start_timeout の後 settle 秒静止して完了
+    started = time.perf_counter()
+    result = monitor.wait_done("Hello", STANDING_MODES, start_timeout=0.2, settle=0.1, timeout=2.0)
+    elapsed = time.perf_counter() - started
+    assert result == "done"
+    assert elapsed >= 0.3
+
+
+def test_busy_state_skips_start_timeout(monitor, publisher):
+    # 動作中を一度見たら start_timeout を待たずに完了できる
+    publisher.start_action(0.05, busy_mode=MODE_FRONT_JUMP)
+    started = time.perf_counter()
+    result = monitor.wait_done("FrontJump", start_timeout=2.0, settle=0.05, timeout=3.0)
+    assert result == "done"
+    assert time.perf_counter() - started < 1.0
+
+
+def test_moving_counts_as_busy(monitor, publisher):
+    publisher.set_speed(0.5)
+    assert monitor.wait_done("Move", timeout=0.2) == "timeout"
+    publisher.set_speed(0.0)
+    assert monitor.wait_done("Move", start_timeout=0.05, settle=0.05, timeout=1.0) == "done"
+    stats = monitor.stats()
+    assert stats["waits"] == 2
+    assert stats["mean_wait"] is not None
@@ -0,0 +1,36 @@
+import pytest
+
+from tool_registry import ToolRegistry, ToolArgumentError
+
+
+@pytest.fixture
+def registry():
+    registry = ToolRegistry()
+
+    @registry.tool(parameters={"x": {"minimum": -3.0, "maximum": 3.0}})
+    def Move(x: float = 0.0, speed: float = 1.0):
+        """
+        移動する
+
+        x: 前後の移動量 (m)
+        speed: 移動速度 (m/s)
+        """
+
+    return registry
+
+
+def test_range_is_in_schema(registry):
+    x = registry.schemas()[0]["parameters"]["properties"]["x"]
+    assert x["minimum"] == -3.0
+    assert x["maximum"] == 3.0
+
+
+def test_out_of_range_argument_is_rejected(registry):
+    with pytest.raises(ToolArgumentError, match="between"):
+        registry.convert("Move", '{"x": 100}')
+    with pytest.raises(ToolArgumentError, match="between"):
+        registry.convert("Move", {"x": -3.5})
+
+
+def test_in_range_and_unbounded_arguments_pass(registry):
+    assert registry.convert("Move", {"x": "3", "speed": 50}) == {"x": 3.0, "speed": 50.0}
@@ -0,0 +1,49 @@
+import numpy as np
+
+from vad import EnergyVAD, SPEECH_START, SPEECH_END
+
+RATE = 24000
+FRAME = RATE * 20 // 1000
+
+
+def tone(ms, amplitude):
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (np.sin(2 * np.pi * 220 * t) * amplitude).astype(np.int16)
+
+
+def noise(ms, rms, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(RATE * ms // 1000) * rms).astype(np.int16)
+
+
+def test_is_speech_does_not_change_state():
+    vad = EnergyVAD(rate=RATE)
+    floor = vad.noise_floor
+    history = vad._history.copy()
+    assert vad.is_speech(tone(20, 8000))
+    assert not vad.is_speech(noise(20, 10))
+    assert vad.noise_floor == floor
+    assert np.array_equal(vad._history, history)
+    assert not vad.in_speech
+
+
+def test_is_speech_matches_process_without_adapting_twice():
+    checked = EnergyVAD(rate=RATE)
+    plain = EnergyVAD(rate=RATE)
+    for i in range(50):
+        chunk = noise(20, 50, seed=i)
+        # 同じチャンクを is_speech で調べても、ノイズフロアの追従は1回だけ
+        checked.is_speech(chunk)
+        checked.process(chunk)
+        plain.process(chunk)
+    assert checked.noise_floor == plain.noise_floor
+
+
+def test_process_detects_speech_start_and_end():
+    vad = EnergyVAD(rate=RATE, hangover_ms=200)
+    events = [vad.process(chunk) for chunk in np.split(noise(400, 50), 400 // 20)]
+    assert SPEECH_START not in events
+    events = [vad.process(chunk) for chunk in np.split(tone(200, 8000), 200 // 20)]
+    assert SPEECH_START in events
+    events = [vad.process(chunk) for chunk in np.split(noise(400, 50, seed=1), 400 // 20)]
+    assert SPEECH_END in events
@@ -0,0 +1,192 @@
+"""
+関数のシグネチャと docstring からツール (function calling) のスキーマを作るレジストリ。
+
+    registry = ToolRegistry()
+
+    @registry.tool(priority=1)
+    def Move(x: float = 0.0, speed: float = 1.0):
+        \"\"\"
+        移動する
+
+        x: 前後の移動量 (m)
+        speed: 移動速度 (m/s)
+        \"\"\"
+
+docstring の最初の段落がツールの説明、「引数名: 説明」の行が引数の説明になる。
+型注釈 (float / int / bool / str / list / dict) が JSON Schema の型になり、
+既定値のない引数は required になる。
+parameters で数値の引数に minimum / maximum を付けると、convert() で範囲外の値を拒否する。
+"""
+import inspect
+import json
+import typing
+
+_JSON_TYPES = {
+    float: "number",
+    int: "integer",
+    bool: "boolean",
+    str: "string",
+    list: "array",
+    dict: "object",
+}
+
+
+class ToolArgumentError(ValueError):
+    """モデルから受け取った引数がツールに合わない。"""
+
+
+def _parse_docstring(func):
+    doc = inspect.getdoc(func) or ""
+    paragraphs = doc.split("\n\n")
+    description = " ".join(line.strip() for line in paragraphs[0].splitlines()).strip()
+    params = {}
+    for line in doc.splitlines()[1:]:
+        name, sep, text = line.partition(":")
+        if sep and name.strip().isidentifier():
+            params[name.strip()] = text.strip()
+    return description, params
+
+
+def _json_type(annotation):
+    origin = typing.get_origin(annotation) or annotation
+    return _JSON_TYPES.get(origin)
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools = {}   # name -> {"func", "schema", "params", "priority"}
+
+    def tool(self, name=None, priority=0, parameters=None):
+        """
+        関数をツールとして登録するデコレータ。
+        parameters に引数名 -> JSON Schema を渡すと、その引数のスキーマを上書きする。
+        """
+        def register(func):
+            tool_name = name or func.__name__
+            description, param_docs = _parse_docstring(func)
+            properties = {}
+            required = []
+            params = {}
+            for param in inspect.signature(func).parameters.values():
+                if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                    continue
+                annotation = param.annotation
+                if annotation is param.empty and param.default is not param.empty:
+                    annotation = type(param.default)
+                json_type = _json_type(annotation)
+                prop = {}
+                if json_type is not None:
+                    prop["type"] = json_type
+                if param.name in param_docs:
+                    prop["description"] = param_docs[param.name]
+                if param.default is param.empty:
+                    required.append(param.name)
+                else:
+                    prop["default"] = param.default
+                prop.update((parameters or {}).get(param.name, {}))
+                properties[param.name] = prop
+                params[param.name] = (annotation, param.default is param.empty, prop)
+
+            schema = {"type": "function", "name": tool_name, "description": description}
+            if properties:
+                schema["parameters"] = {"type": "object", "properties": properties}
+                if required:
+                    schema["parameters"]["required"] = required
+            self._tools[tool_name] = {
+                "func": func,
+                "schema": schema,
+                "params": params,
+                "priority": priority,
+            }
+            return func
+        return register
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def schemas(self):
+        """session.update の tools に渡すリスト。"""
+        return [entry["schema"] for entry in self._tools.values()]
+
+    def functions(self):
+        """ツール名 -> 関数 (tool_dict)。"""
+        return {name: entry["func"] for name, entry in self._tools.items()}
+
+    def priorities(self):
+        return {name: entry["priority"] for name, entry in self._tools.items() if entry["priority"]}
+
+    def takes_arguments(self, name):
+        return bool(self._tools[name]["params"])
+
+    def convert(self, name, arguments):
+        """
+        function call の arguments (JSON 文字列か dict) を検証し、型を変換したキーワード引数にする。
+        合わなければ ToolArgumentError を送出する。
+        """
+        if name not in self._tools:
+            raise ToolArgumentError(f"unknown tool: {name}")
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                raise ToolArgumentError(f"{name}: arguments is not valid JSON ({e})") from None
+        arguments = arguments or {}
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError(f"{name}: arguments must be an object")
+
+        params = self._tools[name]["params"]
+        unknown = set(arguments) - set(params)
+        if unknown:
+            raise ToolArgumentError(f"{name}: unknown arguments {sorted(unknown)}")
+        kwargs = {}
+        for param, (annotation, required, prop) in params.items():
+            if param not in arguments:
+                if required:
+                    raise ToolArgumentError(f"{name}: missing argument '{param}'")
+                continue
+            kwargs[param] = self._convert_value(name, param, annotation, arguments[param])
+            self._check_range(name, param, prop, kwargs[param])
+        return kwargs
+
+    @staticmethod
+    def _check_range(name, param, prop, value):
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        low, high = prop.get("minimum"), prop.get("maximum")
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ToolArgumentError(
+                f"{name}: argument '{param}' must be between {low} and {high}, got {value!r}"
+            )
+
+    @staticmethod
+    def _convert_value(name, param, annotation, value):
+        target = typing.get_origin(annotation) or annotation
+        if target is inspect.Parameter.empty or target not in _JSON_TYPES:
+            return value
+        try:
+            if target is bool:
+                if isinstance(value, str) and value.lower() in ("true", "false"):
+                    return value.lower() == "true"
+                if isinstance(value, (bool, int)) and value in (0, 1):
+                    return bool(value)
+                raise ValueError(value)
+            if target in (float, int):
+                if isinstance(value, bool):
+                    raise ValueError(value)
+                converted = float(value)
+                if target is int:
+                    if not converted.is_integer():
+                        raise ValueError(value)
+                    return int(converted)
+                if converted != converted or converted in (float("inf"), float("-inf")):
+                    raise ValueError(value)
+                return converted
+            if target is str:
+                return str(value)
+            if not isinstance(value, target):
+                raise ValueError(value)
+            return value
+        except (TypeError, ValueError):
+            raise ToolArgumentError(
+                f"{name}: argument '{param}' must be {_JSON_TYPES[target]}, got {value!r}"
+            ) from None
@@ -0,0 +1,203 @@
+import collections
+import time
+
+from vad import SPEECH_START, SPEECH_END
+
+
+class UploadGate:
+    """
+    発話区間だけをサーバへアップロードするためのゲート。
+
+    - 待機中は直近 preroll_ms 分のチャンクをプリロールとして保持するだけで送らない
+    - 発話開始 (SPEECH_START) でサーバ側の古いバッファを clear し、プリロールを送ってから送信開始
+    - 発話中の無音が trailing_ms を超えたら、発話終了 (SPEECH_END) までは送らない
+
+    push() は送るべきチャンクのリストと、input_audio_buffer.clear が必要かを返す。
+    gated=False のときは従来どおり全チャンクを送る。
+    """
+
+    def __init__(self, preroll_ms=300, trailing_ms=500, bytes_per_ms=48, gated=True):
+        self.gated = gated
+        self.trailing_ms = trailing_ms
+        self._preroll = collections.deque()
+        self._preroll_bytes = 0
+        self._preroll_max = int(preroll_ms * bytes_per_ms)
+        self._live = False
+
+        # 統計
+        self.started_at = time.monotonic()
+        self.captured_bytes = 0
+        self.uploaded_bytes = 0
+
+    def push(self, chunk, vad_event, silence_ms):
+        self.captured_bytes += len(chunk)
+        if not self.gated:
+            return self._upload([chunk]), False
+
+        if vad_event == SPEECH_START:
+            # プリロール + 現在のチャンクを送って送信開始
+            chunks = list(self._preroll)
+            chunks.append(bytes(chunk))
+            self._preroll.clear()
+            self._preroll_bytes = 0
+            self._live = True
+            return self._upload(chunks), True
+
+        if self._live:
+            if vad_event == SPEECH_END:
+                self._live = False
+            elif silence_ms <= self.trailing_ms:
+                # 送信を止めていた間に溜めた分は発話再開のプリロールとして送る
+                chunks = list(self._preroll)
+                chunks.append(chunk)
+                self._preroll.clear()
+                self._preroll_bytes = 0
+                return self._upload(chunks), False
+            # マージンを超えた後続の無音は送らない
+            self._hold(chunk)
+            return [], False
+
+        self._hold(chunk)
+        return [], False
+
+    def _hold(self, chunk):
+        # capture のスロットは再利用されるのでコピーして保持する
+        data = bytes(chunk)
+        self._preroll.append(data)
+        self._preroll_bytes += len(data)
+        while self._preroll and self._preroll_bytes > self._preroll_max:
+            self._preroll_bytes -= len(self._preroll.popleft())
+
+    def _upload(self, chunks):
+        for c in chunks:
+            self.uploaded_bytes += len(c)
+        return chunks
+
+    def saved_bytes_per_hour(self):
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        saved = max(0, self.captured_bytes - self.uploaded_bytes)
+        return saved / elapsed * 3600
+
+
+def log_upload_stats(gate, batcher=None):
+    saved = max(0, gate.captured_bytes - gate.uploaded_bytes)
+    print(
+        f"[UPLOAD] 送信 {gate.uploaded_bytes / 1024:.0f} KB / 取得 {gate.captured_bytes / 1024:.0f} KB, "
+        f"削減 {saved / 1024:.0f} KB (約 {gate.saved_bytes_per_hour() / 1024 / 1024:.1f} MB/時)"
+    )
+    if batcher is not None and batcher.messages:
+        print(
+            f"[UPLOAD] append {batcher.messages} 回 "
+            f"(平均 {gate.uploaded_bytes / batcher.messages / 1024:.1f} KB/回)"
+        )
+
+
+class AppendBatcher:
+    """
+    input_audio_buffer.append の送信単位をキャプチャのブロックサイズから切り離す。
+    interval_ms 分の音声が溜まるか max_bytes に達した時点でまとめて1メッセージにする。
+    interval_ms を小さくすると遅延が減り、大きくするとメッセージ数 (JSON/base64/フレーミング) が減る。
+    コミット直前には flush() で残りを送ること。
+    """
+
+    def __init__(self, interval_ms=100, max_bytes=32768, bytes_per_ms=48):
+        self._target = min(int(interval_ms * bytes_per_ms), max_bytes)
+        self._max_bytes = max_bytes
+        self._buf = bytearray()
+
+        # 統計
+        self.messages = 0
+
+    def add(self, chunk):
+        """チャンクを追加し、送信すべきペイロードのリストを返す。"""
+        self._buf += chunk
+        payloads = []
+        while len(self._buf) >= self._target:
+            size = min(len(self._buf), self._max_bytes)
+            payloads.append(bytes(self._buf[:size]))
+            del self._buf[:size]
+        self.messages += len(payloads)
+        return payloads
+
+    def flush(self):
+        if not self._buf:
+            return []
+        payload = bytes(self._buf)
+        self._buf.clear()
+        self.messages += 1
+        return [payload]
+
+
+
+class UtteranceBuffer:
+    """
+    再接続に備えて、発話中の音声 (append したペイロード) を保持する。
+
+    - 新しい接続ではサーバ側の input_audio_buffer が空なので、発話の途中で切れたら
+      発話の先頭から送り直す
+    - 切断中に発話が終わったら、コミットも再接続後に送る
+      (その間に次の発話が始まったら、まとめて1回でコミットする。
+      再接続した時に発話中なら送り直すだけにし、コミットはその発話の終わりで送る)
+    - 保持するのは直近 max_ms 分まで (超えた分は古い方から捨てる)
+    """
+
+    def __init__(self, max_ms=15000, bytes_per_ms=48):
+        self._payloads = collections.deque()
+        self._bytes = 0
+        self._popped = 0          # 先頭から捨てたペイロード数 (replay の位置合わせ用)
+        self._max_bytes = int(max_ms * bytes_per_ms)
+        self.commit_pending = False
+        self.in_speech = False    # begin() から commit() まで
+
+        # 統計
+        self.replayed_bytes = 0
+        self.dropped_bytes = 0
+
+    def begin(self):
+        """発話開始。送り損ねたコミットがなければ前の発話を捨てる。"""
+        if not self.commit_pending:
+            self.reset()
+        self.in_speech = True
+
+    def reset(self):
+        self._popped += len(self._payloads)
+        self._payloads.clear()
+        self._bytes = 0
+        self.commit_pending = False
+
+    def add(self, payload):
+        self._payloads.append(payload)
+        self._bytes += len(payload)
+        while self._bytes > self._max_bytes:
+            dropped = len(self._payloads.popleft())
+            self._popped += 1
+            self._bytes -= dropped
+            self.dropped_bytes += dropped
+
+    def commit(self, sent):
+        """発話終了。コミットを送れたら破棄し、送れなかったら再接続後に回す。"""
+        self.in_speech = False
+        if sent:
+            self.reset()
+        else:
+            self.commit_pending = True
+
+    def replay(self):
+        """
+        再接続後に送り直すペイロードを順に返す。
+        送っている間に追加された分も続けて返すので、順序が入れ替わらない。
+        """
+        index = self._popped
+        while True:
+            index = max(index, self._popped)
+            if index - self._popped >= len(self._payloads):
+                return
+            payload = self._payloads[index - self._popped]
+            index += 1
+            self.replayed_bytes += len(payload)
+            yield payload
+
+    def __len__(self):
+        return self._bytes
@@ -0,0 +1,158 @@
+import numpy as np
+
+# process() が返すイベント
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+
+
+class VoiceActivityDetector:
+    """
+    発話区間検出の状態機械。
+    チャンクを frame_ms ごとのフレームに分割し、classify() の判定結果から
+    発話開始 (start_ms 連続で音声) と発話終了 (hangover_ms 連続で無音) を決める。
+    判定方法は score() (と、状態を追従させるなら classify()) を実装したサブクラスで差し替えられる。
+    """
+
+    def __init__(self, rate=24000, frame_ms=20, start_ms=60, hangover_ms=1700):
+        self.rate = rate
+        self.frame_len = int(rate * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        self.start_frames = max(1, int(start_ms / frame_ms))
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._remainder = np.zeros(0, dtype=np.int16)
+
+    def score(self, frames):
+        """frames (n, frame_len) の int16 配列を受け取り、フレームごとの bool 配列を返す (状態は変えない)。"""
+        raise NotImplementedError
+
+    def classify(self, frames):
+        """process() での判定。score() と同じだが、ノイズフロアなどの追従もここで行う。"""
+        return self.score(frames)
+
+    def is_speech(self, frame):
+        """1フレーム (PCM16 のバイト列または配列) が音声かどうか。検出器の状態は変えない。"""
+        samples = _as_int16(frame)
+        return bool(self.score(samples.reshape(1, -1))[0])
+
+    def process(self, chunk):
+        """
+        チャンクを処理して状態を更新する。
+        発話開始/終了を検出したら SPEECH_START / SPEECH_END を、それ以外は None を返す。
+        """
+        samples = _as_int16(chunk)
+        if len(self._remainder):
+            samples = np.concatenate((self._remainder, samples))
+        n_frames = len(samples) // self.frame_len
+        self._remainder = samples[n_frames * self.frame_len:].copy()
+        if n_frames == 0:
+            return None
+
+        speech = self.classify(samples[:n_frames * self.frame_len].reshape(n_frames, self.frame_len))
+
+        event = None
+        for is_voice in speech:
+            if is_voice:
+                self._speech_run += 1
+                self._silence_run = 0
+            else:
+                self._silence_run += 1
+                self._speech_run = 0
+
+            if not self.in_speech and self._speech_run >= self.start_frames:
+                self.in_speech = True
+                event = SPEECH_START
+            elif self.in_speech and self._silence_run >= self.hangover_frames:
+                self.in_speech = False
+                event = SPEECH_END
+        return event
+
+    @property
+    def silence_ms(self):
+        """直近の連続無音の長さ (ms)。"""
+        return self._silence_run * self.frame_ms
+
+    def reset(self):
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._remainder = np.zeros(0, dtype=np.int16)
+
+
+class EnergyVAD(VoiceActivityDetector):
+    """
+    フレームエネルギー (RMS) とゼロ交差率による判定。
+    直近 floor_window_ms の最小エネルギーにノイズフロアを追従させ、閾値は floor * margin とする。
+    モーターやファンの音で環境ノイズが変わっても閾値が付いていく。
+
+    - ノイズフロアは下がるときは速く (floor_down)、上がるときはゆっくり (floor_up) 追従
+    - ゼロ交差率が高くエネルギーが閾値ぎりぎりのフレームは広帯域ノイズとみなす
+    """
+
+    def __init__(self, rate=24000, frame_ms=20, start_ms=60, hangover_ms=1700,
+                 margin=3.0, min_rms=200.0, initial_floor=400.0, floor_window_ms=3000,
+                 floor_up=0.02, floor_down=0.3, noise_zcr=0.45, strong_ratio=2.0):
+        super().__init__(rate, frame_ms, start_ms, hangover_ms)
+        self.margin = margin
+        self.min_rms = min_rms
+        self.noise_floor = initial_floor
+        self.floor_up = floor_up
+        self.floor_down = floor_down
+        self.noise_zcr = noise_zcr
+        self.strong_ratio = strong_ratio
+        # 最小値追跡用の直近フレームエネルギー
+        self._history = np.full(max(1, int(floor_window_ms / frame_ms)), initial_floor, dtype=np.float32)
+        self._history_pos = 0
+
+    @property
+    def threshold(self):
+        return max(self.min_rms, self.noise_floor * self.margin)
+
+    def score(self, frames):
+        return self._score(*_features(frames))
+
+    def classify(self, frames):
+        rms, zcr = _features(frames)
+        speech = self._score(rms, zcr)
+        self._update_floor(rms)
+        return speech
+
+    def _score(self, rms, zcr):
+        threshold = self.threshold
+        speech = rms > threshold
+        noise_like = (zcr > self.noise_zcr) & (rms < threshold * self.strong_ratio)
+        return speech & ~noise_like
+
+    def _update_floor(self, rms):
+        n = len(self._history)
+        if len(rms) >= n:
+            self._history[:] = rms[-n:]
+            self._history_pos = 0
+        else:
+            idx = (self._history_pos + np.arange(len(rms))) % n
+            self._history[idx] = rms
+            self._history_pos = (self._history_pos + len(rms)) % n
+
+        level = float(self._history.min())
+        rate = self.floor_down if level < self.noise_floor else self.floor_up
+        # フレーム数ぶんの EMA をまとめて適用
+        keep = (1.0 - rate) ** len(rms)
+        self.noise_floor = self.noise_floor * keep + level * (1.0 - keep)
+
+
+def _features(frames):
+    """フレームごとの RMS とゼロ交差率。"""
+    x = frames.astype(np.float32)
+    rms = np.sqrt(np.mean(x * x, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+    return rms, zcr
+
+
+def _as_int16(data):
+    if isinstance(data, np.ndarray):
+        return data.astype(np.int16, copy=False)
+    return np.frombuffer(data, dtype=np.int16)